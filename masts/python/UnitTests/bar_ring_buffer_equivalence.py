@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+from python.common.conversions import convert_periods_to_datetime_range, get_timeframe_delta
+from python.common.historic_window import HistoricWindow, BarRingBuffer
+
+"""
+Equivalence check of the BarRingBuffer windows against the baseline historic request: bars of several timeframes are
+replayed as backtesting bar data events (the bar just opened, on M15 steps), and after every step the window of each
+buffer, trimmed to the request span, must hold the same bars as the span get_historic_bars() requests. Buffers are
+seeded, and seeded again after a gap, from that request, as tick_processor does. The synthetic bars have no weekend
+bars and a few holidays.
+
+Run from the masts directory: python -m python.UnitTests.bar_ring_buffer_equivalence
+"""
+
+MAX_BARS = {'M15': 250, 'H1': 120, 'H4': 60}
+# Buffer capacity over max_bars, as tick_processor.init_bar_buffers() (HISTORIC_BARS_MARGIN + 1).
+CAPACITY_MARGIN = 101
+START = pd.Timestamp('2024-01-01')
+END = pd.Timestamp('2024-04-15')
+HOLIDAYS = [pd.Timestamp('2024-01-01'), pd.Timestamp('2024-03-29')]
+rng = np.random.default_rng(0)
+
+
+def get_bars(timeframe):
+    times = pd.date_range(START, END, freq=get_timeframe_delta(timeframe), inclusive='left')
+    times = times[(times.weekday < 5) & ~times.normalize().isin(HOLIDAYS)]
+    close = 1.08 + np.cumsum(rng.normal(0, 0.0005, len(times)))
+    return HistoricWindow(times.values.astype('datetime64[ns]').view('int64'), close, close + 0.0005, close - 0.0005,
+                          close, rng.integers(1, 1000, len(times)).astype('float64'))
+
+
+# Bars of the span get_historic_bars() requests in backtesting at current_datetime.
+def get_request_window(bars, timeframe, current_datetime):
+    start_datetime, end_datetime = convert_periods_to_datetime_range(MAX_BARS[timeframe], timeframe, current_datetime)
+    start = np.searchsorted(bars.time, pd.Timestamp(start_datetime).value, side='left')
+    end = np.searchsorted(bars.time, pd.Timestamp(end_datetime).value, side='right')
+    return HistoricWindow(bars.time[start:end], bars.open[start:end], bars.high[start:end], bars.low[start:end],
+                          bars.close[start:end], bars.volume[start:end]), start_datetime
+
+
+bars = {timeframe: get_bars(timeframe) for timeframe in MAX_BARS}
+buffers = {timeframe: BarRingBuffer(timeframe, max_bars + CAPACITY_MARGIN) for timeframe, max_bars in MAX_BARS.items()}
+steps = seeds = 0
+for current_datetime in pd.date_range(START + pd.Timedelta(days=7), END, freq='15min', inclusive='left'):
+    current_ns = current_datetime.value
+    for timeframe, bar_buffer in buffers.items():
+        index = np.searchsorted(bars[timeframe].time, current_ns)
+        if index < len(bars[timeframe]) and bars[timeframe].time[index] == current_ns:
+            window = bars[timeframe]
+            bar_buffer.add_bar(current_datetime, window.open[index], window.high[index], window.low[index],
+                               window.close[index], window.volume[index], current_datetime)
+    # The bar data events of the weekend and the holidays do not exist.
+    if current_datetime.weekday() >= 5 or current_datetime.normalize() in HOLIDAYS:
+        continue
+    for timeframe, bar_buffer in buffers.items():
+        request_window, start_datetime = get_request_window(bars[timeframe], timeframe, current_datetime)
+        if not bar_buffer.update(current_datetime):
+            bar_buffer.seed(request_window)
+            seeds += 1
+        window = bar_buffer.get_window(start_datetime)
+        for name in ['time', 'open', 'high', 'low', 'close', 'volume']:
+            assert np.array_equal(getattr(window, name), getattr(request_window, name)), \
+                (current_datetime, timeframe, name, len(window), len(request_window))
+    steps += 1
+
+print(f'bar ring buffer equivalence: {steps} steps, {seeds} seeds OK')
@@ -0,0 +1,51 @@
+import numpy as np
+from python.backtesting.tick_store import get_crossing_hits, get_first_hit_indexes
+
+"""
+Equivalence check of the vectorized crossing kernel (tick_store.get_crossing_hits() / get_first_hit_indexes()) against
+a per-tick loop, on random float64 and float32 tick ranges, price levels and from_index offsets.
+
+Run from the masts directory: python -m python.UnitTests.crossing_kernel_equivalence
+"""
+
+CASES = 2000
+PRICE_DTYPES = ['float64', 'float32']
+rng = np.random.default_rng(0)
+
+
+# First index in [from_index, end) whose Ask (or Bid) is >= price (or <= price), -1 if there is none. The price is
+# compared in the tick price dtype.
+def get_first_hit_index_loop(bid, ask, start, end, level, from_index):
+    price, price_ask, higher_than = level
+    price = bid.dtype.type(price)
+    for index in range(max(start, from_index), end):
+        market_price = ask[index] if price_ask else bid[index]
+        if (higher_than and market_price >= price) or (not higher_than and market_price <= price):
+            return index
+    return -1
+
+
+for case in range(CASES):
+    price_dtype = PRICE_DTYPES[case % len(PRICE_DTYPES)]
+    ticks = int(rng.integers(1, 300))
+    bid = (1.08 + np.cumsum(rng.normal(0, 0.0001, ticks))).round(5).astype(price_dtype)
+    ask = (bid + rng.integers(0, 3, ticks) * 0.00001).astype(price_dtype)
+    start = int(rng.integers(0, ticks))
+    end = int(rng.integers(start, ticks + 1))
+    from_index = int(rng.integers(start, end + 1))
+    # Levels on tick prices (exact hits) and in between.
+    levels = []
+    for level in range(int(rng.integers(1, 4))):
+        price = float(rng.choice(bid)) if rng.random() < 0.5 else float(rng.uniform(bid.min(), bid.max()))
+        levels.append((price, bool(rng.random() < 0.5), bool(rng.random() < 0.5)))
+
+    hits = get_crossing_hits(bid, ask, start, end, levels)
+    for kernel_from_index in (None, from_index):
+        first_indexes = get_first_hit_indexes(hits, start, kernel_from_index)
+        for level, first_index in zip(levels, first_indexes):
+            expected = get_first_hit_index_loop(bid, ask, start, end, level,
+                                                start if kernel_from_index is None else kernel_from_index)
+            assert first_index == expected, (case, price_dtype, level, start, end, kernel_from_index, first_index,
+                                             expected)
+
+print(f'crossing kernel equivalence: {CASES} cases OK')
@@ -0,0 +1,94 @@
+import math
+import numpy as np
+import pandas as pd
+from python.common.metrics import get_metrics, get_daily_equity
+
+"""
+Equivalence check of python.common.metrics against per-trade and per-day computations: the trade sums of the former
+sweep results (list comprehensions over the closed trades), the daily equity loop of the former
+calculus.get_daily_trades_returns_on_close_date() and loops over that curve for drawdown, Sharpe and Sortino. Random
+trade ledgers of several runs are evaluated in one get_metrics() call and run by run.
+
+Run from the masts directory: python -m python.UnitTests.metrics_equivalence
+"""
+
+RUNS = 30
+INVESTMENT = 100000.0
+PERIODS_PER_YEAR = 365
+rng = np.random.default_rng(0)
+
+
+# Per-day loop of the former calculus.get_daily_trades_returns_on_close_date() (assigning with .loc).
+def get_daily_equity_loop(df_trades, investment):
+    close_dates = pd.to_datetime(df_trades['close_time']).dt.normalize()
+    equity = pd.Series(0.0, index=pd.date_range(close_dates.min(), close_dates.max()))
+    accum_return = investment
+    for day in equity.index:
+        accum_return = accum_return + df_trades[close_dates == day]['pnl'].sum()
+        equity.loc[day] = accum_return
+    return equity
+
+
+def get_metrics_loop(df_trades, investment):
+    pnls = list(df_trades['pnl'])
+    metrics = {'trades': len(pnls),
+               'winning_trades': len([pnl for pnl in pnls if pnl > 0.0]),
+               'gross_profit': sum([pnl for pnl in pnls if pnl > 0.0]),
+               'gross_loss': sum([pnl for pnl in pnls if pnl < 0.0]),
+               'net_profit': sum(pnls)}
+    metrics['final_equity'] = investment + metrics['net_profit']
+    equity = list(get_daily_equity_loop(df_trades, investment))
+    peak = investment
+    max_drawdown = 0.0
+    returns = []
+    previous_equity = investment
+    for day_equity in equity:
+        peak = max(peak, day_equity)
+        max_drawdown = max(max_drawdown, 1.0 - day_equity / peak)
+        returns.append(day_equity / previous_equity - 1.0)
+        previous_equity = day_equity
+    metrics['max_drawdown_perc'] = 100.0 * max_drawdown
+    mean_return = sum(returns) / len(returns)
+    if len(returns) > 1:
+        deviation = math.sqrt(sum((value - mean_return) ** 2 for value in returns) / (len(returns) - 1))
+        downside_deviation = math.sqrt(sum(min(value, 0.0) ** 2 for value in returns) / len(returns))
+        metrics['sharpe'] = mean_return / deviation * math.sqrt(PERIODS_PER_YEAR) if deviation > 0 else np.nan
+        metrics['sortino'] = mean_return / downside_deviation * math.sqrt(PERIODS_PER_YEAR) \
+            if downside_deviation > 0 else np.nan
+    else:
+        metrics['sharpe'] = metrics['sortino'] = np.nan
+    return metrics, equity
+
+
+def assert_close(value, expected, context):
+    assert (pd.isna(value) and pd.isna(expected)) or math.isclose(value, expected, rel_tol=1e-9, abs_tol=1e-9), \
+        (context, value, expected)
+
+
+ledgers = []
+for run_id in range(RUNS):
+    trades = int(rng.integers(1, 60))
+    close_times = pd.Timestamp('2024-01-01') + pd.to_timedelta(
+        np.sort(rng.integers(0, int(rng.integers(1, 90)) * 86400, trades)), unit='s')
+    # Some runs only win or only lose.
+    pnls = rng.normal(5.0, 100.0, trades).round(2)
+    if run_id % 10 == 1:
+        pnls = np.abs(pnls)
+    elif run_id % 10 == 2:
+        pnls = -np.abs(pnls)
+    ledgers.append(pd.DataFrame({'run_id': run_id, 'close_time': close_times, 'pnl': pnls}))
+df_trades = pd.concat(ledgers, ignore_index=True)
+
+metrics = get_metrics(df_trades, INVESTMENT, run_column='run_id', periods_per_year=PERIODS_PER_YEAR)
+for run_id, df_run in df_trades.groupby('run_id'):
+    expected, expected_equity = get_metrics_loop(df_run, INVESTMENT)
+    run_metrics = get_metrics(df_run, INVESTMENT, periods_per_year=PERIODS_PER_YEAR)
+    for name, value in expected.items():
+        assert_close(metrics.loc[run_id, name], value, (run_id, name))
+        assert_close(run_metrics[name], value, (run_id, name, 'single run'))
+    equity = get_daily_equity(df_run, INVESTMENT)
+    assert len(equity) == len(expected_equity), run_id
+    for day_equity, expected_day_equity in zip(equity, expected_equity):
+        assert_close(day_equity, expected_day_equity, (run_id, 'equity'))
+
+print(f'metrics equivalence: {RUNS} runs, {len(df_trades)} trades OK')
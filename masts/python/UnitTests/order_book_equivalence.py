@@ -0,0 +1,76 @@
+import numpy as np
+from python.backtesting.order_book import OrderBook, OrderStatus
+from python.backtesting.backtesting import backtesting
+
+"""
+Equivalence check of the OrderBook trigger queues against the full scan they replace: for random orders, random status
+and price changes and random bars, every active order of the symbol that get_orders_to_check() leaves out must not be
+affected by the bar (backtesting._order_affected_by_bar() == 0).
+
+Run from the masts directory: python -m python.UnitTests.order_book_equivalence
+"""
+
+STEPS = 20000
+SYMBOLS = ['EURUSD', 'GBPUSD']
+PENDING_TYPES = ['buylimit', 'selllimit', 'buystop', 'sellstop']
+rng = np.random.default_rng(0)
+
+
+def get_random_price():
+    return round(float(rng.uniform(1.0800, 1.0900)), 5)
+
+
+def get_random_bar():
+    open_price, close_price = get_random_price(), get_random_price()
+    return {'Open': open_price,
+            'High': round(max(open_price, close_price) + float(rng.uniform(0, 0.002)), 5),
+            'Low': round(min(open_price, close_price) - float(rng.uniform(0, 0.002)), 5),
+            'Close': close_price}
+
+
+order_book = OrderBook()
+ticket_no = 0
+checks = 0
+for step in range(STEPS):
+    action = rng.random()
+    active_orders = order_book.get_active_orders()
+    if action < 0.3 or not active_orders:
+        ticket_no += 1
+        pending = rng.random() < 0.6
+        price = get_random_price()
+        order_book.add({'ticket_no': ticket_no, 'symbol': str(rng.choice(SYMBOLS)), 'magic': int(rng.integers(1, 4)),
+                        'type': str(rng.choice(PENDING_TYPES)) if pending else str(rng.choice(['buy', 'sell'])),
+                        'status': OrderStatus.PENDING if pending else OrderStatus.OPEN, 'price': price,
+                        'SL': round(price - 0.002, 5) if rng.random() < 0.7 else 0,
+                        'TP': round(price + 0.002, 5) if rng.random() < 0.7 else 0})
+        continue
+    order_ticket_no, trade_data = active_orders[int(rng.integers(len(active_orders)))]
+    if action < 0.4:
+        # Fill: backtesting._open_order() changes the type before informing the book.
+        if trade_data['status'] == OrderStatus.PENDING:
+            trade_data['type'] = trade_data['type'][:-5] if trade_data['type'].endswith('limit') else \
+                trade_data['type'][:-4]
+            trade_data['status'] = OrderStatus.OPEN
+            order_book.set_open(order_ticket_no)
+    elif action < 0.5:
+        trade_data['price'] = get_random_price()
+        order_book.set_price(order_ticket_no)
+    elif action < 0.6:
+        trade_data['status'] = OrderStatus.CLOSED if trade_data['status'] == OrderStatus.OPEN \
+            else OrderStatus.CANCELED
+        order_book.close(order_ticket_no)
+    else:
+        symbol = str(rng.choice(SYMBOLS))
+        bar = get_random_bar()
+        orders_to_check = order_book.get_orders_to_check(symbol, bar['Low'], bar['High'])
+        checked = {order_ticket_no for order_ticket_no, trade_data in orders_to_check}
+        assert [order_ticket_no for order_ticket_no, trade_data in orders_to_check] == sorted(checked), step
+        for order_ticket_no, trade_data in order_book.get_active_orders(symbol=symbol):
+            if order_ticket_no not in checked:
+                assert backtesting._order_affected_by_bar(trade_data, bar) == 0, \
+                    (step, order_ticket_no, trade_data, bar)
+        assert checked <= {order_ticket_no for order_ticket_no, trade_data in
+                           order_book.get_active_orders(symbol=symbol)}, step
+        checks += 1
+
+print(f'order book equivalence: {checks} bars checked over {ticket_no} orders OK')
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from python.common.files import load_qdm_ticks_from_file
+from python.backtesting.tick_store import TickStore
+
+"""
+Equivalence check of the chunked tick window loading (files.load_qdm_ticks_from_file()) against a full read of the
+csv filtered afterwards, on a synthetic QDM tick export, for random windows and chunk sizes, with float64 and float32
+prices. The TickStore index_range() of the loaded window is checked against a DateTime mask.
+
+Run from the masts directory: python -m python.UnitTests.tick_window_equivalence
+"""
+
+CASES = 200
+TICKS = 5000
+rng = np.random.default_rng(0)
+
+# Ticks every few seconds over a few days, with duplicated times (several ticks in the same millisecond).
+times = pd.Timestamp('2024-02-01') + pd.to_timedelta(np.cumsum(rng.integers(0, 120000, TICKS)), unit='ms')
+bid = (1.08 + np.cumsum(rng.normal(0, 0.0001, TICKS))).round(5)
+ask = (bid + rng.integers(0, 3, TICKS) * 0.00001).round(5)
+file_name = os.path.join(tempfile.mkdtemp(prefix='tick_window_equivalence_'),
+                         'EURUSD_TICK_UTCPlus03-TICK-No Session.csv')
+pd.DataFrame({'DateTime': times.strftime('%Y%m%d %H:%M:%S.%f').str[:-3], 'Bid': bid, 'Ask': ask,
+              'Volume': 1}).to_csv(file_name, index=False, float_format='%.5f')
+
+df_full = pd.read_csv(file_name)
+full_times = pd.to_datetime(df_full['DateTime'], format='%Y%m%d %H:%M:%S.%f')
+for case in range(CASES):
+    price_dtype = 'float64' if case % 2 == 0 else 'float32'
+    start_datetime = times[0] + (times[-1] - times[0]) * float(rng.uniform(-0.1, 0.9))
+    end_datetime = start_datetime + timedelta(hours=float(rng.uniform(0, 48)))
+    chunk_rows = int(rng.integers(1, 2000))
+    columns, first_datetime, last_datetime = load_qdm_ticks_from_file(file_name, start_datetime, end_datetime,
+                                                                      price_dtype, chunk_rows)
+    mask = ((full_times >= start_datetime) & (full_times <= end_datetime)).values
+    assert np.array_equal(columns['DateTime'], full_times[mask].values.astype('datetime64[ns]').view('int64')), case
+    assert np.array_equal(columns['Bid'], df_full['Bid'][mask].to_numpy(dtype=price_dtype)), case
+    assert np.array_equal(columns['Ask'], df_full['Ask'][mask].to_numpy(dtype=price_dtype)), case
+    assert first_datetime == full_times.iloc[0], case
+    assert last_datetime >= min(pd.Timestamp(end_datetime), full_times.iloc[-1]), case
+
+    tick_store = TickStore(price_dtype)
+    tick_store.add_columns('EURUSD', columns)
+    window_times = full_times[mask]
+    if len(window_times) == 0:
+        continue
+    init_datetime = window_times.iloc[int(rng.integers(len(window_times)))] + timedelta(milliseconds=int(
+        rng.integers(-1000, 1000)))
+    range_end_datetime = init_datetime + timedelta(minutes=float(rng.uniform(0, 30)))
+    start, end = tick_store.index_range('EURUSD', init_datetime, range_end_datetime)
+    expected = np.flatnonzero(((window_times >= init_datetime) & (window_times < range_end_datetime)).values)
+    if len(expected) > 0:
+        assert (start, end) == (expected[0], expected[-1] + 1), case
+        # float32 prices give back their csv values.
+        assert tick_store.get_tick('EURUSD', start)['Bid'] == df_full['Bid'][mask].iloc[start], case
+    else:
+        assert start == end, case
+
+print(f'tick window equivalence: {CASES} windows OK')
@@ -0,0 +1,94 @@
+import os
+import ast
+import tempfile
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from python.backtesting.order_book import OrderStatus
+from python.common.trade_ledger import TradeLedgerWriter, read_trade_ledger
+
+"""
+Round-trip check of the trade ledger: random backtesting trades are written as JSON lines by TradeLedgerWriter and in
+the legacy str(dict) format of the former output.add_trade_to_file(). read_trade_ledger() must read the same trades
+from both files (and from a mix of both), and the same values the legacy parser (ast.literal_eval per line, the former
+files.extract_dictionaries_from_file()) reads from the legacy file, with the symbol and magic filters.
+
+Run from the masts directory: python -m python.UnitTests.trade_ledger_roundtrip
+"""
+
+TRADES = 500
+rng = np.random.default_rng(0)
+
+
+def get_random_trade(ticket_no):
+    open_time = datetime(2024, 2, 1) + timedelta(minutes=int(rng.integers(0, 40000)))
+    open_price = round(float(rng.uniform(1.07, 1.09)), 5)
+    return {'ticket_no': ticket_no, 'symbol': str(rng.choice(['EURUSD', 'GBPUSD'])),
+            'type': str(rng.choice(['buy', 'sell'])), 'lots': round(float(rng.uniform(0.01, 2)), 2),
+            'price': open_price, 'SL': round(open_price - 0.002, 5), 'TP': 0.0, 'magic': int(rng.integers(1, 4)),
+            'comment': f'DivergentT1 {ticket_no}', 'expiration': 0, 'open_time': open_time,
+            'close_time': open_time + timedelta(minutes=int(rng.integers(1, 2000))),
+            'commission': round(float(rng.uniform(0, 10)), 2), 'taxes': 0.0, 'swap': 0.0,
+            'pnl': round(float(rng.normal(0, 100)), 2), 'status': OrderStatus.CLOSED, 'open_price': open_price,
+            'close_price': round(open_price + float(rng.normal(0, 0.002)), 5)}
+
+
+# Line of the former output.add_trade_to_file().
+def to_legacy_line(trade_data):
+    copy_dict = trade_data.copy()
+    copy_dict['status'] = copy_dict['status'].name
+    copy_dict['open_time'] = copy_dict['open_time'].strftime('%Y-%m-%d %H:%M:%S')
+    copy_dict['close_time'] = copy_dict['close_time'].strftime('%Y-%m-%d %H:%M:%S')
+    return str(copy_dict) + '\n'
+
+
+# Former files.extract_dictionaries_from_file().
+def read_legacy_trades(filename, symbol=None):
+    dictionaries = []
+    with open(filename, 'r') as file:
+        for line in file.readlines():
+            try:
+                dictionary = ast.literal_eval(line.strip())
+                if symbol is None or symbol == dictionary['symbol']:
+                    dictionaries.append(dictionary)
+            except (SyntaxError, ValueError):
+                pass
+    return pd.DataFrame(dictionaries)
+
+
+trades = [get_random_trade(ticket_no) for ticket_no in range(1, TRADES + 1)]
+directory_path = tempfile.mkdtemp(prefix='trade_ledger_roundtrip_')
+json_filename = os.path.join(directory_path, 'trades_json.txt')
+legacy_filename = os.path.join(directory_path, 'trades_legacy.txt')
+mixed_filename = os.path.join(directory_path, 'trades_mixed.txt')
+writer = TradeLedgerWriter(json_filename, flush_rows=37)
+for trade_data in trades:
+    writer.add(trade_data)
+writer.close()
+with open(legacy_filename, 'w') as file:
+    file.writelines(to_legacy_line(trade_data) for trade_data in trades)
+# Legacy lines with numpy scalars, as written from numpy prices, and JSON lines in the same file.
+with open(mixed_filename, 'w') as file:
+    for index, trade_data in enumerate(trades):
+        if index % 2 == 0:
+            file.write(to_legacy_line(dict(trade_data, pnl=np.float64(trade_data['pnl']))))
+        else:
+            with open(json_filename, 'r') as json_file:
+                file.write(json_file.readlines()[index])
+
+for symbol, magic in [(None, None), ('EURUSD', None), ('GBPUSD', 2)]:
+    df_json = read_trade_ledger(json_filename, symbol, magic)
+    expected_count = len([trade_data for trade_data in trades if (symbol is None or trade_data['symbol'] == symbol)
+                          and (magic is None or trade_data['magic'] == magic)])
+    assert len(df_json) == expected_count, (symbol, magic)
+    pd.testing.assert_frame_equal(df_json, read_trade_ledger(legacy_filename, symbol, magic))
+    pd.testing.assert_frame_equal(df_json, read_trade_ledger(mixed_filename, symbol, magic))
+    if magic is None:
+        df_legacy = read_legacy_trades(legacy_filename, symbol)
+        for column in df_json.columns:
+            expected = df_legacy[column]
+            if column in ('open_time', 'close_time'):
+                expected = pd.to_datetime(expected)
+            assert list(df_json[column]) == list(expected), (symbol, column)
+
+print(f'trade ledger roundtrip: {TRADES} trades OK')
@@ -0,0 +1,108 @@
+import os
+import heapq
+from time import sleep, monotonic
+from queue import Queue, Full
+from threading import Thread
+from concurrent.futures import Future
+from python.common.logging_config import logger
+
+"""
+Background writer of the dwx_client command files.
+
+Commands are queued in submission order (bounded queue) and written by a single thread, so the caller only waits if
+the queue is full. The writer takes the lowest free command file index from an in-memory free list; the list is only
+refreshed with one directory listing when it runs out, instead of calling exists() on every file for every command.
+Files are written to a temporary name and moved into place with os.replace(), so the mql side never reads a partial
+command.
+"""
+
+
+class CommandFuture(Future):
+    def __init__(self, command_id, command):
+        super().__init__()
+        self.command_id = command_id
+        self.command = command
+
+
+class CommandWriter:
+    def __init__(self, path_commands_prefix, num_command_files=50, sleep_delay=0.005, max_retry_command_seconds=10,
+                 max_queued_commands=1000):
+        self.path_commands_prefix = path_commands_prefix
+        self.directory_path = os.path.dirname(path_commands_prefix)
+        self.file_name_prefix = os.path.basename(path_commands_prefix)
+        self.num_command_files = num_command_files
+        self.sleep_delay = sleep_delay
+        self.max_retry_command_seconds = max_retry_command_seconds
+        self.queue = Queue(maxsize=max_queued_commands)
+        self._free_indexes = []  # heap of command file indexes not used as far as we know.
+        self.ACTIVE = True
+        self.writer_thread = Thread(target=self.write_commands, args=())
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def get_file_path(self, index):
+        return f'{self.path_commands_prefix}{index}.txt'
+
+    # Queues a command and returns its CommandFuture, resolved with the command_id once the file is written. Blocks
+    # only while the queue is full, up to max_retry_command_seconds.
+    def submit(self, command_id, command, content):
+        future = CommandFuture(command_id, command)
+        try:
+            self.queue.put((future, f'<:{command_id}|{command}|{content}:>'), timeout=self.max_retry_command_seconds)
+        except Full:
+            logger.error(f"CommandWriter.submit() -> queue full, command {command_id}|{command} discarded")
+            future.set_exception(Exception(f"Command queue full, command {command_id}|{command} discarded"))
+        return future
+
+    def close(self):
+        self.ACTIVE = False
+        self.queue.put((None, None))
+
+    def write_commands(self):
+        while self.ACTIVE:
+            future, text = self.queue.get()
+            if future is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                index = self._get_free_index()
+                if index is None:
+                    logger.error(f"CommandWriter -> no free command file for {self.max_retry_command_seconds}s, "
+                                 f"command {future.command_id}|{future.command} discarded")
+                    future.set_exception(Exception(f"No free command file, command {future.command_id} discarded"))
+                    continue
+                self._write_file(index, text)
+                future.set_result(future.command_id)
+            except Exception as e:
+                logger.error(f"CommandWriter -> command {future.command_id}|{future.command} failed: {e}")
+                future.set_exception(e)
+
+    # Lowest free index (the mql side reads the files in index order), waiting up to max_retry_command_seconds for the
+    # mql side to consume a file. Returns None on timeout.
+    def _get_free_index(self):
+        end_time = monotonic() + self.max_retry_command_seconds
+        while True:
+            if len(self._free_indexes) == 0:
+                self._refresh_free_indexes()
+            if len(self._free_indexes) > 0:
+                return heapq.heappop(self._free_indexes)
+            if monotonic() >= end_time or not self.ACTIVE:
+                return None
+            sleep(self.sleep_delay)
+
+    def _refresh_free_indexes(self):
+        try:
+            file_names = set(os.listdir(self.directory_path))
+        except OSError:
+            file_names = set()
+        self._free_indexes = [i for i in range(self.num_command_files)
+                              if f'{self.file_name_prefix}{i}.txt' not in file_names]
+        heapq.heapify(self._free_indexes)
+
+    def _write_file(self, index, text):
+        file_path = self.get_file_path(index)
+        temp_file_path = f'{file_path}.tmp'
+        with open(temp_file_path, 'w') as f:
+            f.write(text)
+        os.replace(temp_file_path, file_path)
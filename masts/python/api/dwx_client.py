@@ -1,11 +1,16 @@
 
 import os
 import json
-from time import sleep
+import asyncio
+from time import sleep, time_ns
 from threading import Thread, Lock
 from os.path import join, exists
 from traceback import print_exc
 from datetime import datetime, timedelta
+from python.api.file_watcher import create_file_watcher
+from python.api.json_decoder import get_json_decoder
+from python.api.command_writer import CommandWriter
+from python.api.historic_requests import HistoricRequests
 
 
 """Client class
@@ -14,6 +19,9 @@ This class includes all of the functions needed for communication with MT4/MT5.
 
 """
 
+# A file stat is only trusted to detect changes once the file is older than this (see try_read_file_if_changed()).
+RACY_STAT_NS = 1000000000
+
 
 class dwx_client():
 
@@ -23,7 +31,19 @@ class dwx_client():
                  max_retry_command_seconds=10,
                  # to load orders from file on initialization.
                  load_orders_from_file=True,
-                 verbose=True
+                 verbose=True,
+                 # 'auto' (inotify if available, else polling every sleep_delay), 'inotify' or 'polling'.
+                 file_watcher_backend='auto',
+                 # with inotify, seconds after which all the files are checked even without events.
+                 file_watcher_timeout=1.0,
+                 # 'auto' (orjson or ujson if installed, else json), 'orjson', 'ujson' or 'json'.
+                 json_decoder='auto',
+                 # commands waiting to be written before send_command() blocks.
+                 max_queued_commands=1000,
+                 # seconds after which a historic data request without response fails.
+                 historic_data_timeout=30.0,
+                 # FeedRecorder recording every tick and bar received, None to not record them.
+                 feed_recorder=None
                  ):
 
         self.event_handler = event_handler
@@ -31,6 +51,9 @@ class dwx_client():
         self.max_retry_command_seconds = max_retry_command_seconds
         self.load_orders_from_file = load_orders_from_file
         self.verbose = verbose
+        self.file_watcher_timeout = file_watcher_timeout
+        self.json_loads = get_json_decoder(json_decoder)
+        self.feed_recorder = feed_recorder
         self.command_id = 0
 
         if not exists(metatrader_dir_path):
@@ -65,6 +88,7 @@ class dwx_client():
         self._last_bar_data_str = ""
         self._last_historic_data_str = ""
         self._last_historic_trades_str = ""
+        self._last_file_stats = {}  # {file_path: (st_mtime_ns, st_size, st_ino)} of the last read.
 
         self.open_orders = {}
         self.account_info = {}
@@ -72,6 +96,8 @@ class dwx_client():
         self.bar_data = {}
         self.historic_data = {}
         self.historic_trades = {}
+        self._closed_trade_tickets = set()  # tickets of the historic trades already delivered with on_trade_closed().
+        self.historic_requests = HistoricRequests(historic_data_timeout)
 
         self._last_bar_data = {}
         self._last_market_data = {}
@@ -80,34 +106,27 @@ class dwx_client():
         self.START = False
 
         self.lock = Lock()
+        self.command_writer = CommandWriter(self.path_commands_prefix, self.num_command_files, self.sleep_delay,
+                                            self.max_retry_command_seconds, max_queued_commands)
 
         self.load_messages()
 
         if self.load_orders_from_file:
             self.load_orders()
 
-        self.messages_thread = Thread(target=self.check_messages, args=())
-        self.messages_thread.daemon = True
-        self.messages_thread.start()
-
-        self.market_data_thread = Thread(
-            target=self.check_market_data, args=())
-        self.market_data_thread.daemon = True
-        self.market_data_thread.start()
-
-        self.bar_data_thread = Thread(target=self.check_bar_data, args=())
-        self.bar_data_thread.daemon = True
-        self.bar_data_thread.start()
+        # A single dispatcher thread waits for changes of the DWX files and runs their checks in this order.
+        self._file_checks = [(self.path_orders, self.check_open_orders),
+                             (self.path_messages, self.check_messages),
+                             (self.path_market_data, self.check_market_data),
+                             (self.path_bar_data, self.check_bar_data),
+                             (self.path_historic_data, self.check_historic_data),
+                             (self.path_historic_trades, self.check_historic_trades)]
+        self.file_watcher = create_file_watcher([file_path for file_path, check in self._file_checks],
+                                                self.sleep_delay, file_watcher_backend)
 
-        self.open_orders_thread = Thread(
-            target=self.check_open_orders, args=())
-        self.open_orders_thread.daemon = True
-        self.open_orders_thread.start()
-
-        self.historic_data_thread = Thread(
-            target=self.check_historic_data, args=())
-        self.historic_data_thread.daemon = True
-        self.historic_data_thread.start()
+        self.dispatcher_thread = Thread(target=self.dispatch_file_events, args=())
+        self.dispatcher_thread.daemon = True
+        self.dispatcher_thread.start()
 
         self.reset_command_ids()
 
@@ -121,6 +140,33 @@ class dwx_client():
     def start(self):
         self.START = True
 
+    """Waits for changes of the DWX files and runs the check of every changed one. Changes received before start()
+    are kept and checked once started.
+    """
+
+    def dispatch_file_events(self):
+
+        pending_file_paths = set(file_path for file_path, check in self._file_checks)
+        while self.ACTIVE:
+
+            pending_file_paths |= self.file_watcher.wait(self.file_watcher_timeout)
+            self.historic_requests.expire()
+
+            if not self.START:
+                continue
+
+            for file_path, check in self._file_checks:
+                if file_path in pending_file_paths:
+                    try:
+                        check()
+                    except:
+                        print_exc()
+            pending_file_paths = set()
+
+        self.file_watcher.close()
+        if self.feed_recorder is not None:
+            self.feed_recorder.close()
+
     """Tries to read a file. 
     """
 
@@ -138,6 +184,31 @@ class dwx_client():
             print_exc()
         return ''
 
+    """Reads a file only if its stat (mtime, size, inode) changed since the last read, otherwise returns None.
+    Returns '' if the file does not exist or cannot be read.
+
+    Timestamps have a coarse granularity (a few ms on most file systems), so a file rewritten with the same size right
+    after the last read may keep the same stat: a stat is only recorded once the file is older than RACY_STAT_NS, and
+    until then the content is read again and compared by the caller.
+    """
+
+    def try_read_file_if_changed(self, file_path):
+
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            self._last_file_stats.pop(file_path, None)
+            return ''
+        except OSError:
+            return ''
+        file_stat = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if self._last_file_stats.get(file_path) == file_stat:
+            return None
+        text = self.try_read_file(file_path)
+        if len(text) > 0 and time_ns() - stat.st_mtime_ns > RACY_STAT_NS:
+            self._last_file_stats[file_path] = file_stat
+        return text
+
     """Tries to remove a file.
     """
 
@@ -151,142 +222,129 @@ class dwx_client():
             except:
                 print_exc()
 
-    """Regularly checks the file for open orders and triggers
+    """Checks the file for open orders and triggers
     the event_handler.on_order_event() function.
     """
 
     def check_open_orders(self):
 
-        while self.ACTIVE:
+        text = self.try_read_file_if_changed(self.path_orders)
 
-            sleep(self.sleep_delay)
+        if text is None or len(text.strip()) == 0 or text == self._last_open_orders_str:
+            return
 
-            if not self.START:
-                continue
+        self._last_open_orders_str = text
+        data = self.json_loads(text)
 
-            text = self.try_read_file(self.path_orders)
+        new_event = False
+        for order_id, order in self.open_orders.items():
+            # also triggers if a pending order got filled?
+            if order_id not in data['orders'].keys():
+                new_event = True
+                if self.verbose:
+                    print('Order removed: ', order)
 
-            if len(text.strip()) == 0 or text == self._last_open_orders_str:
-                continue
-
-            self._last_open_orders_str = text
-            data = json.loads(text)
-
-            new_event = False
-            for order_id, order in self.open_orders.items():
-                # also triggers if a pending order got filled?
-                if order_id not in data['orders'].keys():
-                    new_event = True
-                    if self.verbose:
-                        print('Order removed: ', order)
-
-            for order_id, order in data['orders'].items():
-                if order_id not in self.open_orders:
-                    new_event = True
-                    if self.verbose:
-                        print('New order: ', order)
+        for order_id, order in data['orders'].items():
+            if order_id not in self.open_orders:
+                new_event = True
+                if self.verbose:
+                    print('New order: ', order)
 
-            self.account_info = data['account_info']
-            self.open_orders = data['orders']
+        self.account_info = data['account_info']
+        self.open_orders = data['orders']
 
-            if self.load_orders_from_file:
-                with open(self.path_orders_stored, 'w') as f:
-                    f.write(json.dumps(data))
+        if self.load_orders_from_file:
+            with open(self.path_orders_stored, 'w') as f:
+                f.write(json.dumps(data))
 
-            if self.event_handler is not None and new_event:
-                self.event_handler.on_order_event()
+        if self.event_handler is not None and new_event:
+            self.event_handler.on_order_event()
 
-    """Regularly checks the file for messages and triggers
+    """Checks the file for messages and triggers
     the event_handler.on_message() function.
     """
 
     def check_messages(self):
 
-        while self.ACTIVE:
+        text = self.try_read_file_if_changed(self.path_messages)
 
-            sleep(self.sleep_delay)
-
-            if not self.START:
-                continue
+        if text is None or len(text.strip()) == 0 or text == self._last_messages_str:
+            return
 
-            text = self.try_read_file(self.path_messages)
+        self._last_messages_str = text
+        data = self.json_loads(text)
 
-            if len(text.strip()) == 0 or text == self._last_messages_str:
-                continue
+        # use sorted() to make sure that we don't miss messages
+        # because of (int(millis) > self._last_messages_millis).
+        for millis, message in sorted(data.items()):
+            if int(millis) > self._last_messages_millis:
+                self._last_messages_millis = int(millis)
+                # print(message)
+                if self.event_handler is not None:
+                    self.event_handler.on_message(message)
 
-            self._last_messages_str = text
-            data = json.loads(text)
+        with open(self.path_messages_stored, 'w') as f:
+            f.write(json.dumps(data))
 
-            # use sorted() to make sure that we don't miss messages
-            # because of (int(millis) > self._last_messages_millis).
-            for millis, message in sorted(data.items()):
-                if int(millis) > self._last_messages_millis:
-                    self._last_messages_millis = int(millis)
-                    # print(message)
-                    if self.event_handler is not None:
-                        self.event_handler.on_message(message)
-
-            with open(self.path_messages_stored, 'w') as f:
-                f.write(json.dumps(data))
-
-    """Regularly checks the file for market data and triggers
+    """Checks the file for market data and triggers
     the event_handler.on_tick() function.
     """
 
     def check_market_data(self):
 
-        while self.ACTIVE:
-
-            sleep(self.sleep_delay)
+        text = self.try_read_file_if_changed(self.path_market_data)
 
-            if not self.START:
-                continue
-
-            text = self.try_read_file(self.path_market_data)
-
-            if len(text.strip()) == 0 or text == self._last_market_data_str:
-                continue
+        if text is None or len(text.strip()) == 0 or text == self._last_market_data_str:
+            return
 
-            self._last_market_data_str = text
-            data = json.loads(text)
+        self._last_market_data_str = text
+        data = self.json_loads(text)
 
-            self.market_data = data
+        self.market_data = data
 
-            if self.event_handler is not None:
-                for symbol in data.keys():
-                    if symbol not in self._last_market_data or self.market_data[symbol] != self._last_market_data[symbol]:
+        if self.event_handler is not None or self.feed_recorder is not None:
+            for symbol in data.keys():
+                if symbol not in self._last_market_data or self.market_data[symbol] != self._last_market_data[symbol]:
+                    if self.feed_recorder is not None:
+                        self.feed_recorder.record_tick(symbol,
+                                                       self.market_data[symbol]['bid'],
+                                                       self.market_data[symbol]['ask'])
+                    if self.event_handler is not None:
                         self.event_handler.on_tick(symbol,
                                                    self.market_data[symbol]['bid'],
                                                    self.market_data[symbol]['ask'])
-            self._last_market_data = data
+        self._last_market_data = data
 
-    """Regularly checks the file for bar data and triggers
+    """Checks the file for bar data and triggers
     the event_handler.on_bar_data() function.
     """
 
     def check_bar_data(self):
 
-        while self.ACTIVE:
-
-            sleep(self.sleep_delay)
-
-            if not self.START:
-                continue
-
-            text = self.try_read_file(self.path_bar_data)
-
-            if len(text.strip()) == 0 or text == self._last_bar_data_str:
-                continue
-
-            self._last_bar_data_str = text
-            data = json.loads(text)
-
-            self.bar_data = data
-
-            if self.event_handler is not None:
-                for st in data.keys():
-                    if st not in self._last_bar_data or self.bar_data[st] != self._last_bar_data[st]:
-                        symbol, time_frame = st.split('_')
+        text = self.try_read_file_if_changed(self.path_bar_data)
+
+        if text is None or len(text.strip()) == 0 or text == self._last_bar_data_str:
+            return
+
+        self._last_bar_data_str = text
+        data = self.json_loads(text)
+
+        self.bar_data = data
+
+        if self.event_handler is not None or self.feed_recorder is not None:
+            for st in data.keys():
+                if st not in self._last_bar_data or self.bar_data[st] != self._last_bar_data[st]:
+                    symbol, time_frame = st.split('_')
+                    if self.feed_recorder is not None:
+                        self.feed_recorder.record_bar(symbol,
+                                                      time_frame,
+                                                      self.bar_data[st]['time'],
+                                                      self.bar_data[st]['open'],
+                                                      self.bar_data[st]['high'],
+                                                      self.bar_data[st]['low'],
+                                                      self.bar_data[st]['close'],
+                                                      self.bar_data[st]['tick_volume'])
+                    if self.event_handler is not None:
                         self.event_handler.on_bar_data(symbol,
                                                        time_frame,
                                                        self.bar_data[st]['time'],
@@ -295,51 +353,57 @@ class dwx_client():
                                                        self.bar_data[st]['low'],
                                                        self.bar_data[st]['close'],
                                                        self.bar_data[st]['tick_volume'])
-            self._last_bar_data = data
+        self._last_bar_data = data
 
-    """Regularly checks the file for historic data and trades and triggers
+    """Checks the file for historic data and triggers
     the event_handler.on_historic_data() function.
     """
 
     def check_historic_data(self):
 
-        while self.ACTIVE:
-
-            sleep(self.sleep_delay)
+        text = self.try_read_file_if_changed(self.path_historic_data)
 
-            if not self.START:
-                continue
+        if text is not None and len(text.strip()) > 0 and text != self._last_historic_data_str:
 
-            text = self.try_read_file(self.path_historic_data)
+            self._last_historic_data_str = text
 
-            if len(text.strip()) > 0 and text != self._last_historic_data_str:
+            data = self.json_loads(text)
 
-                self._last_historic_data_str = text
+            for st in data.keys():
+                self.historic_data[st] = data[st]
+                if self.event_handler is not None:
+                    symbol, time_frame = st.split('_')
+                    self.event_handler.on_historic_data(
+                        symbol, time_frame, data[st])
+                self.historic_requests.resolve(st, data[st])
 
-                data = json.loads(text)
+            self.try_remove_file(self.path_historic_data)
 
-                for st in data.keys():
-                    self.historic_data[st] = data[st]
-                    if self.event_handler is not None:
-                        symbol, time_frame = st.split('_')
-                        self.event_handler.on_historic_data(
-                            symbol, time_frame, data[st])
+    """Checks the file for historic trades and triggers
+    the event_handler.on_historic_trades() function, after
+    event_handler.on_trade_closed() for every trade not
+    delivered before (in closing order).
+    """
 
-                self.try_remove_file(self.path_historic_data)
+    def check_historic_trades(self):
 
-            # also check historic trades in the same thread.
-            text = self.try_read_file(self.path_historic_trades)
+        text = self.try_read_file_if_changed(self.path_historic_trades)
 
-            if len(text.strip()) > 0 and text != self._last_historic_trades_str:
+        if text is not None and len(text.strip()) > 0 and text != self._last_historic_trades_str:
 
-                self._last_historic_trades_str = text
+            self._last_historic_trades_str = text
 
-                data = json.loads(text)
+            data = self.json_loads(text)
 
-                self.historic_trades = data
-                self.event_handler.on_historic_trades()
+            self.historic_trades = data
+            new_trades = sorted((trade.get('close_time', ''), int(ticket), trade) for ticket, trade in data.items()
+                                if ticket not in self._closed_trade_tickets)
+            for close_time, ticket, trade in new_trades:
+                self._closed_trade_tickets.add(str(ticket))
+                self.event_handler.on_trade_closed(ticket, trade)
+            self.event_handler.on_historic_trades()
 
-                self.try_remove_file(self.path_historic_trades)
+            self.try_remove_file(self.path_historic_trades)
 
     """Loads stored orders from file (in case of a restart). 
     """
@@ -350,7 +414,7 @@ class dwx_client():
 
         if len(text) > 0:
             self._last_open_orders_str = text
-            data = json.loads(text)
+            data = self.json_loads(text)
             self.account_info = data['account_info']
             self.open_orders = data['orders']
 
@@ -365,7 +429,7 @@ class dwx_client():
 
             self._last_messages_str = text
 
-            data = json.loads(text)
+            data = self.json_loads(text)
 
             # here we don't have to sort because we just need the latest millis value.
             for millis in data.keys():
@@ -378,7 +442,7 @@ class dwx_client():
         symbols (list[str]): List of symbols to subscribe to.
     
     Returns:
-        None
+        CommandFuture of the command (see send_command()).
 
         The data will be stored in self.market_data. 
         On receiving the data the event_handler.on_tick() 
@@ -388,7 +452,7 @@ class dwx_client():
 
     def subscribe_symbols(self, symbols):
 
-        self.send_command('SUBSCRIBE_SYMBOLS', ','.join(symbols))
+        return self.send_command('SUBSCRIBE_SYMBOLS', ','.join(symbols))
 
     """Sends a SUBSCRIBE_SYMBOLS_BAR_DATA command to subscribe to bar data.
 
@@ -398,7 +462,7 @@ class dwx_client():
         symbols = [['EURUSD', 'M1'], ['GBPUSD', 'H1']]
     
     Returns:
-        None
+        CommandFuture of the command (see send_command()).
 
         The data will be stored in self.bar_data. 
         On receiving the data the event_handler.on_bar_data() 
@@ -409,7 +473,7 @@ class dwx_client():
     def subscribe_symbols_bar_data(self, symbols=[['EURUSD', 'M1']]):
 
         data = [f'{st[0]},{st[1]}' for st in symbols]
-        self.send_command('SUBSCRIBE_SYMBOLS_BAR_DATA',
+        return self.send_command('SUBSCRIBE_SYMBOLS_BAR_DATA',
                           ','.join(str(p) for p in data))
 
     """Sends a GET_HISTORIC_DATA command to request historic data. 
@@ -419,9 +483,14 @@ class dwx_client():
         time_frame (str): Time frame for the requested data.
         start (int): Start timestamp (seconds since epoch) of the requested data.
         end (int): End timestamp of the requested data.
+        timeout (float): Seconds to wait for the data, historic_data_timeout if None.
     
     Returns:
-        None
+        HistoricDataFuture resolved with the data (same dictionary passed
+        to on_historic_data()) when it is received, or failed with
+        TimeoutError. Its latency attribute holds the seconds it took.
+        Several requests can be pending at the same time; the ones of
+        the same symbol/time frame are answered in order.
 
         The data will be stored in self.historic_data. 
         On receiving the data the event_handler.on_historic_data()
@@ -433,13 +502,25 @@ class dwx_client():
                           time_frame='D1',
                           start=(datetime.utcnow() -
                                  timedelta(days=30)).timestamp(),
-                          end=datetime.utcnow().timestamp()):
+                          end=datetime.utcnow().timestamp(),
+                          timeout=None):
 
         # start_date.strftime('%Y.%m.%d %H:%M:00')
         data = [symbol, time_frame,
                 int(start),
                 int(end)]
-        self.send_command('GET_HISTORIC_DATA', ','.join(str(p) for p in data))
+        future = self.historic_requests.register(symbol, time_frame, start, end, timeout)
+        command_future = self.send_command('GET_HISTORIC_DATA', ','.join(str(p) for p in data))
+        command_future.add_done_callback(
+            lambda f: f.exception() is not None and self.historic_requests.fail(future, f.exception()))
+        return future
+
+    """Awaitable version of get_historic_data() for asyncio code.
+    """
+
+    async def get_historic_data_async(self, symbol, time_frame, start, end, timeout=None):
+
+        return await asyncio.wrap_future(self.get_historic_data(symbol, time_frame, start, end, timeout))
 
     """Sends a GET_HISTORIC_TRADES command to request historic trades.
     
@@ -447,7 +528,7 @@ class dwx_client():
         lookback_days (int): Days to look back into the trade history. The history must also be visible in MT4. 
     
     Returns:
-        None
+        CommandFuture of the command (see send_command()).
 
         The data will be stored in self.historic_trades. 
         On receiving the data the event_handler.on_historic_trades() 
@@ -457,7 +538,7 @@ class dwx_client():
     def get_historic_trades(self,
                             lookback_days=30):
 
-        self.send_command('GET_HISTORIC_TRADES', str(lookback_days))
+        return self.send_command('GET_HISTORIC_TRADES', str(lookback_days))
 
     """Sends an OPEN_ORDER command to open an order.
 
@@ -491,7 +572,7 @@ class dwx_client():
 
         data = [symbol, order_type, lots, price, stop_loss,
                 take_profit, magic, comment, expiration]
-        self.send_command('OPEN_ORDER', ','.join(str(p) for p in data))
+        return self.send_command('OPEN_ORDER', ','.join(str(p) for p in data))
 
     """Sends a MODIFY_ORDER command to modify an order.
 
@@ -517,7 +598,7 @@ class dwx_client():
                      expiration=0):
 
         data = [ticket, lots, price, stop_loss, take_profit, expiration]
-        self.send_command('MODIFY_ORDER', ','.join(str(p) for p in data))
+        return self.send_command('MODIFY_ORDER', ','.join(str(p) for p in data))
 
     """Sends a CLOSE_ORDER command to close an order.
 
@@ -534,14 +615,14 @@ class dwx_client():
     def close_order(self, ticket, lots=0):
 
         data = [ticket, lots]
-        self.send_command('CLOSE_ORDER', ','.join(str(p) for p in data))
+        return self.send_command('CLOSE_ORDER', ','.join(str(p) for p in data))
 
     """Sends a CLOSE_ALL_ORDERS command to close all orders.
     """
 
     def close_all_orders(self):
 
-        self.send_command('CLOSE_ALL_ORDERS', '')
+        return self.send_command('CLOSE_ALL_ORDERS', '')
 
     """Sends a CLOSE_ORDERS_BY_SYMBOL command to close all orders
     with a given symbol.
@@ -553,7 +634,7 @@ class dwx_client():
 
     def close_orders_by_symbol(self, symbol):
 
-        self.send_command('CLOSE_ORDERS_BY_SYMBOL', symbol)
+        return self.send_command('CLOSE_ORDERS_BY_SYMBOL', symbol)
 
     """Sends a CLOSE_ORDERS_BY_MAGIC command to close all orders
     with a given magic number.
@@ -566,7 +647,7 @@ class dwx_client():
 
     def close_orders_by_magic(self, magic):
 
-        self.send_command('CLOSE_ORDERS_BY_MAGIC', magic)
+        return self.send_command('CLOSE_ORDERS_BY_MAGIC', magic)
 
     """Sends a RESET_COMMAND_IDS command to reset stored command IDs. 
     This should be used when restarting the python side without restarting 
@@ -578,9 +659,13 @@ class dwx_client():
 
         self.command_id = 0
 
-        self.send_command("RESET_COMMAND_IDS", "")
+        future = self.send_command("RESET_COMMAND_IDS", "")
 
-        # sleep to make sure it is read before other commands.
+        # wait for the file and sleep to make sure it is read before other commands.
+        try:
+            future.result(timeout=self.max_retry_command_seconds)
+        except Exception:
+            print_exc()
         sleep(0.5)
 
     """Sends a command to the mql server by writing it to 
@@ -588,42 +673,18 @@ class dwx_client():
 
     Multiple command files are used to allow for fast execution 
     of multiple commands in the correct chronological order. 
+
+    The file is written by the background CommandWriter: the command
+    is only queued here and the returned CommandFuture resolves with
+    the command_id once written (or with an exception if no command
+    file got free within max_retry_command_seconds).
     
     """
 
     def send_command(self, command, content):
 
         # Acquire lock so that different threads do not use the same 
-        # command_id or write at the same time.
-        self.lock.acquire()
-
-        self.command_id = (self.command_id + 1) % 100000
-
-        end_time = datetime.utcnow() + timedelta(seconds=self.max_retry_command_seconds)
-        now = datetime.utcnow()
-
-        # trying again for X seconds in case all files exist or are 
-        # currently read from mql side.
-        while now < end_time:
-            # using 10 different files to increase the execution speed 
-            # for muliple commands.
-            success = False
-            for i in range(self.num_command_files):
-                # only send commend if the file does not exists so that we 
-                # do not overwrite all commands.
-                file_path = f'{self.path_commands_prefix}{i}.txt'
-                if not exists(file_path):
-                    try:
-                        with open(file_path, 'w') as f:
-                            f.write(f'<:{self.command_id}|{command}|{content}:>')
-                        success = True
-                        break
-                    except:
-                        print_exc()
-            if success:
-                break
-            sleep(self.sleep_delay)
-            now = datetime.utcnow()
-        
-        # release lock again
-        self.lock.release()
+        # command_id and commands are queued in command_id order.
+        with self.lock:
+            self.command_id = (self.command_id + 1) % 100000
+            return self.command_writer.submit(self.command_id, command, content)
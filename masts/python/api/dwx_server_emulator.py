@@ -0,0 +1,482 @@
+import os
+import json
+import numpy as np
+from time import sleep, monotonic, perf_counter
+from threading import Thread, Lock
+from collections import deque, OrderedDict
+from datetime import datetime, timedelta
+from os.path import join
+from python.common.logging_config import logger
+from python.common.files import get_bar_data_file_name, load_qdm_ticks_from_file
+from python.common.feed_recorder import load_recorded_ticks
+from python.backtesting.bar_store import get_timeframe_delta_ns, to_epoch_ns
+
+"""
+Pure Python emulator of the mql side (DWX server) of the dwx_client bridge, to exercise and load-test the live path
+without a MetaTrader terminal.
+
+It plays a tick source (synthetic random walk, QDM ticks or ticks recorded by FeedRecorder) at ticks_per_second and
+writes the same files as the DWX server into <metatrader_dir_path>/DWX: market data of the subscribed symbols on every
+tick, the last closed bar of every subscribed symbol_tf, open orders with account info, messages, historic data and
+historic trades. Every timer_seconds it consumes the DWX_Commands_*.txt files (in index order, skipping already
+executed command ids) and executes them: subscriptions, historic requests (bars built from the ticks played, preceded
+by synthetic ones), market/pending orders with SL/TP, modifications and closes.
+
+The emulator clock is utcnow + time_delta_hours, as in tick_processor live mode. Deviations from the DWX server, on
+purpose: market data is written on every tick (not once per timer), files are written atomically unless
+atomic_writes=False. As in the DWX server, a historic data response overwrites the previous one even if it was not
+consumed yet; with queue_historic_data=True it waits until the previous one was consumed instead.
+For the load test harness, tick_log keeps (perf_counter time, symbol, bid, ask) of every tick written and
+command_times {command_id: perf_counter time} when every command was executed.
+"""
+
+DWX_TIME_FORMAT = '%Y.%m.%d %H:%M'
+DWX_ORDER_TIME_FORMAT = '%Y.%m.%d %H:%M:%S'
+ORDER_TYPES = ['buy', 'sell', 'buylimit', 'selllimit', 'buystop', 'sellstop']
+MAX_BARS_HISTORY = 10000
+SYNTHETIC_HISTORY_VOLATILITY = 0.0005
+
+
+class DwxServerEmulator:
+    def __init__(self, metatrader_dir_path, tick_source=None, ticks_per_second=10.0, timer_seconds=0.025,
+                 time_delta_hours=0, account_currency='USD', balance=100000.0, leverage=100, contract_size=100000,
+                 num_command_files=50, max_messages=50, atomic_writes=True, queue_historic_data=False, seed=0):
+        self.dwx_path = join(metatrader_dir_path, 'DWX')
+        os.makedirs(self.dwx_path, exist_ok=True)
+        self.tick_source = iter(tick_source) if tick_source is not None else synthetic_tick_source(['EURUSD'])
+        self.ticks_per_second = ticks_per_second
+        self.timer_seconds = timer_seconds
+        self.time_delta_hours = time_delta_hours
+        self.contract_size = contract_size
+        self.num_command_files = num_command_files
+        self.max_messages = max_messages
+        self.atomic_writes = atomic_writes
+        self.queue_historic_data = queue_historic_data
+        self.rng = np.random.default_rng(seed)
+        self.account_info = {'name': 'DWX server emulator', 'number': 1, 'currency': account_currency,
+                             'leverage': leverage, 'balance': balance, 'equity': balance, 'free_margin': balance}
+
+        self.subscribed_symbols = set()
+        self.subscribed_bars = {}  # {'EURUSD_M1': 'M1'}
+        self.market_data_all = {}  # {'EURUSD': {'bid': .., 'ask': .., 'tick_value': ..}} last quote of every symbol.
+        self.market_data = {}  # quotes of the subscribed symbols, as written to the market data file.
+        self.bar_data = {}  # {'EURUSD_M1': last closed bar}
+        self.current_bars = {}  # {'EURUSD_M1': {'time_ns': .., 'open': .., ...}} bar being built from the ticks.
+        self.bars_history = {}  # {'EURUSD_M1': deque of closed bars (time_ns, open, high, low, close, tick_volume)}
+        self.orders = {}  # {ticket: order}
+        self.historic_trades = {}  # {ticket: closed order}
+        self.messages = OrderedDict()  # {millis: message}
+        self.executed_command_ids = set()
+        self.pending_historic_data = deque()
+        self.next_ticket = 1
+        self._last_message_millis = 0
+        self._dirty_files = set()
+
+        self.stats = {'ticks': 0, 'late_ticks': 0, 'commands': 0, 'errors': 0}
+        self.tick_log = deque(maxlen=1000000)
+        self.command_times = {}
+        self.lock = Lock()
+        self.ACTIVE = False
+        self.thread = None
+
+    def start(self):
+        self.ACTIVE = True
+        self.thread = Thread(target=self.run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.ACTIVE = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def get_current_datetime(self):
+        return datetime.utcnow() + timedelta(hours=self.time_delta_hours)
+
+    # Ticks are scheduled at a fixed rate: if the loop falls behind, the missed ones are played at once and counted as
+    # late_ticks (the emulator itself is not keeping up).
+    def run(self):
+        tick_interval = 1.0 / self.ticks_per_second if self.ticks_per_second > 0 else None
+        next_tick = monotonic()
+        next_timer = monotonic()
+        while self.ACTIVE:
+            now = monotonic()
+            if tick_interval is not None and now >= next_tick:
+                if now - next_tick > tick_interval:
+                    self.stats['late_ticks'] += 1
+                if not self.process_tick():
+                    tick_interval = None
+                next_tick += tick_interval if tick_interval is not None else 0
+            if now >= next_timer:
+                self.check_commands()
+                self.write_historic_data()
+                next_timer = now + self.timer_seconds
+            self.write_dirty_files()
+            next_event = next_timer if tick_interval is None else min(next_tick, next_timer)
+            sleep(max(0.0, next_event - monotonic()))
+
+    ##############################################################################
+    # Ticks, bars and orders
+    ##############################################################################
+    def process_tick(self):
+        try:
+            symbol, bid, ask = next(self.tick_source)
+        except StopIteration:
+            logger.info("DwxServerEmulator -> tick source exhausted")
+            return False
+        bid = float(bid)
+        ask = float(ask)
+        with self.lock:
+            self.market_data_all[symbol] = {'bid': bid, 'ask': ask, 'tick_value': 1.0}
+            now = self.get_current_datetime()
+            if symbol in self.subscribed_symbols:
+                self.market_data[symbol] = self.market_data_all[symbol]
+                self._dirty_files.add('market_data')
+            self.update_bars(symbol, bid, now)
+            self.update_orders(symbol, bid, ask, now)
+        if symbol in self.subscribed_symbols:
+            # Written right away, tick_log times are taken just before writing the file.
+            self.tick_log.append((perf_counter(), symbol, bid, ask))
+            self.write_dirty_files()
+        self.stats['ticks'] += 1
+        return True
+
+    def update_bars(self, symbol, bid, now):
+        now_ns = to_epoch_ns(now)
+        for symbol_tf, time_frame in self.subscribed_bars.items():
+            if not symbol_tf.startswith(f'{symbol}_'):
+                continue
+            delta_ns = get_timeframe_delta_ns(time_frame)
+            bar_time_ns = now_ns - now_ns % delta_ns
+            bar = self.current_bars.get(symbol_tf)
+            if bar is not None and bar['time_ns'] < bar_time_ns:
+                closed = (bar['time_ns'], bar['open'], bar['high'], bar['low'], bar['close'], bar['tick_volume'])
+                self.bars_history.setdefault(symbol_tf, deque(maxlen=MAX_BARS_HISTORY)).append(closed)
+                self.bar_data[symbol_tf] = to_dwx_bar(closed)
+                self._dirty_files.add('bar_data')
+                bar = None
+            if bar is None:
+                self.current_bars[symbol_tf] = {'time_ns': bar_time_ns, 'open': bid, 'high': bid, 'low': bid,
+                                                'close': bid, 'tick_volume': 1}
+            else:
+                bar['high'] = max(bar['high'], bid)
+                bar['low'] = min(bar['low'], bid)
+                bar['close'] = bid
+                bar['tick_volume'] += 1
+
+    # Fills pending orders, closes on SL/TP and updates the pnl of the open orders of the symbol.
+    def update_orders(self, symbol, bid, ask, now):
+        changed = False
+        for ticket, order in list(self.orders.items()):
+            if order['symbol'] != symbol:
+                continue
+            order_type = order['type']
+            if order_type in ('buylimit', 'buystop', 'selllimit', 'sellstop'):
+                price = order['open_price']
+                if ((order_type == 'buylimit' and ask <= price) or (order_type == 'buystop' and ask >= price) or
+                        (order_type == 'selllimit' and bid >= price) or (order_type == 'sellstop' and bid <= price)):
+                    order['type'] = order_type[:-5] if order_type.endswith('limit') else order_type[:-4]
+                    order['open_time'] = now.strftime(DWX_ORDER_TIME_FORMAT)
+                    changed = True
+                continue
+            close_price = bid if order_type == 'buy' else ask
+            stop_loss = order['SL']
+            take_profit = order['TP']
+            if order_type == 'buy':
+                hit = (stop_loss > 0 and bid <= stop_loss) or (take_profit > 0 and bid >= take_profit)
+            else:
+                hit = (stop_loss > 0 and ask >= stop_loss) or (take_profit > 0 and ask <= take_profit)
+            order['pnl'] = self.get_pnl(order, close_price)
+            changed = True
+            if hit:
+                self.close_position(ticket, order['lots'], now)
+        if changed:
+            self.update_equity()
+            self._dirty_files.add('orders')
+
+    def get_pnl(self, order, close_price):
+        direction = 1.0 if order['type'] == 'buy' else -1.0
+        return round(direction * (close_price - order['open_price']) * order['lots'] * self.contract_size, 2)
+
+    def update_equity(self):
+        open_pnl = sum(order['pnl'] for order in self.orders.values() if order['type'] in ('buy', 'sell'))
+        self.account_info['equity'] = round(self.account_info['balance'] + open_pnl, 2)
+        self.account_info['free_margin'] = self.account_info['equity']
+
+    def close_position(self, ticket, lots, now):
+        order = self.orders[ticket]
+        if order['type'] in ('buy', 'sell'):
+            prices = self.market_data_all[order['symbol']]
+            close_price = prices['bid'] if order['type'] == 'buy' else prices['ask']
+        else:
+            close_price = order['open_price']
+        lots = order['lots'] if lots <= 0 or lots >= order['lots'] else lots
+        closed = dict(order, lots=lots, close_price=close_price, close_time=now.strftime(DWX_ORDER_TIME_FORMAT))
+        closed['pnl'] = self.get_pnl(closed, close_price) if order['type'] in ('buy', 'sell') else 0.0
+        self.account_info['balance'] = round(self.account_info['balance'] + closed['pnl'], 2)
+        if lots < order['lots']:
+            order['lots'] = round(order['lots'] - lots, 2)
+            closed_ticket = self.next_ticket
+            self.next_ticket += 1
+        else:
+            del self.orders[ticket]
+            closed_ticket = ticket
+        self.historic_trades[closed_ticket] = closed
+        self.update_equity()
+        self._dirty_files.add('orders')
+        self.send_info(f"Successfully closed order: {ticket}, {order['symbol']}, {lots}")
+
+    ##############################################################################
+    # Commands
+    ##############################################################################
+    def check_commands(self):
+        for i in range(self.num_command_files):
+            file_path = join(self.dwx_path, f'DWX_Commands_{i}.txt')
+            if not os.path.exists(file_path):
+                continue
+            try:
+                with open(file_path) as f:
+                    text = f.read()
+                os.remove(file_path)
+            except OSError:
+                continue
+            text = text.strip()
+            if not (text.startswith('<:') and text.endswith(':>')):
+                continue
+            parts = text[2:-2].split('|', 2)
+            if len(parts) != 3:
+                continue
+            command_id, command, content = parts
+            if command != 'RESET_COMMAND_IDS' and command_id in self.executed_command_ids:
+                continue
+            self.executed_command_ids.add(command_id)
+            self.command_times[int(command_id)] = perf_counter()
+            self.stats['commands'] += 1
+            with self.lock:
+                self.execute_command(command, content)
+
+    def execute_command(self, command, content):
+        now = self.get_current_datetime()
+        if command == 'RESET_COMMAND_IDS':
+            self.executed_command_ids = set()
+            self.send_info('Resetting stored command IDs.')
+        elif command == 'SUBSCRIBE_SYMBOLS':
+            self.subscribed_symbols = set(symbol for symbol in content.split(',') if symbol)
+            self.market_data = {symbol: prices for symbol, prices in self.market_data_all.items()
+                                if symbol in self.subscribed_symbols}
+            self.send_info(f'Successfully subscribed to: {content}')
+        elif command == 'SUBSCRIBE_SYMBOLS_BAR_DATA':
+            values = content.split(',')
+            self.subscribed_bars = {f'{values[i]}_{values[i + 1]}': values[i + 1] for i in range(0, len(values) - 1, 2)}
+            self.send_info(f'Successfully subscribed to bar data: {content}')
+        elif command == 'GET_HISTORIC_DATA':
+            symbol, time_frame, start, end = content.split(',')
+            self.pending_historic_data.append(self.get_historic_data(symbol, time_frame, int(start), int(end)))
+        elif command == 'GET_HISTORIC_TRADES':
+            lookback_days = int(content) if content else 30
+            limit = (now - timedelta(days=lookback_days)).strftime(DWX_ORDER_TIME_FORMAT)
+            trades = {str(ticket): trade for ticket, trade in self.historic_trades.items()
+                      if trade['close_time'] >= limit}
+            self.write_file('DWX_Historic_Trades.txt', trades)
+        elif command == 'OPEN_ORDER':
+            self.open_order(content.split(','), now)
+        elif command == 'MODIFY_ORDER':
+            ticket, lots, price, stop_loss, take_profit, expiration = content.split(',')
+            order = self.orders.get(int(ticket))
+            if order is None:
+                self.send_error('ORDER_MODIFY_ERROR', f'Order not found: {ticket}')
+                return
+            if order['type'] not in ('buy', 'sell') and float(price) > 0:
+                order['open_price'] = float(price)
+            order['SL'] = float(stop_loss)
+            order['TP'] = float(take_profit)
+            self._dirty_files.add('orders')
+            self.send_info(f'Successfully modified order {ticket}: {order["symbol"]}, {order["lots"]}, '
+                           f'{order["open_price"]}, {order["SL"]}, {order["TP"]}')
+        elif command == 'CLOSE_ORDER':
+            ticket, lots = content.split(',')
+            if int(ticket) not in self.orders:
+                self.send_error('CLOSE_ORDER_ERROR', f'Order not found: {ticket}')
+                return
+            self.close_position(int(ticket), float(lots), now)
+        elif command in ('CLOSE_ALL_ORDERS', 'CLOSE_ORDERS_BY_SYMBOL', 'CLOSE_ORDERS_BY_MAGIC'):
+            for ticket, order in list(self.orders.items()):
+                if ((command == 'CLOSE_ORDERS_BY_SYMBOL' and order['symbol'] != content) or
+                        (command == 'CLOSE_ORDERS_BY_MAGIC' and str(order['magic']) != content)):
+                    continue
+                self.close_position(ticket, 0, now)
+        else:
+            self.send_error('UNKNOWN_COMMAND', f'Unknown command: {command}')
+
+    def open_order(self, values, now):
+        symbol, order_type, lots, price, stop_loss, take_profit, magic, comment, expiration = values
+        lots = float(lots)
+        if order_type not in ORDER_TYPES:
+            self.send_error('OPEN_ORDER_TYPE', f'Order type could not be understood: {order_type}')
+            return
+        if lots < 0.01:
+            self.send_error('OPEN_ORDER_LOTSIZE_TOO_SMALL', f'Lot size too small: {lots}')
+            return
+        prices = self.market_data_all.get(symbol)
+        if prices is None:
+            self.send_error('OPEN_ORDER', f'No price available for symbol: {symbol}')
+            return
+        if order_type == 'buy':
+            open_price = prices['ask']
+        elif order_type == 'sell':
+            open_price = prices['bid']
+        else:
+            open_price = float(price)
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        self.orders[ticket] = {'magic': int(magic), 'symbol': symbol, 'lots': lots, 'type': order_type,
+                               'open_price': open_price, 'open_time': now.strftime(DWX_ORDER_TIME_FORMAT),
+                               'SL': float(stop_loss), 'TP': float(take_profit), 'pnl': 0.0, 'comment': comment}
+        self._dirty_files.add('orders')
+        self.send_info(f'Successfully sent order {ticket}: {symbol}, {order_type}, {lots}, {open_price}')
+
+    # Bars of the symbol_tf in [start, end] (seconds, naive broker time as sent by dwx_client): the closed bars built
+    # from the ticks played, preceded by a synthetic random walk ending at the first of them (or the current price).
+    def get_historic_data(self, symbol, time_frame, start, end):
+        symbol_tf = f'{symbol}_{time_frame}'
+        delta_ns = get_timeframe_delta_ns(time_frame)
+        start_ns = to_epoch_ns(datetime.fromtimestamp(start))
+        end_ns = to_epoch_ns(datetime.fromtimestamp(end))
+        history = list(self.bars_history.get(symbol_tf, []))
+        now_ns = to_epoch_ns(self.get_current_datetime())
+        first_ns = history[0][0] if history else now_ns - now_ns % delta_ns
+        prices = self.market_data_all.get(symbol)
+        last_close = history[0][1] if history else (prices['bid'] if prices is not None else 1.0)
+        synthetic_times = np.arange(first_ns - delta_ns, start_ns - delta_ns, -delta_ns, dtype='int64')[::-1]
+        synthetic_times = synthetic_times[((synthetic_times // 86400000000000) + 3) % 7 < 5]  # weekdays only
+        closes = last_close + np.cumsum(self.rng.normal(0, SYNTHETIC_HISTORY_VOLATILITY, len(synthetic_times))[::-1])[::-1]
+        bars = [(int(t), float(c), float(c) + 0.0002, float(c) - 0.0002, float(c), 1) for t, c in zip(synthetic_times, closes)]
+        bars.extend(history)
+        return {symbol_tf: {bar_time: bar for bar_time, bar in
+                            (to_dwx_bar_item(bar) for bar in bars if start_ns <= bar[0] <= end_ns)}}
+
+    ##############################################################################
+    # Files
+    ##############################################################################
+    def send_info(self, message):
+        self.add_message({'type': 'INFO', 'message': message})
+
+    def send_error(self, error_type, description):
+        self.stats['errors'] += 1
+        self.add_message({'type': 'ERROR', 'error_type': error_type, 'description': description})
+
+    def add_message(self, message):
+        millis = max(int(datetime.utcnow().timestamp() * 1000), self._last_message_millis + 1)
+        self._last_message_millis = millis
+        self.messages[str(millis)] = message
+        while len(self.messages) > self.max_messages:
+            self.messages.popitem(last=False)
+        self._dirty_files.add('messages')
+
+    def write_historic_data(self):
+        if not self.pending_historic_data:
+            return
+        if not self.queue_historic_data:
+            # Only the last response survives the overwrites of the DWX server.
+            self.write_file('DWX_Historic_Data.txt', self.pending_historic_data.pop())
+            self.pending_historic_data.clear()
+        elif not os.path.exists(join(self.dwx_path, 'DWX_Historic_Data.txt')):
+            self.write_file('DWX_Historic_Data.txt', self.pending_historic_data.popleft())
+
+    def write_dirty_files(self):
+        with self.lock:
+            dirty_files = self._dirty_files
+            self._dirty_files = set()
+            contents = {}
+            if 'market_data' in dirty_files:
+                contents['DWX_Market_Data.txt'] = dict(self.market_data)
+            if 'bar_data' in dirty_files:
+                contents['DWX_Bar_Data.txt'] = dict(self.bar_data)
+            if 'orders' in dirty_files:
+                contents['DWX_Orders.txt'] = {'account_info': dict(self.account_info),
+                                              'orders': {str(ticket): dict(order)
+                                                         for ticket, order in self.orders.items()}}
+            if 'messages' in dirty_files:
+                contents['DWX_Messages.txt'] = dict(self.messages)
+        for file_name, data in contents.items():
+            self.write_file(file_name, data)
+
+    def write_file(self, file_name, data):
+        file_path = join(self.dwx_path, file_name)
+        try:
+            if self.atomic_writes:
+                with open(f'{file_path}.tmp', 'w') as f:
+                    json.dump(data, f)
+                os.replace(f'{file_path}.tmp', file_path)
+            else:
+                with open(file_path, 'w') as f:
+                    json.dump(data, f)
+        except OSError as e:
+            logger.error(f"DwxServerEmulator -> error writing {file_name}: {e}")
+
+
+def to_dwx_bar_item(bar):
+    time_ns, open_price, high, low, close_price, tick_volume = bar
+    return (np.datetime64(time_ns, 'ns').astype(datetime).strftime(DWX_TIME_FORMAT),
+            {'open': open_price, 'high': high, 'low': low, 'close': close_price, 'tick_volume': tick_volume})
+
+
+def to_dwx_bar(bar):
+    bar_time, values = to_dwx_bar_item(bar)
+    return dict(values, time=bar_time)
+
+
+# Endless random walk over the symbols in turn; consecutive quotes of a symbol always differ.
+def synthetic_tick_source(symbols, start_prices=None, spread=0.0001, volatility=0.00005, digits=5, seed=0):
+    rng = np.random.default_rng(seed)
+    start_prices = start_prices or {}
+    mids = {symbol: start_prices.get(symbol, 1.1) for symbol in symbols}
+    last_bids = {symbol: None for symbol in symbols}
+    point = 10 ** -digits
+    while True:
+        for symbol in symbols:
+            mids[symbol] += rng.normal(0, volatility)
+            bid = round(mids[symbol] - spread / 2, digits)
+            if bid == last_bids[symbol]:
+                bid = round(bid + point, digits)
+            last_bids[symbol] = bid
+            yield symbol, bid, round(bid + spread, digits)
+
+
+# Ticks of a QDM tick data export between start_datetime and end_datetime, replayed in a loop if loop=True.
+def qdm_tick_source(data_path, symbol, start_datetime, end_datetime, loop=True):
+    file_name = get_bar_data_file_name(data_path, symbol, 'TICK')
+    columns, first_datetime, last_datetime = load_qdm_ticks_from_file(file_name, start_datetime, end_datetime)
+    if len(columns['Bid']) == 0:
+        logger.error(f"qdm_tick_source() -> no ticks for {symbol} between {start_datetime} and {end_datetime}")
+        raise Exception(f"No ticks for {symbol} between {start_datetime} and {end_datetime}")
+    while True:
+        for bid, ask in zip(columns['Bid'], columns['Ask']):
+            yield symbol, float(bid), float(ask)
+        if not loop:
+            break
+
+
+# Ticks recorded by FeedRecorder for the symbols between start_datetime and end_datetime, merged in time order and
+# replayed in a loop if loop=True (at ticks_per_second, not at the recorded pace).
+def recorded_tick_source(directory_path, symbols, start_datetime, end_datetime, loop=True):
+    times, symbol_indexes, bids, asks = [], [], [], []
+    for i, symbol in enumerate(symbols):
+        columns, first_datetime, last_datetime = load_recorded_ticks(directory_path, symbol, start_datetime,
+                                                                     end_datetime)
+        times.append(columns['DateTime'])
+        symbol_indexes.append(np.full(len(columns['DateTime']), i))
+        bids.append(columns['Bid'])
+        asks.append(columns['Ask'])
+    order = np.argsort(np.concatenate(times), kind='stable')
+    if len(order) == 0:
+        logger.error(f"recorded_tick_source() -> no ticks for {symbols} between {start_datetime} and {end_datetime}")
+        raise Exception(f"No ticks for {symbols} between {start_datetime} and {end_datetime}")
+    symbol_indexes = np.concatenate(symbol_indexes)[order]
+    bids = np.concatenate(bids)[order]
+    asks = np.concatenate(asks)[order]
+    while True:
+        for symbol_index, bid, ask in zip(symbol_indexes, bids, asks):
+            yield symbols[symbol_index], float(bid), float(ask)
+        if not loop:
+            break
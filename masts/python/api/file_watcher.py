@@ -0,0 +1,113 @@
+import os
+import sys
+import select
+import struct
+import ctypes
+import ctypes.util
+from time import sleep
+from python.common.logging_config import logger
+
+"""
+File watchers used by dwx_client to wait for changes of the DWX files written by the mql side.
+
+InotifyWatcher (Linux, also under Wine) blocks on an inotify descriptor of the DWX directory and wakes only when one of
+the watched files is written, moved into place or deleted. PollingWatcher keeps the former behaviour: it wakes every
+sleep_delay seconds and reports every file as possibly changed. Both return from wait() the set of watched paths to
+check; the dwx_client still compares the content, so a spurious report is harmless.
+"""
+
+# inotify(7) event masks.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len (name follows, NUL padded)
+INOTIFY_READ_SIZE = 64 * 1024
+
+FILE_WATCHER_BACKENDS = ['auto', 'inotify', 'polling']
+
+
+class PollingWatcher:
+    def __init__(self, file_paths, sleep_delay):
+        self.file_paths = set(file_paths)
+        self.sleep_delay = sleep_delay
+
+    def wait(self, timeout=None):
+        sleep(self.sleep_delay)
+        return set(self.file_paths)
+
+    def close(self):
+        pass
+
+
+# Watches the directories of the files with IN_CLOSE_WRITE (writer done) and IN_MOVED_TO (atomic replace). IN_MODIFY is
+# not used, as it fires on every partial write. After timeout seconds without events, or if the kernel queue overflows,
+# every file is reported, so a missed event only delays a change.
+class InotifyWatcher:
+    def __init__(self, file_paths):
+        self.file_paths = set(file_paths)
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_init1() failed: {os.strerror(ctypes.get_errno())}')
+        self._directories = {}  # {watch descriptor: directory path}
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        for directory_path in {os.path.dirname(os.path.abspath(file_path)) for file_path in self.file_paths}:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory_path), mask)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                os.close(self._fd)
+                raise OSError(errno, f'inotify_add_watch({directory_path}) failed: {os.strerror(errno)}')
+            self._directories[wd] = directory_path
+        self._paths = {os.path.abspath(file_path): file_path for file_path in self.file_paths}
+
+    def wait(self, timeout=None):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set(self.file_paths)
+        try:
+            buffer = os.read(self._fd, INOTIFY_READ_SIZE)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset + INOTIFY_EVENT_HEADER.size <= len(buffer):
+            wd, mask, cookie, name_length = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT_HEADER.size
+            name = buffer[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                return set(self.file_paths)
+            if wd in self._directories and name:
+                file_path = self._paths.get(os.path.join(self._directories[wd], os.fsdecode(name)))
+                if file_path is not None:
+                    changed.add(file_path)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+# 'auto' uses inotify when available (Linux) and falls back to polling otherwise.
+def create_file_watcher(file_paths, sleep_delay, backend='auto'):
+    if backend not in FILE_WATCHER_BACKENDS:
+        logger.error(f"create_file_watcher() -> unknown backend: {backend}")
+        raise Exception(f"Unknown file watcher backend: {backend}. Valid values: {FILE_WATCHER_BACKENDS}")
+    if backend in ('auto', 'inotify') and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(file_paths)
+        except (OSError, AttributeError) as e:
+            if backend == 'inotify':
+                raise
+            logger.warning(f"create_file_watcher() -> inotify not available ({e}), polling every {sleep_delay}s")
+    elif backend == 'inotify':
+        logger.error(f"create_file_watcher() -> inotify is not available on {sys.platform}")
+        raise Exception(f"inotify is not available on {sys.platform}")
+    return PollingWatcher(file_paths, sleep_delay)
@@ -0,0 +1,102 @@
+from time import monotonic
+from threading import Lock
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+from python.common.logging_config import logger
+
+"""
+Correlation of the dwx_client historic data requests with their responses.
+
+The mql side answers GET_HISTORIC_DATA with the bars keyed only by symbol_tf, in the order the commands were received,
+so the pending requests of each symbol_tf are kept in a FIFO queue and every response resolves the oldest one.
+Requests not answered within their timeout fail with TimeoutError (a response arriving after that resolves the next
+request of the symbol_tf, if any). The latency of every resolved request is kept in latencies.
+"""
+
+
+class HistoricDataFuture(Future):
+    def __init__(self, symbol, time_frame, start, end, timeout):
+        super().__init__()
+        self.symbol = symbol
+        self.time_frame = time_frame
+        self.start = start
+        self.end = end
+        self.request_time = monotonic()
+        self.deadline = self.request_time + timeout if timeout is not None else None
+        self.latency = None  # seconds from the request to the response.
+
+
+class HistoricRequests:
+    def __init__(self, timeout=30.0, max_latencies=1000):
+        self.timeout = timeout
+        self.latencies = deque(maxlen=max_latencies)  # (symbol_tf, seconds)
+        self._pending = {}  # {'EURUSD_H4': deque([HistoricDataFuture, ...])}
+        self._lock = Lock()
+
+    def register(self, symbol, time_frame, start, end, timeout=None):
+        future = HistoricDataFuture(symbol, time_frame, start, end, self.timeout if timeout is None else timeout)
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            self._pending.setdefault(f'{symbol}_{time_frame}', deque()).append(future)
+        return future
+
+    # Resolves the oldest pending request of the symbol_tf with the data. Returns the future, or None if none pending.
+    def resolve(self, symbol_tf, data):
+        with self._lock:
+            pending = self._pending.get(symbol_tf)
+            future = pending.popleft() if pending else None
+        if future is None:
+            return None
+        future.latency = monotonic() - future.request_time
+        self.latencies.append((symbol_tf, future.latency))
+        future.set_result(data)
+        return future
+
+    # Fails a pending request with the exception (e.g. its command could not be sent).
+    def fail(self, future, exception):
+        with self._lock:
+            pending = self._pending.get(f'{future.symbol}_{future.time_frame}')
+            if pending is not None and future in pending:
+                pending.remove(future)
+            else:
+                return
+        future.set_exception(exception)
+
+    # Fails with TimeoutError the requests past their deadline.
+    def expire(self):
+        now = monotonic()
+        expired = []
+        with self._lock:
+            for symbol_tf, pending in self._pending.items():
+                if any(future.deadline is not None and future.deadline <= now for future in pending):
+                    expired.extend((symbol_tf, future) for future in pending
+                                   if future.deadline is not None and future.deadline <= now)
+                    self._pending[symbol_tf] = deque(future for future in pending
+                                                     if future.deadline is None or future.deadline > now)
+        for symbol_tf, future in expired:
+            logger.error(f"HistoricRequests -> no historic data received for {symbol_tf} "
+                         f"after {now - future.request_time:.1f}s")
+            future.set_exception(TimeoutError(f"No historic data received for {symbol_tf}"))
+
+    def pending_count(self):
+        with self._lock:
+            return sum(len(pending) for pending in self._pending.values())
+
+
+# Calls callback(futures) once, from the thread completing the last of the futures (or the caller if all are done).
+def when_all_done(futures, callback):
+    futures = list(futures)
+    remaining = [len(futures)]
+    lock = Lock()
+
+    def on_done(future):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            callback(futures)
+
+    if len(futures) == 0:
+        callback(futures)
+    for future in futures:
+        future.add_done_callback(on_done)
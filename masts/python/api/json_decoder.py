@@ -0,0 +1,32 @@
+import json
+from python.common.logging_config import logger
+
+"""
+JSON decoders for the DWX files, fastest first. orjson and ujson are optional: 'auto' uses the first one installed and
+falls back to the standard json module. All of them return the same dicts/lists/floats for the DWX files.
+"""
+
+JSON_DECODERS = ['auto', 'orjson', 'ujson', 'json']
+
+
+def _load_decoder(name):
+    if name == 'orjson':
+        import orjson
+        return orjson.loads
+    if name == 'ujson':
+        import ujson
+        return ujson.loads
+    return json.loads
+
+
+def get_json_decoder(name='auto'):
+    if name not in JSON_DECODERS:
+        logger.error(f"get_json_decoder() -> unknown decoder: {name}")
+        raise Exception(f"Unknown JSON decoder: {name}. Valid values: {JSON_DECODERS}")
+    if name != 'auto':
+        return _load_decoder(name)
+    for candidate in JSON_DECODERS[1:]:
+        try:
+            return _load_decoder(candidate)
+        except ImportError:
+            continue
@@ -2,28 +2,31 @@ import os
 import json
 from time import sleep
 from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
 from os.path import join, exists
 from traceback import print_exc
 from datetime import datetime, timedelta
 from python.common.logging_config import logger
-from python.common.conversions import convert_bar_dataframe_to_dict, get_timeframe_delta, get_bar_data_clean_date
-from python.common.graphics import graph_trading_results
+from python.common.conversions import get_timeframe_delta, get_bar_data_clean_date
+from python.common.graphics import graph_trading_results, save_trading_results_chart
+import numpy as np
 import pandas as pd
-from enum import Enum
 from collections import deque
-from forex_python.converter import CurrencyRates
 from decimal import Decimal
-from python.common.files import get_bar_data_file_name, find_file
+from python.common.files import get_bar_data_file_name, find_file, load_qdm_ticks_from_file
 from python.common.reports import generate_report_metrics
 from python.common.output import generate_daily_returns_file
-import shutil
+from python.common.fx_rates import FxRates
+from python.common.qdm_cache import parse_qdm_chunk
+from python.common.historic_window import HistoricWindow
+from python.backtesting.bar_store import BarStore, to_epoch_ns, build_alignment_index, bar_data_changed_mask, \
+    build_sub_bar_ranges
+from python.common.feed_recorder import load_recorded_ticks
+from python.backtesting.order_book import OrderBook, OrderStatus
+from python.backtesting.tick_store import TickStore, get_crossing_hits, get_first_hit_indexes
 
 
-class OrderStatus(Enum):
-    PENDING = 0
-    OPEN = 1
-    CLOSED = 2
-    CANCELED = 3
+POST_PROCESSING_TASKS = ['returns', 'chart']
 
 
 """
@@ -40,7 +43,18 @@ class backtesting():
                  currency='USD',
                  leverage=33,
                  execution_commission_rate=0.005,
-                 back_test_spread_pips=1.0
+                 back_test_spread_pips=1.0,
+                 fx_rates=None,
+                 qdm_cache=None,
+                 data_catalog=None,
+                 tick_margin_hours=24,
+                 tick_price_dtype='float64',
+                 tick_chunk_rows=1000000,
+                 recorded_ticks_directory_path=None,
+                 headless=False,
+                 output_directory_path=None,
+                 post_processing_tasks=None,
+                 async_post_processing=False
                  ):
 
         logger.info("backtesting.__init__()")
@@ -53,11 +67,14 @@ class backtesting():
             self.data_path = back_test_directory_path
 
         # Init variables
-        self.dict_tickdata = {}
-        self.dict_bardata = {}
+        self.tick_store = TickStore(tick_price_dtype)  # Columnar tick data per symbol.
+        self.bar_store = BarStore()  # Columnar bar data per symbol_tf with binary-search time index.
         self.dict_bardata_index = {}
         self.dict_bardata_index_prev = {}
-        self.dict_trades = {}
+        self.timeframe_alignment = None  # {main_symbol_tf: {symbol_tf: {'timeframe': tf, 'index': array, 'changed': mask}}}
+        self.sub_bar_ranges = {}  # {main_symbol_tf: (starts, ends)} M1 rows [start, end) inside each main bar.
+        self.order_book = OrderBook()  # Active orders indexed by symbol/magic/trigger price, closed ones apart.
+        self.dict_trades = self.order_book.trades  # Every order of the run, ticket is the key.
         self.open_orders = {}
         self.historic_trades = {}
         self.last_ticket_no = 0
@@ -71,6 +88,7 @@ class backtesting():
         self.symbol_specs = None
         self.current_datetime = start_datetime
         self.output_filename = None
+        self.trade_ledger_writer = None  # TradeLedgerWriter of output_filename, flushed before the post-processing.
 
         # Store parameters
         self.start_datetime = start_datetime
@@ -78,8 +96,34 @@ class backtesting():
         self.event_handler = event_handler
         self.account_info = {'name': 'backtesting_mode', 'number': 1111, 'currency': currency, 'leverage': leverage,
                              'free_margin': balance, 'balance': balance, 'equity': balance}
+        self.initial_balance = balance  # account_info['balance'] is the final balance once the run is over.
         self.execution_commission_rate = execution_commission_rate
         self.back_test_spread_pips = back_test_spread_pips
+        # Binary cache (QdmCache) of the QDM csv files, None to parse the csv files on every run.
+        self.qdm_cache = qdm_cache
+        # DataCatalog of back_test_directory_path for the file lookups and coverage checks, None to walk the directory.
+        self.data_catalog = data_catalog
+        # Only the ticks between start_datetime and end_datetime, plus this margin on each side, are loaded.
+        self.tick_margin = timedelta(hours=tick_margin_hours)
+        self.tick_chunk_rows = tick_chunk_rows
+        # FeedRecorder directory to replay the ticks recorded from a live session instead of the QDM tick exports.
+        self.recorded_ticks_directory_path = recorded_ticks_directory_path
+        # Post-processing: headless mode saves the charts as files instead of opening interactive windows.
+        self.headless = headless
+        self.output_directory_path = output_directory_path
+        self.post_processing_tasks = ['returns', 'chart'] if post_processing_tasks is None else post_processing_tasks
+        self.async_post_processing = async_post_processing
+        self.post_processing_executor = None
+        self.post_processing_futures = []
+        for task in self.post_processing_tasks:
+            if task not in POST_PROCESSING_TASKS:
+                logger.error(f"Unknown post-processing task {task}, valid tasks are {POST_PROCESSING_TASKS}")
+                raise Exception(f"Unknown post-processing task {task}, valid tasks are {POST_PROCESSING_TASKS}")
+        if output_directory_path is not None:
+            os.makedirs(output_directory_path, exist_ok=True)
+        # Offline exchange rates, by default from the bar files of the backtesting directory.
+        self.fx_rates = fx_rates if fx_rates is not None else FxRates(data_path=back_test_directory_path, qdm_cache=qdm_cache,
+                                                                  data_catalog=data_catalog)
 
         # implements
         # self.open_orders # Current open orders, pending and opened. Order ticket is the key.
@@ -97,6 +141,11 @@ class backtesting():
     def start(self):
         self.START = True
         init = 1
+        if self.timeframe_alignment is None:
+            self.build_timeframe_alignment()
+        # Main bars are replayed up to end_datetime (excluded), ticks are only loaded up to end_datetime + margin.
+        end_indexes = {symbol_tf: self.bar_store.index_range(symbol_tf, None, self.end_datetime, end_inclusive=False)[1]
+                       for symbol_tf in self.main_symbol_tfs}
 
         # Main backtesting loop - multi symbol in parallel
         while self.START and self.ACTIVE:
@@ -106,8 +155,7 @@ class backtesting():
                 # Set indexes for each bar_data the first time
                 for symbol_tf in self.main_symbol_tfs:
                     symbol, timeframe = self.extract_symbol_and_timeframe(symbol_tf)
-                    bar_data_index = self.get_bar_data_index_for_date(self.dict_bardata[symbol_tf], self.start_datetime,
-                                                                      timeframe)
+                    bar_data_index = self.get_bar_data_index_for_date(symbol_tf, self.start_datetime, timeframe)
                     self.dict_bardata_index[symbol_tf] = bar_data_index
                     self.dict_bardata_index_prev[symbol_tf] = bar_data_index
                     if bar_data_index is not None and init == 1:
@@ -118,11 +166,11 @@ class backtesting():
             else:  # Increment indexes
                 for symbol_tf in self.main_symbol_tfs:
                     symbol_index = self.dict_bardata_index[symbol_tf]
-                    if symbol_index is not None and self.dict_bardata[symbol_tf].shape[0] > (symbol_index + 1):
+                    if symbol_index is not None and end_indexes[symbol_tf] > (symbol_index + 1):
                         self.dict_bardata_index_prev[symbol_tf] = symbol_index
                         symbol_index += 1
                         self.dict_bardata_index[symbol_tf] = symbol_index
-                        self.current_datetime = self.dict_bardata[symbol_tf]['DateTime'][symbol_index]
+                        self.current_datetime = self.bar_store.get_datetime(symbol_tf, symbol_index)
                         process = True
                         self.process_symbol_tf_main_bar(symbol_tf)
                     elif symbol_index is not None:
@@ -132,26 +180,68 @@ class backtesting():
                         process = False
             self.START = process
 
-        initial_balance = self.account_info['balance']
+        self.run_post_processing()
+        self.ACTIVE = False
+
+    """Runs the post_processing_tasks of every main symbol_tf once the backtest has finished.
+    
+    'returns' writes the daily returns file and 'chart' the trading results chart: an interactive finplot window, or a
+    PNG file in headless mode. With async_post_processing the tasks (but interactive charts, that need the calling
+    thread) run in a background thread; wait_post_processing() blocks until they are done.
+    """
+
+    def run_post_processing(self):
+        if self.trade_ledger_writer is not None:
+            self.trade_ledger_writer.flush()
         for symbol_tf in self.main_symbol_tfs:
             symbol, timeframe = self.extract_symbol_and_timeframe(symbol_tf)
-            bar_data_file_name = get_bar_data_file_name(self.data_path, symbol, timeframe)
-            returns_file_name = generate_daily_returns_file(self.output_filename, symbol, initial_balance)
-            # Copy files to Jupyter Notebooks folder.
-            dest_file_name = f'C:/Users/Usuario/LatamQuants/jupyter_notes/Masts/smart_trader_output/{os.path.basename(returns_file_name)}'
-            shutil.copy(returns_file_name, dest_file_name)
-            #generate_report_metrics(symbol, returns_file_name)
-            graph_trading_results(bar_data_file_name, symbol, timeframe, self.start_datetime, self.end_datetime,
-                                  self.output_filename)
-
-        self.ACTIVE = False
+            if 'returns' in self.post_processing_tasks:
+                self.schedule_post_processing_task(generate_daily_returns_file, self.output_filename, symbol,
+                                                   self.initial_balance, self.output_directory_path)
+            if 'chart' in self.post_processing_tasks:
+                bar_data_file_name = get_bar_data_file_name(self.data_path, symbol, timeframe, self.data_catalog)
+                if self.headless:
+                    output_directory_path = self.output_directory_path
+                    if output_directory_path is None:
+                        output_directory_path = os.path.dirname(self.output_filename)
+                    chart_file_name = join(output_directory_path,
+                                           f'{os.path.basename(self.output_filename)[:-4]}_{symbol}_{timeframe}.png')
+                    self.schedule_post_processing_task(save_trading_results_chart, bar_data_file_name, symbol,
+                                                       timeframe, self.start_datetime, self.end_datetime,
+                                                       self.output_filename, chart_file_name, self.qdm_cache)
+                else:
+                    graph_trading_results(bar_data_file_name, symbol, timeframe, self.start_datetime,
+                                          self.end_datetime, self.output_filename)
+
+    def schedule_post_processing_task(self, task, *args):
+        if self.async_post_processing:
+            if self.post_processing_executor is None:
+                self.post_processing_executor = ThreadPoolExecutor(max_workers=1)
+            self.post_processing_futures.append(
+                self.post_processing_executor.submit(self.run_post_processing_task, task, *args))
+        else:
+            self.run_post_processing_task(task, *args)
+
+    def run_post_processing_task(self, task, *args):
+        try:
+            return task(*args)
+        except Exception as e:
+            # A failed report must not lose the backtest results.
+            logger.error(f"Post-processing task {task.__name__} failed: {e}")
+            return None
+
+    # Waits for the asynchronous post-processing tasks and returns their results (output file names).
+    def wait_post_processing(self, timeout=None):
+        results = [future.result(timeout=timeout) for future in self.post_processing_futures]
+        self.post_processing_futures = []
+        return results
 
     def process_symbol_tf_main_bar(self, symbol_tf):
         symbol, timeframe = self.extract_symbol_and_timeframe(symbol_tf)
-        bar_data = self.dict_bardata[symbol_tf].iloc[[self.dict_bardata_index[symbol_tf]]]
+        open_price = self.bar_store.column(symbol_tf, 'Open')[self.dict_bardata_index[symbol_tf]]
         spread_points = self.back_test_spread_pips * self.symbol_specs[symbol]['pip_value']
-        self.market_data[symbol] = {'bid': bar_data['Open'].iloc[0],
-                                    'ask': bar_data['Open'].iloc[0] + spread_points,
+        self.market_data[symbol] = {'bid': open_price,
+                                    'ask': open_price + spread_points,
                                     'tick_value': 1}
         # Update orders in the broker
         self.manage_orders(symbol, symbol_tf)
@@ -169,40 +259,52 @@ class backtesting():
     def update_bar_datas(self, param_symbol, main_symbol_tf):
         # Get current main data bar info
         _, main_timeframe = self.extract_symbol_and_timeframe(main_symbol_tf)
-        bar_data = self.dict_bardata[main_symbol_tf]
-        bar_data_index = self.dict_bardata_index[main_symbol_tf]
+        bar_data = self.bar_store.get_bar(main_symbol_tf, self.dict_bardata_index[main_symbol_tf])
         # Trigger on_bar_data event
-        self.event_handler.on_bar_data(param_symbol, main_timeframe, bar_data['DateTime'][bar_data_index],
-                                       bar_data['Open'][bar_data_index],
-                                       bar_data['High'][bar_data_index], bar_data['Low'][bar_data_index],
-                                       bar_data['Close'][bar_data_index],
-                                       bar_data['Volume'][bar_data_index])
-        # Process all data bars with same symbol but higher timeframe
-        for symbol_tf in self.dict_bardata.keys():
-            symbol, timeframe = self.extract_symbol_and_timeframe(symbol_tf)
-            if symbol_tf != main_symbol_tf and timeframe < main_timeframe:  # Only set index for higher timeframes.
-                if symbol == param_symbol:
-                    prev_datetime = \
-                        self.dict_bardata[main_symbol_tf].iloc[self.dict_bardata_index_prev[main_symbol_tf]][
-                            'DateTime']
-                    curr_datetime = self.dict_bardata[main_symbol_tf].iloc[self.dict_bardata_index[main_symbol_tf]][
-                        'DateTime']
-
-                    if self.has_bar_data_changed(prev_datetime, curr_datetime, timeframe):
-                        bar_data_index = self.get_bar_data_index_for_date(self.dict_bardata[symbol_tf], curr_datetime,
-                                                                          timeframe)
-                        if bar_data_index is not None and bar_data_index > self.dict_bardata_index[symbol_tf]:
-                            self.dict_bardata_index[symbol_tf] = bar_data_index
-                            bar_data = self.dict_bardata[symbol_tf].iloc[self.dict_bardata_index[symbol_tf]]
-                            self.bar_data[symbol_tf] = {'time': bar_data['DateTime'].strftime('%Y-%m-%d %H:%M:%S'),
-                                                        'open': bar_data['Open'], 'high': bar_data['High'],
-                                                        'low': bar_data['Low'], 'close': bar_data['Close'],
-                                                        'tick_volume': bar_data['Volume']}
-                            if symbol_tf in self.bar_data_subscription_requests:
-                                self.event_handler.on_bar_data(symbol, timeframe, bar_data['DateTime'],
-                                                               bar_data['Open'],
-                                                               bar_data['High'], bar_data['Low'], bar_data['Close'],
-                                                               bar_data['Volume'])
+        self.event_handler.on_bar_data(param_symbol, main_timeframe, bar_data['DateTime'], bar_data['Open'],
+                                       bar_data['High'], bar_data['Low'], bar_data['Close'], bar_data['Volume'])
+        # Process all data bars with same symbol but higher timeframe (precomputed in build_timeframe_alignment()).
+        main_index = self.dict_bardata_index[main_symbol_tf]
+        if main_index == self.dict_bardata_index_prev[main_symbol_tf]:
+            return
+        for symbol_tf, alignment in self.timeframe_alignment[main_symbol_tf].items():
+            if alignment['changed'][main_index]:
+                bar_data_index = int(alignment['index'][main_index])
+                if bar_data_index > self.dict_bardata_index[symbol_tf]:  # -1 means there is no bar for the date.
+                    self.dict_bardata_index[symbol_tf] = bar_data_index
+                    bar_data = self.bar_store.get_bar(symbol_tf, bar_data_index)
+                    self.bar_data[symbol_tf] = {'time': bar_data['DateTime'].strftime('%Y-%m-%d %H:%M:%S'),
+                                                'open': bar_data['Open'], 'high': bar_data['High'],
+                                                'low': bar_data['Low'], 'close': bar_data['Close'],
+                                                'tick_volume': bar_data['Volume']}
+                    if symbol_tf in self.bar_data_subscription_requests:
+                        self.event_handler.on_bar_data(param_symbol, alignment['timeframe'], bar_data['DateTime'],
+                                                       bar_data['Open'],
+                                                       bar_data['High'], bar_data['Low'], bar_data['Close'],
+                                                       bar_data['Volume'])
+
+    def build_timeframe_alignment(self):
+        # Maps once each main bar index to the index of the enclosing bar of every other timeframe of the same
+        # symbol, together with the mask of main bars where that timeframe starts a new bar.
+        self.timeframe_alignment = {}
+        for main_symbol_tf in self.main_symbol_tfs:
+            main_symbol, main_timeframe = self.extract_symbol_and_timeframe(main_symbol_tf)
+            main_times = self.bar_store.times(main_symbol_tf)
+            alignment = {}
+            for symbol_tf in self.bar_store.keys():
+                symbol, timeframe = self.extract_symbol_and_timeframe(symbol_tf)
+                # Only set index for higher timeframes.
+                if symbol == main_symbol and symbol_tf != main_symbol_tf and timeframe < main_timeframe:
+                    alignment[symbol_tf] = {'timeframe': timeframe,
+                                            'index': build_alignment_index(main_times,
+                                                                           self.bar_store.times(symbol_tf), timeframe),
+                                            'changed': bar_data_changed_mask(main_times, timeframe)}
+            self.timeframe_alignment[main_symbol_tf] = alignment
+            # M1 bars used for intrabar order drill-down.
+            symbol_tf_m1 = f'{main_symbol}_M1'
+            if symbol_tf_m1 in self.bar_store and symbol_tf_m1 != main_symbol_tf:
+                self.sub_bar_ranges[main_symbol_tf] = build_sub_bar_ranges(main_times, main_timeframe,
+                                                                           self.bar_store.times(symbol_tf_m1))
 
     def has_bar_data_changed(self, previous_datetime, current_datetime, timeframe):
         if previous_datetime is None or current_datetime is None:
@@ -248,11 +350,9 @@ class backtesting():
         if not filtered_rows.empty:
             return filtered_rows.index[0]
 
-    def get_bar_data_index_for_date(self, dict, dt, timeframe):
+    def get_bar_data_index_for_date(self, symbol_tf, dt, timeframe):
         clean_date = get_bar_data_clean_date(dt, timeframe)
-        filtered_rows = dict[dict["DateTime"] == clean_date]
-        if not filtered_rows.empty:
-            return filtered_rows.index[0]
+        return self.bar_store.index_for_datetime(symbol_tf, clean_date)
 
     """Sends a SUBSCRIBE_SYMBOLS command to subscribe to market (tick) data.
 
@@ -276,26 +376,58 @@ class backtesting():
             self.load_tickdata_file(symbol)
 
     def load_tickdata_file(self, symbol):
+        if self.recorded_ticks_directory_path is not None:
+            self.load_recorded_tickdata(symbol)
+            return
         search_for = f"{symbol}_TICK_UTCPlus03-TICK"
-        file_name = find_file(search_for, self.data_path)
+        file_name = self.data_catalog.find_file(search_for) if self.data_catalog is not None else \
+            find_file(search_for, self.data_path)
         if file_name == None:
             logger.error(f"Tickdata file for {search_for} not found!")
             raise Exception(f"Tickdata file for {search_for} not found!")
             exit()
         else:
-            df = pd.read_csv(file_name)
-            df['DateTime'] = pd.to_datetime(df['DateTime'], format='%Y%m%d %H:%M:%S.%f')
-            if self.check_data_dates(df, self.start_datetime, self.end_datetime):
-                self.dict_tickdata.setdefault(symbol, df)
-                self.dict_tickdata.setdefault(symbol, 0)
+            self.check_catalog_data_range(file_name)
+            window_start = self.start_datetime - self.tick_margin
+            window_end = self.end_datetime + self.tick_margin
+            if self.qdm_cache is not None:
+                columns = self.qdm_cache.load_columns(file_name)
+                first_datetime = pd.Timestamp(columns['DateTime'][0])
+                last_datetime = pd.Timestamp(columns['DateTime'][-1])
+                # Slices of the memory-mapped columns, only the window pages are ever read.
+                start = int(np.searchsorted(columns['DateTime'], to_epoch_ns(window_start), side='left'))
+                end = int(np.searchsorted(columns['DateTime'], to_epoch_ns(window_end), side='right'))
+                columns = {column: columns[column][start:end] for column in ['DateTime', 'Bid', 'Ask']}
+            else:
+                columns, first_datetime, last_datetime = load_qdm_ticks_from_file(
+                    file_name, window_start, window_end, self.tick_store.price_dtype, self.tick_chunk_rows)
+            if self.check_data_range(first_datetime, last_datetime, self.start_datetime, self.end_datetime):
+                self.tick_store.add_columns(symbol, columns)
+                logger.info(f"{len(columns['DateTime'])} ticks of {symbol} loaded from {file_name}")
+
+    def load_recorded_tickdata(self, symbol):
+        columns, first_datetime, last_datetime = load_recorded_ticks(
+            self.recorded_ticks_directory_path, symbol, self.start_datetime - self.tick_margin,
+            self.end_datetime + self.tick_margin, self.tick_store.price_dtype)
+        if self.check_data_range(first_datetime, last_datetime, self.start_datetime, self.end_datetime):
+            self.tick_store.add_columns(symbol, columns)
+            logger.info(f"{len(columns['DateTime'])} recorded ticks of {symbol} loaded from "
+                        f"{self.recorded_ticks_directory_path}")
 
     def set_main_symbol_tfs(self, symbol_tfs):
         self.main_symbol_tfs = symbol_tfs
 
     def check_data_dates(self, df, start_time, end_time):
+        return self.check_data_range(df.iloc[0]['DateTime'], df.iloc[-1]['DateTime'], start_time, end_time)
+
+    # Coverage of the file checked from the catalog before loading it (no file reads once the file is catalogued).
+    def check_catalog_data_range(self, file_name):
+        if self.data_catalog is not None:
+            first_datetime, last_datetime = self.data_catalog.get_datetime_range(file_name)
+            self.check_data_range(first_datetime, last_datetime, self.start_datetime, self.end_datetime)
+
+    def check_data_range(self, first_row_datetime, last_row_datetime, start_time, end_time):
         result = False
-        first_row_datetime = df.iloc[0]['DateTime']
-        last_row_datetime = df.iloc[-1]['DateTime']
         if start_time < first_row_datetime:
             logger.error(f"start_time ({start_time}) is lower than first row datetime ({first_row_datetime})")
             raise Exception(f"start_time ({start_time}) is lower than first row datetime ({first_row_datetime})")
@@ -314,25 +446,32 @@ class backtesting():
             self.load_bardata_file(st)
 
     def load_bardata_file(self, symbolTime):
-        file_name = get_bar_data_file_name(self.data_path, symbolTime[0], symbolTime[1])
+        file_name = get_bar_data_file_name(self.data_path, symbolTime[0], symbolTime[1], self.data_catalog)
         if file_name == None:
-            logger.error(f"Bardata file for {search_for} not found!")
-            raise Exception(f"Bardata file for {search_for} not found!")
+            logger.error(f"Bardata file for {symbolTime[0]} {symbolTime[1]} not found!")
+            raise Exception(f"Bardata file for {symbolTime[0]} {symbolTime[1]} not found!")
             exit()
         else:
-            df = pd.read_csv(file_name)
-            df['DateTime'] = pd.to_datetime(df['Date'].astype(str) + ' ' + df['Time'])
-            df = df.drop(['Date', 'Time'], axis=1)
-            if self.check_data_dates(df, self.start_datetime, self.end_datetime):
-                new_key = f'{symbolTime[0]}_{symbolTime[1]}'
-                self.dict_bardata.setdefault(new_key, df)
-                self.dict_bardata_index.setdefault(new_key, 0)
+            self.check_catalog_data_range(file_name)
+            new_key = f'{symbolTime[0]}_{symbolTime[1]}'
+            if self.qdm_cache is not None:
+                columns = self.qdm_cache.load_columns(file_name)
+                if self.check_data_range(pd.Timestamp(columns['DateTime'][0]), pd.Timestamp(columns['DateTime'][-1]),
+                                         self.start_datetime, self.end_datetime):
+                    self.bar_store.add_columns(new_key, columns)
+                    self.dict_bardata_index.setdefault(new_key, 0)
+            else:
+                df = parse_qdm_chunk(pd.read_csv(file_name))
+                if self.check_data_dates(df, self.start_datetime, self.end_datetime):
+                    self.bar_store.add_dataframe(new_key, df)
+                    self.dict_bardata_index.setdefault(new_key, 0)
 
     def load_historic_bars(self, required_historic_bars):
         self.bar_data_historic_requests = required_historic_bars.keys()
         for symbol_tf in self.bar_data_historic_requests:
-            if symbol_tf not in self.dict_bardata.keys():
+            if symbol_tf not in self.bar_store:
                 self.load_bardata_file(symbol_tf.split('_'))
+        self.build_timeframe_alignment()
 
     """Sends a GET_HISTORIC_DATA command to request historic data. 
     
@@ -359,10 +498,10 @@ class backtesting():
         end = datetime.fromtimestamp(param_end)
         # logger.debug(f"-> get_historic_data({symbol}, {time_frame}, {start}, {end})")
         symbol_tf = f"{symbol}_{time_frame}"
-        if symbol_tf in self.dict_bardata:
-            if self.check_data_dates(self.dict_bardata[symbol_tf], start, end):
-                # logger.info(self.dict_bardata[symbol_tf])
-                result = convert_bar_dataframe_to_dict(self.dict_bardata[symbol_tf], start, end)
+        if symbol_tf in self.bar_store:
+            if self.check_data_range(self.bar_store.first_datetime(symbol_tf), self.bar_store.last_datetime(symbol_tf),
+                                     start, end):
+                result = self.get_historic_window(symbol_tf, start, end)
                 # logger.info(f"get_historic_data() -> {result}")
                 self.event_handler.on_historic_data(symbol, time_frame, result)
         else:
@@ -370,6 +509,14 @@ class backtesting():
             raise Exception(f"No historic data for {symbol} {time_frame}!")
             exit()
 
+    # Read-only views over the bars of symbol_tf with start <= DateTime <= end (no copy).
+    # HistoricWindow.to_dict() gives the dictionary format of the live historic data.
+    def get_historic_window(self, symbol_tf, start=None, end=None):
+        first, last = self.bar_store.index_range(symbol_tf, start, end)
+        columns = [self.bar_store.column(symbol_tf, column)[first:last] for column in
+                   ['DateTime', 'Open', 'High', 'Low', 'Close', 'Volume']]
+        return HistoricWindow(*columns)
+
     """Sends a GET_HISTORIC_TRADES command to request historic trades.
     
     Kwargs:
@@ -384,10 +531,11 @@ class backtesting():
     """
 
     def get_historic_trades(self, lookback_days=30):
-        self.historic_trades = [(ticket_no, trade_data) for ticket_no, trade_data in
-                                self.dict_trades.items() if
-                                (trade_data.get('status') == OrderStatus.CLOSED or trade_data.get(
-                                    'status') == OrderStatus.CANCELED)]
+        # A new list, in ticket order, so the consumers never change the closed ledger of the order book.
+        limit = self.current_datetime - timedelta(days=lookback_days)
+        closed_trades = [(ticket_no, trade_data) for ticket_no, trade_data in self.order_book.closed_trades if
+                         trade_data['close_time'] >= limit]
+        self.historic_trades = sorted(closed_trades, key=lambda item: item[0])
         self.event_handler.on_historic_trades()
 
     """Sends an OPEN_ORDER command to open an order.
@@ -443,7 +591,7 @@ class backtesting():
         if self.validate_order(new_order_data):
             self.last_ticket_no = self.last_ticket_no + 1
             new_order_data['ticket_no'] = self.last_ticket_no
-            self.dict_trades.setdefault(self.last_ticket_no, new_order_data)
+            self.order_book.add(new_order_data)
             self.execute_order(self.last_ticket_no, new_order_data)
             result = True
 
@@ -464,7 +612,7 @@ class backtesting():
         result = False
         main_symbol_tf = self._get_main_tf(trade_data['symbol'])
         if symbol_tf is None:
-            bar_data = self.dict_bardata[main_symbol_tf].iloc[self.dict_bardata_index[main_symbol_tf]]
+            bar_data = self.bar_store.get_bar(main_symbol_tf, self.dict_bardata_index[main_symbol_tf])
             self._execute_order(ticket_no, trade_data, main_symbol_tf, bar_data)
         else:
             affects = self._order_affected_by_bar(trade_data, bar_data)
@@ -477,19 +625,21 @@ class backtesting():
                 result = True
             elif 1 < affects:
                 if main_symbol_tf == symbol_tf:
-                    # Loops in M1 bars
+                    # Loops in M1 bars (rows precomputed in build_timeframe_alignment()).
                     symbol_tf_m1 = f'{trade_data["symbol"]}_M1'
-                    init_datetime = bar_data['DateTime']
-                    end_datetime = init_datetime + timedelta(minutes=self._get_minutes_from_symbol_tf(symbol_tf))
-
-                    bars_1m = self.dict_bardata[symbol_tf_m1][
-                        (self.dict_bardata[symbol_tf_m1]['DateTime'] >= init_datetime) & (
-                                self.dict_bardata[symbol_tf_m1]['DateTime'] < end_datetime)]
+                    starts, ends = self.sub_bar_ranges[main_symbol_tf]
+                    main_index = self.dict_bardata_index[main_symbol_tf]
+                    bar_1m_index = int(starts[main_index])
+                    bar_1m_end = int(ends[main_index])
+                    times_1m = self.bar_store.times(symbol_tf_m1)
+                    opens_1m = self.bar_store.column(symbol_tf_m1, 'Open')
+                    highs_1m = self.bar_store.column(symbol_tf_m1, 'High')
+                    lows_1m = self.bar_store.column(symbol_tf_m1, 'Low')
 
                     pending_affects = affects
-                    bar_1m_index = 0
-                    while bar_1m_index < len(bars_1m) and not result:
-                        bar_1m = bars_1m.iloc[bar_1m_index]
+                    while bar_1m_index < bar_1m_end and not result:
+                        bar_1m = {'DateTime': pd.Timestamp(times_1m[bar_1m_index]), 'Open': opens_1m[bar_1m_index],
+                                  'High': highs_1m[bar_1m_index], 'Low': lows_1m[bar_1m_index]}
                         result1 = self._execute_order(ticket_no, trade_data, symbol_tf_m1, bar_1m)
                         if result1:
                             pending_affects -= 1
@@ -526,7 +676,8 @@ class backtesting():
             result = 1
         return result
 
-    def _order_affected_by_bar(self, trade_data, bar_data):
+    @staticmethod
+    def _order_affected_by_bar(trade_data, bar_data):
         affected_times = 0
         if trade_data['type'].endswith('limit') or trade_data['type'].endswith('stop'):
             if bar_data['Low'] <= trade_data['price'] <= bar_data['High']:
@@ -559,70 +710,76 @@ class backtesting():
         # end_datetime:
         #   None -> means that only one tick data is required being tick_datetime >= init_datetime
         #   Any  -> means upper limit not included in the tick_data array to return.
-        if end_datetime is None:
-            result = self.dict_tickdata[symbol][(self.dict_tickdata[symbol]['DateTime'] >= init_datetime)].head(1)
-        else:
-            result = self.dict_tickdata[symbol][(self.dict_tickdata[symbol]['DateTime'] >= init_datetime) & (
-                    self.dict_tickdata[symbol]['DateTime'] < end_datetime)]
-        return result
+        start, end = self.tick_store.index_range(symbol, init_datetime, end_datetime)
+        return self.tick_store.get_dataframe(symbol, start, end)
+
+    # First tick at or after current_datetime. There is none past the end of the tick data of the symbol.
+    def get_current_tick(self, symbol):
+        tick = self.tick_store.get_tick_at_or_after(symbol, self.current_datetime)
+        if tick is None:
+            logger.error(f"There is no {symbol} tick at or after {self.current_datetime}")
+            raise Exception(f"There is no {symbol} tick at or after {self.current_datetime}")
+        return tick
 
     def execute_order_on_tick(self, ticket_no, trade_data):
         if trade_data['status'] == OrderStatus.PENDING:
             order_type = trade_data.get('type')
             order_symbol = trade_data['symbol']
-            tick_data = self.get_tick_data_for_date_range(order_symbol, self.current_datetime)
-            self._open_order(ticket_no, trade_data, tick_data['DateTime'].iloc[0], tick_data['Bid'].iloc[0],
-                             tick_data['Ask'].iloc[0])
+            tick = self.get_current_tick(order_symbol)
+            self._open_order(ticket_no, trade_data, tick['DateTime'], tick['Bid'], tick['Ask'])
 
     def execute_order_into_tick(self, ticket_no, trade_data, init_datetime, end_datetime):
         order_symbol = trade_data['symbol']
         order_type = trade_data['type']
         for_buy = order_type.startswith('buy')
-        tick_data = self.get_tick_data_for_date_range(order_symbol, init_datetime, end_datetime)
+        start, end = self.tick_store.index_range(order_symbol, init_datetime, end_datetime)
+        bid = self.tick_store.bid(order_symbol)
+        ask = self.tick_store.ask(order_symbol)
+
+        # Price levels as (price, price_ask, higher_than). Pending entry, SL and TP are resolved in one pass.
+        levels = []
+        entry_level = sl_level = tp_level = None
         if trade_data['status'] == OrderStatus.PENDING:
-            open_datetime, open_price = self.get_time_price_tick_data_for_price(tick_data, trade_data['price'], for_buy, for_buy)
-            self._open_order(ticket_no, trade_data, open_datetime, open_price, open_price)
+            # Stop orders trigger when the market reaches the price from below (buy) or above (sell), limit
+            # orders the other way round.
+            entry_level = len(levels)
+            levels.append((trade_data['price'], for_buy, for_buy == order_type.endswith('stop')))
+        if trade_data['SL'] > 0:
+            sl_level = len(levels)
+            levels.append((trade_data['SL'], not for_buy, not for_buy))
+        if trade_data['TP'] > 0:
+            tp_level = len(levels)
+            levels.append((trade_data['TP'], not for_buy, for_buy))
+        if len(levels) == 0 or end <= start:
+            return
+        hits = get_crossing_hits(bid, ask, start, end, levels)
+
+        from_index = start
+        if entry_level is not None:
+            entry_index = get_first_hit_indexes(hits[entry_level:entry_level + 1], start)[0]
+            if entry_index < 0:
+                return
+            open_tick = self.tick_store.get_tick(order_symbol, entry_index)
+            # Filled at the crossing tick, not at the order price (a gap through it is filled at the tick price), with
+            # the spread of _open_order(): buys at the tick Bid plus one pip, sells at the tick Bid.
+            self._open_order(ticket_no, trade_data, open_tick['DateTime'], open_tick['Bid'], open_tick['Ask'])
             trade_data = self.open_orders[ticket_no]
-            tick_data = tick_data[tick_data['DateTime'] > open_datetime]
+            from_index = self.tick_store.index_after_time(order_symbol, entry_index, end)
 
         # Manage order on tick.
         if trade_data is not None and trade_data['status'] == OrderStatus.OPEN:
-            look_for_price = 0.0
-            if for_buy:
-                sl_close_price, sl_close_datetime = self.get_time_price_tick_data_for_price(tick_data, trade_data['SL'], False, False)
-                tp_close_price, tp_close_datetime = self.get_time_price_tick_data_for_price(tick_data, trade_data['TP'], False, True)
+            close_indexes = get_first_hit_indexes(hits, start, from_index)
+            sl_index = close_indexes[sl_level] if sl_level is not None else -1
+            tp_index = close_indexes[tp_level] if tp_level is not None else -1
+            if sl_index >= 0 and (tp_index < 0 or sl_index <= tp_index):
+                close_index = sl_index
             else:
-                sl_close_price, sl_close_datetime = self.get_time_price_tick_data_for_price(tick_data, trade_data['SL'], True, True)
-                tp_close_price, tp_close_datetime = self.get_time_price_tick_data_for_price(tick_data, trade_data['TP'], True, False)
-
-            if sl_close_price is not None and tp_close_price is not None:
-                #TODO: verify the following line, try to get the datetime stamp maybe using .iloc(0)
-                if sl_close_datetime <= tp_close_datetime:
-                    self._close_order(ticket_no, sl_close_price)
-                else:
-                    self._close_order(ticket_no, tp_close_price)
-            elif sl_close_price is not None:
-                self._close_order(ticket_no, sl_close_price)
-            elif tp_close_price is not None:
-                self._close_order(ticket_no, tp_close_price)
-
-    def get_time_price_tick_data_for_price(self, tick_data, price, price_ask, higher_than):
-        # Returns the market price ask/bid which is higher/lower than price received by paramater.
-        if price_ask:
-            price_type = 'Ask'
-        else:
-            price_type = 'Bid'
-        if higher_than:
-            price_tick_condition = tick_data[price_type] >= price
-        else:
-            price_tick_condition = tick_data[price_type] <= price
-        price_tick = tick_data[price_tick_condition]
-        if price_tick is not None and len(price_tick) > 0:
-            tick_datetime = price_tick['DateTime'].head(1)
-            tick_datetime = tick_datetime.reset_index(drop=True).iloc[0]
-            tick_price = price_tick[price_type].head(1)
-            tick_price = tick_price.reset_index(drop=True).iloc[0]
-        return tick_price, tick_datetime
+                close_index = tp_index
+            if close_index >= 0:
+                close_tick = self.tick_store.get_tick(order_symbol, close_index)
+                close_price = close_tick['Bid'] if for_buy else close_tick['Ask']
+                self._close_order(ticket_no, close_price, close_tick['DateTime'])
+                self.inform_order_closed(ticket_no, order_symbol)
 
     def _open_order(self, ticket_no, trade_data, execution_datetime, market_bid_price, market_ask_price):
         order_type = trade_data.get('type')
@@ -637,18 +794,21 @@ class backtesting():
 
         trade_data['open_time'] = execution_datetime
         trade_data['status'] = OrderStatus.OPEN
+        self.order_book.set_open(ticket_no)
         self.open_orders[ticket_no] = trade_data
         # Trigger events
         self.event_handler.on_message({'type': 'INFO',
                                        'message': f'Successfully sent order {ticket_no}: {order_symbol}, {trade_data["type"]}, {trade_data["lots"]}, {trade_data["open_price"]}'})
         self.event_handler.on_order_event()
 
+    # Only the open orders and the pending ones triggered inside the main bar range can be affected by the bar.
     def manage_orders(self, symbol, symbol_tf):
-        if len(self.dict_trades) > 0:
-            orders = [(ticket_no, trade_data) for ticket_no, trade_data in self.dict_trades.items() if
-                      trade_data.get('symbol') == symbol and
-                      trade_data.get('status') in [OrderStatus.OPEN, OrderStatus.PENDING]]
-            for ticket_no, trade_data in orders:
+        main_symbol_tf = self._get_main_tf(symbol)
+        bar_index = self.dict_bardata_index[main_symbol_tf]
+        orders = self.order_book.get_orders_to_check(symbol, self.bar_store.column(main_symbol_tf, 'Low')[bar_index],
+                                                     self.bar_store.column(main_symbol_tf, 'High')[bar_index])
+        for ticket_no, trade_data in orders:
+            if self.order_book.is_active(ticket_no):
                 self._execute_order(ticket_no, trade_data)
 
     def _manage_order(self, ticket_no, trade_data, execution_datetime, bar_low_price, bar_high_price):
@@ -676,10 +836,17 @@ class backtesting():
                     to_inform = True
 
         if to_inform == True:
-            self.open_orders.pop(ticket_no)
-            self.event_handler.on_message({'type': 'INFO',
-                                           'message': f'Successfully closed 1 orders with symbol {order_symbol}.'})
-            self.event_handler.on_order_event()
+            self.inform_order_closed(ticket_no, order_symbol)
+
+    # Informs the event handler of a closed or canceled order: on_trade_closed() with the trade, as soon as it is in
+    # the closed ledger, then the closing message and the order event.
+    def inform_order_closed(self, ticket_no, symbol):
+        # Pending orders are only in open_orders once filled.
+        self.open_orders.pop(ticket_no, None)
+        self.event_handler.on_trade_closed(ticket_no, self.dict_trades[ticket_no])
+        self.event_handler.on_message({'type': 'INFO',
+                                       'message': f'Successfully closed 1 orders with symbol {symbol}.'})
+        self.event_handler.on_order_event()
 
     def get_left_n_elements(self, dataframe, start_index, n):
         keys = dataframe.index.tolist()
@@ -691,7 +858,7 @@ class backtesting():
     def update_order_on_tick(self, ticket_no, trade_data):
         order_type = trade_data.get('type')
         order_symbol = trade_data.get('symbol')
-        tick_data = self.get_tick_data_for_date_range(order_symbol)
+        tick_data = self.get_current_tick(order_symbol)
         to_inform = False
         if order_type == 'buy':
             if trade_data.get('SL') > 0.0:
@@ -720,10 +887,8 @@ class backtesting():
                     trade_data['status'] = OrderStatus.CLOSED
                     to_inform = True
         if to_inform == True:
-            self.open_orders.pop(ticket_no)
-            self.event_handler.on_message({'type': 'INFO',
-                                           'message': f'Successfully closed 1 orders with symbol {order_symbol}.'})
-            self.event_handler.on_order_event()
+            self.order_book.close(ticket_no)
+            self.inform_order_closed(ticket_no, order_symbol)
 
     """Sends a MODIFY_ORDER command to modify an order.
 
@@ -759,7 +924,7 @@ class backtesting():
                     trade_data['lots'] = lots
                 if price > 0.0:
                     trade_data['price'] = price
-            self.dict_trades[ticket] = trade_data
+                    self.order_book.set_price(ticket)
             self.execute_order(ticket, trade_data)
 
     def validate_order(self, trade_data):
@@ -795,7 +960,7 @@ class backtesting():
             new_trade_data = self.dict_trades[ticket_no].copy()
             self.last_ticket_no += 1
             new_trade_data['ticket_no'] = self.last_ticket_no
-            self.dict_trades[self.last_ticket_no] = new_trade_data
+            self.order_book.add(new_trade_data)
             result = self.last_ticket_no
         else:
             logger.error(f"Error on duplicate_order: order {ticket_no} not exist in the dictionary")
@@ -834,13 +999,11 @@ class backtesting():
         elif trade_data['status'] == OrderStatus.PENDING:
             self.dict_trades[ticket]['status'] = OrderStatus.CANCELED
             self.dict_trades[ticket]['close_time'] = self.current_datetime
+            self.order_book.close(ticket)
             result = True
 
         if result:
-            self.open_orders.pop(ticket)
-            self.event_handler.on_message({'type': 'INFO',
-                                           'message': f'Successfully closed 1 orders with symbol {symbol}.'})
-            self.event_handler.on_order_event()
+            self.inform_order_closed(ticket, symbol)
 
         return result
 
@@ -851,8 +1014,7 @@ class backtesting():
         if close_time is None:
             close_time = self.current_datetime
         if close_price is None:
-            tick_data = self.get_tick_data_for_date_range(symbol)
-            close_price = tick_data['Bid'].iloc[0]
+            close_price = self.get_current_tick(symbol)['Bid']
             if trade_data['type'] in self.sell_order_types:
                 close_price = close_price + pip_value
         self.dict_trades[ticket]['close_price'] = close_price
@@ -862,6 +1024,7 @@ class backtesting():
                                                                             close_time)
         self.dict_trades[ticket]['status'] = OrderStatus.CLOSED
         self.dict_trades[ticket]['pnl'] = self._calculate_profit(trade_data)
+        self.order_book.close(ticket)
         # Update current balance.
         self.account_info["balance"] = self.account_info["balance"] + self.dict_trades[ticket]['pnl']
 
@@ -879,10 +1042,7 @@ class backtesting():
 
         # If base currency is not quote currency then convert it.
         if base_currency != quote_currency:
-            # Initialize CurrencyRates object
-            c = CurrencyRates(force_decimal=True)
-            # Get historic exchange rate
-            exchange_rate = float(c.get_rate(base_currency, quote_currency, trade_data['close_time']))
+            exchange_rate = self.fx_rates.get_rate(base_currency, quote_currency, trade_data['close_time'])
             profit = round(profit * exchange_rate, 2)
         else:
             profit = round(profit, 2)
@@ -900,13 +1060,9 @@ class backtesting():
 
         # If base currency is not quote currency then convert it.
         if base_currency != quote_currency:
-            # Initialize CurrencyRates object
-            c = CurrencyRates(force_decimal=True)
             if date is None:
                 date = self.current_datetime
-
-            # Get historic exchange rate
-            exchange_rate = float(c.get_rate(base_currency, quote_currency, date))
+            exchange_rate = self.fx_rates.get_rate(base_currency, quote_currency, date)
             commission = round(commission_base_currency * exchange_rate, 2)
         else:
             commission = round(commission_base_currency, 2)
@@ -921,8 +1077,7 @@ class backtesting():
     """
 
     def close_all_orders(self):
-        orders = [(ticket_no, trade_data) for ticket_no, trade_data in self.dict_trades.items() if
-                  (trade_data.get('status') == OrderStatus.OPEN or trade_data.get('status') == OrderStatus.PENDING)]
+        orders = self.order_book.get_active_orders()
         for ticket_no, trade_data in orders:
             self.close_order(ticket_no)
 
@@ -935,9 +1090,7 @@ class backtesting():
     """
 
     def close_orders_by_symbol(self, symbol):
-        orders = [(ticket_no, trade_data) for ticket_no, trade_data in self.dict_trades.items() if
-                  trade_data.get('symbol') == symbol and
-                  (trade_data.get('status') == OrderStatus.OPEN or trade_data.get('status') == OrderStatus.PENDING)]
+        orders = self.order_book.get_active_orders(symbol=symbol)
         for ticket_no, trade_data in orders:
             self.close_order(ticket_no)
 
@@ -951,8 +1104,6 @@ class backtesting():
     """
 
     def close_orders_by_magic(self, magic):
-        orders = [(ticket_no, trade_data) for ticket_no, trade_data in self.dict_trades.items() if
-                  trade_data.get('magic') == magic and
-                  (trade_data.get('status') == OrderStatus.OPEN or trade_data.get('status') == OrderStatus.PENDING)]
+        orders = self.order_book.get_active_orders(magic=magic)
         for ticket_no, trade_data in orders:
             self.close_order(ticket_no)
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+from python.common.logging_config import logger
+from python.common.conversions import get_timeframe_delta
+
+"""
+Columnar storage for backtesting bar data.
+
+Every symbol_tf keeps its bars as contiguous arrays: DateTime as int64 epoch nanoseconds (naive, broker time)
+and OHLCV as float64. Bars are sorted by time, so any lookup by datetime is a binary search.
+"""
+
+BAR_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+NS_PER_MINUTE = 60 * 1000000000
+NS_PER_HOUR = 60 * NS_PER_MINUTE
+
+
+def to_epoch_ns(date_time):
+    return pd.Timestamp(date_time).value
+
+
+def get_timeframe_delta_ns(timeframe):
+    return int(get_timeframe_delta(timeframe).total_seconds()) * 1000000000
+
+
+# Vectorized get_bar_data_clean_date(): open time of the timeframe bar that contains each time.
+def floor_times_to_timeframe(times, timeframe):
+    delta_ns = get_timeframe_delta_ns(timeframe)
+    return times - (times % delta_ns)
+
+
+# Vectorized backtesting.has_bar_data_changed() between each bar and the previous one. First element is False.
+def bar_data_changed_mask(times, timeframe):
+    mask = np.zeros(len(times), dtype=bool)
+    if len(times) < 2:
+        return mask
+    previous = times[:-1]
+    current = times[1:]
+    elapsed_changed = (current - previous) >= get_timeframe_delta_ns(timeframe)
+    previous_minute = (previous // NS_PER_MINUTE) % 60
+    current_minute = (current // NS_PER_MINUTE) % 60
+    previous_hour = (previous // NS_PER_HOUR) % 24
+    current_hour = (current // NS_PER_HOUR) % 24
+    if timeframe == 'D1':
+        window_changed = (current // (24 * NS_PER_HOUR)) != (previous // (24 * NS_PER_HOUR))
+    elif timeframe == 'H4':
+        window_changed = (current_hour != previous_hour) & (current_hour % 4 == 0)
+    elif timeframe == 'H1':
+        window_changed = current_hour != previous_hour
+    elif timeframe in ['M30', 'M15', 'M5']:
+        window_changed = (current_minute != previous_minute) & (current_minute % int(timeframe[1:]) == 0)
+    else:  # M1
+        window_changed = current_minute != previous_minute
+    mask[1:] = elapsed_changed | window_changed
+    return mask
+
+
+# For each main bar returns the [start, end) range of the sub timeframe bars (usually M1) opened inside it.
+def build_sub_bar_ranges(main_times, main_timeframe, sub_times):
+    starts = np.searchsorted(sub_times, main_times, side='left')
+    ends = np.searchsorted(sub_times, main_times + get_timeframe_delta_ns(main_timeframe), side='left')
+    return starts, ends
+
+
+# For each main bar returns the index of the other timeframe bar opened at the main bar clean date, or -1.
+def build_alignment_index(main_times, other_times, other_timeframe):
+    clean_times = floor_times_to_timeframe(main_times, other_timeframe)
+    indexes = np.searchsorted(other_times, clean_times, side='left')
+    found = indexes < len(other_times)
+    found[found] = other_times[indexes[found]] == clean_times[found]
+    return np.where(found, indexes, -1)
+
+
+class BarStore:
+    def __init__(self):
+        self._bars = {}  # {'EURUSD_M15': {'DateTime': int64 array, 'Open': float64 array, ...}}
+
+    def __contains__(self, symbol_tf):
+        return symbol_tf in self._bars
+
+    def keys(self):
+        return self._bars.keys()
+
+    def add_dataframe(self, symbol_tf, df):
+        columns = {'DateTime': df['DateTime'].values.astype('datetime64[ns]').view('int64')}
+        for column in BAR_COLUMNS:
+            columns[column] = df[column].to_numpy(dtype='float64')
+        self.add_columns(symbol_tf, columns)
+
+    def add_columns(self, symbol_tf, columns):
+        times = np.ascontiguousarray(columns['DateTime'], dtype='int64')
+        if len(times) > 1 and np.any(times[1:] < times[:-1]):
+            logger.error(f"Bar data for {symbol_tf} is not sorted by DateTime!")
+            raise Exception(f"Bar data for {symbol_tf} is not sorted by DateTime!")
+        bars = {'DateTime': times}
+        for column in BAR_COLUMNS:
+            bars[column] = np.ascontiguousarray(columns[column], dtype='float64')
+        self._bars.setdefault(symbol_tf, bars)
+
+    def length(self, symbol_tf):
+        return len(self._bars[symbol_tf]['DateTime'])
+
+    def times(self, symbol_tf):
+        return self._bars[symbol_tf]['DateTime']
+
+    def column(self, symbol_tf, column):
+        return self._bars[symbol_tf][column]
+
+    def first_datetime(self, symbol_tf):
+        return pd.Timestamp(self._bars[symbol_tf]['DateTime'][0])
+
+    def last_datetime(self, symbol_tf):
+        return pd.Timestamp(self._bars[symbol_tf]['DateTime'][-1])
+
+    def get_datetime(self, symbol_tf, index):
+        return pd.Timestamp(self._bars[symbol_tf]['DateTime'][index])
+
+    # Returns the bar as a dictionary with the same keys as the QDM csv columns.
+    def get_bar(self, symbol_tf, index):
+        bars = self._bars[symbol_tf]
+        return {'DateTime': pd.Timestamp(bars['DateTime'][index]),
+                'Open': bars['Open'][index], 'High': bars['High'][index],
+                'Low': bars['Low'][index], 'Close': bars['Close'][index],
+                'Volume': bars['Volume'][index]}
+
+    # Returns the index of the bar opened exactly at date_time or None.
+    def index_for_datetime(self, symbol_tf, date_time):
+        times = self._bars[symbol_tf]['DateTime']
+        target = to_epoch_ns(date_time)
+        index = int(np.searchsorted(times, target, side='left'))
+        if index < len(times) and times[index] == target:
+            return index
+        return None
+
+    # Returns the [start, end) index range of bars with start_datetime <= DateTime <= end_datetime.
+    # With end_inclusive=False the bar opened exactly at end_datetime is left out.
+    def index_range(self, symbol_tf, start_datetime=None, end_datetime=None, end_inclusive=True):
+        times = self._bars[symbol_tf]['DateTime']
+        start = 0
+        end = len(times)
+        if start_datetime is not None:
+            start = int(np.searchsorted(times, to_epoch_ns(start_datetime), side='left'))
+        if end_datetime is not None:
+            end = int(np.searchsorted(times, to_epoch_ns(end_datetime), side='right' if end_inclusive else 'left'))
+        return start, max(start, end)
+
+    def get_dataframe(self, symbol_tf, start_datetime=None, end_datetime=None):
+        start, end = self.index_range(symbol_tf, start_datetime, end_datetime)
+        bars = self._bars[symbol_tf]
+        df = pd.DataFrame({'DateTime': bars['DateTime'][start:end].view('datetime64[ns]')})
+        for column in BAR_COLUMNS:
+            df[column] = bars[column][start:end]
+        return df
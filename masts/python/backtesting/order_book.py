@@ -0,0 +1,127 @@
+from enum import Enum
+from bisect import bisect_left, bisect_right, insort
+from python.common.logging_config import logger
+
+"""
+Order book of the backtester.
+
+trades keeps every order by ticket (the legacy backtesting.dict_trades). The active ones (PENDING or OPEN) are also
+indexed by symbol and by magic, and the closed and canceled ones are appended to closed_trades in closing order, so
+no operation has to scan the whole history of the run. Pending orders sit in a price-sorted trigger queue per symbol:
+a bar only checks the pending orders whose price lies inside [Low, High].
+
+The book does not change the orders: backtesting updates the trade data and informs the book of every status
+(add, set_open, close) or price (set_price) change.
+"""
+
+
+class OrderStatus(Enum):
+    PENDING = 0
+    OPEN = 1
+    CLOSED = 2
+    CANCELED = 3
+
+
+ACTIVE_STATUSES = (OrderStatus.PENDING, OrderStatus.OPEN)
+
+
+class OrderBook:
+    def __init__(self):
+        self.trades = {}  # {ticket_no: trade_data} every order of the run.
+        self.closed_trades = []  # [(ticket_no, trade_data)] closed and canceled orders, in closing order.
+        self._active = {}  # {ticket_no: trade_data} PENDING and OPEN orders.
+        self._active_by_symbol = {}  # {'EURUSD': {ticket_no: trade_data}}
+        self._active_by_magic = {}  # {magic: {ticket_no: trade_data}}
+        self._open_by_symbol = {}  # {'EURUSD': {ticket_no: trade_data}} OPEN orders only.
+        self._triggers = {}  # {'EURUSD': [(price, ticket_no), ...]} PENDING orders sorted by price.
+        self._trigger_prices = {}  # {ticket_no: price} key of every pending order in its trigger queue.
+
+    def __contains__(self, ticket_no):
+        return ticket_no in self.trades
+
+    def __len__(self):
+        return len(self.trades)
+
+    def is_active(self, ticket_no):
+        return ticket_no in self._active
+
+    def add(self, trade_data):
+        ticket_no = trade_data['ticket_no']
+        if ticket_no in self.trades:
+            logger.error(f"OrderBook.add() -> duplicated ticket: {ticket_no}")
+            raise Exception(f"Duplicated ticket: {ticket_no}")
+        self.trades[ticket_no] = trade_data
+        status = trade_data['status']
+        if status not in ACTIVE_STATUSES:
+            self.closed_trades.append((ticket_no, trade_data))
+            return
+        self._active[ticket_no] = trade_data
+        self._active_by_symbol.setdefault(trade_data['symbol'], {})[ticket_no] = trade_data
+        self._active_by_magic.setdefault(trade_data['magic'], {})[ticket_no] = trade_data
+        if status == OrderStatus.PENDING:
+            self._add_trigger(ticket_no, trade_data['symbol'], trade_data['price'])
+        else:
+            self._open_by_symbol.setdefault(trade_data['symbol'], {})[ticket_no] = trade_data
+
+    # A pending order has been filled.
+    def set_open(self, ticket_no):
+        trade_data = self._active[ticket_no]
+        if ticket_no in self._trigger_prices:
+            self._remove_trigger(ticket_no, trade_data['symbol'])
+        self._open_by_symbol.setdefault(trade_data['symbol'], {})[ticket_no] = trade_data
+
+    # The price of a pending order has been modified.
+    def set_price(self, ticket_no):
+        trade_data = self._active[ticket_no]
+        if ticket_no in self._trigger_prices:
+            self._remove_trigger(ticket_no, trade_data['symbol'])
+            self._add_trigger(ticket_no, trade_data['symbol'], trade_data['price'])
+
+    # The order has been closed or canceled.
+    def close(self, ticket_no):
+        trade_data = self._active.pop(ticket_no, None)
+        if trade_data is None:
+            return
+        symbol = trade_data['symbol']
+        del self._active_by_symbol[symbol][ticket_no]
+        del self._active_by_magic[trade_data['magic']][ticket_no]
+        if ticket_no in self._trigger_prices:
+            self._remove_trigger(ticket_no, symbol)
+        else:
+            del self._open_by_symbol[symbol][ticket_no]
+        self.closed_trades.append((ticket_no, trade_data))
+
+    # Active orders [(ticket_no, trade_data)] in ticket order, all of them or the ones of the symbol or magic.
+    def get_active_orders(self, symbol=None, magic=None):
+        if symbol is not None:
+            orders = self._active_by_symbol.get(symbol, {})
+        elif magic is not None:
+            orders = self._active_by_magic.get(magic, {})
+        else:
+            orders = self._active
+        if symbol is not None and magic is not None:
+            return sorted((ticket_no, trade_data) for ticket_no, trade_data in orders.items()
+                          if trade_data['magic'] == magic)
+        return sorted(orders.items())
+
+    # Orders of the symbol a bar can affect, in ticket order: every OPEN order (SL/TP, including gaps) and the PENDING
+    # ones with low <= price <= high.
+    def get_orders_to_check(self, symbol, low, high):
+        orders = dict(self._open_by_symbol.get(symbol, {}))
+        triggers = self._triggers.get(symbol)
+        if triggers:
+            start = bisect_left(triggers, (low, -1))
+            end = bisect_right(triggers, (high, float('inf')))
+            active = self._active
+            for price, ticket_no in triggers[start:end]:
+                orders[ticket_no] = active[ticket_no]
+        return sorted(orders.items())
+
+    def _add_trigger(self, ticket_no, symbol, price):
+        self._trigger_prices[ticket_no] = price
+        insort(self._triggers.setdefault(symbol, []), (price, ticket_no))
+
+    def _remove_trigger(self, ticket_no, symbol):
+        key = (self._trigger_prices.pop(ticket_no), ticket_no)
+        triggers = self._triggers[symbol]
+        del triggers[bisect_left(triggers, key)]
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from python.backtesting.bar_store import to_epoch_ns, NS_PER_MINUTE
+
+"""
+Columnar storage for backtesting tick data and the price crossing kernels used for intrabar order resolution.
+
+Every symbol keeps its ticks as contiguous arrays: DateTime as int64 epoch nanoseconds (naive, broker time) and
+Bid/Ask as price_dtype (float64, or float32 to halve the memory of long tick histories). A minute-bucket offset table
+(first row of every minute since the first tick) turns any datetime lookup into a direct slice plus a search inside a
+single minute.
+"""
+
+
+class TickStore:
+    def __init__(self, price_dtype='float64'):
+        self.price_dtype = price_dtype
+        self._ticks = {}  # {'EURUSD': {'DateTime': int64 array, 'Bid': float64 array, 'Ask': float64 array}}
+        self._minute_offsets = {}  # {'EURUSD': (first_minute, offsets)}; rows of minute m are offsets[m]:offsets[m+1]
+
+    def __contains__(self, symbol):
+        return symbol in self._ticks
+
+    def add_dataframe(self, symbol, df):
+        self.add_columns(symbol, {'DateTime': df['DateTime'].values.astype('datetime64[ns]').view('int64'),
+                                  'Bid': df['Bid'].to_numpy(dtype=self.price_dtype),
+                                  'Ask': df['Ask'].to_numpy(dtype=self.price_dtype)})
+
+    def add_columns(self, symbol, columns):
+        if symbol in self._ticks:
+            return
+        times = np.ascontiguousarray(columns['DateTime'], dtype='int64')
+        self._ticks[symbol] = {'DateTime': times,
+                               'Bid': np.ascontiguousarray(columns['Bid'], dtype=self.price_dtype),
+                               'Ask': np.ascontiguousarray(columns['Ask'], dtype=self.price_dtype)}
+        self._minute_offsets[symbol] = build_minute_offsets(times)
+
+    def times(self, symbol):
+        return self._ticks[symbol]['DateTime']
+
+    def bid(self, symbol):
+        return self._ticks[symbol]['Bid']
+
+    def ask(self, symbol):
+        return self._ticks[symbol]['Ask']
+
+    def get_tick(self, symbol, index):
+        ticks = self._ticks[symbol]
+        return {'DateTime': pd.Timestamp(ticks['DateTime'][index]), 'Bid': to_price(ticks['Bid'][index]),
+                'Ask': to_price(ticks['Ask'][index])}
+
+    # Returns the index of the first tick with DateTime >= date_time (len(ticks) if there is none).
+    def index_at_or_after(self, symbol, date_time):
+        times = self._ticks[symbol]['DateTime']
+        first_minute, offsets = self._minute_offsets[symbol]
+        target = to_epoch_ns(date_time)
+        minute = target // NS_PER_MINUTE - first_minute
+        if minute < 0:
+            return 0
+        elif minute >= len(offsets) - 1:
+            return len(times)
+        bucket_start = offsets[minute]
+        bucket_end = offsets[minute + 1]
+        if target % NS_PER_MINUTE == 0 or bucket_start == bucket_end:
+            return int(bucket_start)
+        return int(bucket_start + np.searchsorted(times[bucket_start:bucket_end], target, side='left'))
+
+    # Returns the [start, end) index range of ticks with init_datetime <= DateTime < end_datetime.
+    # end_datetime None means only the first tick at or after init_datetime.
+    def index_range(self, symbol, init_datetime, end_datetime=None):
+        start = self.index_at_or_after(symbol, init_datetime)
+        if end_datetime is None:
+            end = min(start + 1, len(self._ticks[symbol]['DateTime']))
+        else:
+            end = max(start, self.index_at_or_after(symbol, end_datetime))
+        return start, end
+
+    # Returns the first tick at or after date_time or None.
+    def get_tick_at_or_after(self, symbol, date_time):
+        index = self.index_at_or_after(symbol, date_time)
+        if index < len(self._ticks[symbol]['DateTime']):
+            return self.get_tick(symbol, index)
+        return None
+
+    # Returns the first index in [start, end) whose DateTime is strictly later than the one at index.
+    def index_after_time(self, symbol, index, end):
+        times = self._ticks[symbol]['DateTime']
+        return int(np.searchsorted(times[index:end], times[index], side='right')) + index
+
+    def get_dataframe(self, symbol, start, end):
+        ticks = self._ticks[symbol]
+        return pd.DataFrame({'DateTime': ticks['DateTime'][start:end].view('datetime64[ns]'),
+                             'Bid': ticks['Bid'][start:end], 'Ask': ticks['Ask'][start:end]})
+
+
+# Python float of a tick price. float32 prices go through their shortest repr, which gives back the csv value
+# (1.08008 instead of 1.0800800323486328).
+def to_price(value):
+    if isinstance(value, np.float32):
+        return float(str(value))
+    return float(value)
+
+
+# offsets[m] is the first row whose minute (counted from the first tick minute) is >= m.
+def build_minute_offsets(times):
+    if len(times) == 0:
+        return 0, np.zeros(1, dtype='int64')
+    minutes = times // NS_PER_MINUTE
+    first_minute = int(minutes[0])
+    buckets = np.arange(int(minutes[-1]) - first_minute + 2, dtype='int64')
+    return first_minute, np.searchsorted(minutes - first_minute, buckets, side='left').astype('int64')
+
+
+# Evaluates every price level over the [start, end) tick range in a single vectorized pass.
+# Each level is a tuple (price, price_ask, higher_than): the level is hit when Ask (or Bid) >= price (or <= price).
+# Levels are compared in the tick price dtype, so float32 ticks hit the same levels as their csv values.
+# Returns a boolean matrix with one row per level.
+def get_crossing_hits(bid, ask, start, end, levels):
+    prices = np.array([level[0] for level in levels], dtype=bid.dtype)[:, None]
+    price_ask = np.array([level[1] for level in levels], dtype=bool)[:, None]
+    higher_than = np.array([level[2] for level in levels], dtype=bool)[:, None]
+    market_prices = np.where(price_ask, ask[start:end][None, :], bid[start:end][None, :])
+    return np.where(higher_than, market_prices >= prices, market_prices <= prices)
+
+
+# Returns for each row of hits the absolute index of the first hit at or after from_index, or -1 if none.
+def get_first_hit_indexes(hits, start, from_index=None):
+    offset = 0 if from_index is None else max(0, from_index - start)
+    hits = hits[:, offset:]
+    if hits.shape[1] == 0:
+        return np.full(hits.shape[0], -1)
+    first = hits.argmax(axis=1)
+    found = hits[np.arange(hits.shape[0]), first]
+    return np.where(found, first + offset + start, -1)
@@ -1,6 +1,9 @@
 import pandas as pd
-import datetime
-from forex_python.converter import CurrencyRates
+from python.common.fx_rates import FxRates
+from python.common.metrics import get_daily_equity
+
+# Exchange rate provider shared by the risk management and the reports. Set it with set_fx_rates().
+_fx_rates = None
 
 def calculate_trailing_stop(trade_info, market_price, margin_points):
     result = None
@@ -24,40 +27,26 @@ def calculate_trailing_stop(trade_info, market_price, margin_points):
 def get_pip_value(digits):
     return 10 ** (-1 * (digits - 1))
 
+# Daily equity (initial investment plus the pnl closed up to every calendar day) from the first to the last close date.
 def get_daily_trades_returns_on_close_date(trades_info, investment = 100000.0):
-    df_trades = trades_info.copy()
-    # Convert 'datetime' column in df2 to datetime objects
-    df_trades['close_date'] = pd.to_datetime(df_trades['close_time']).dt.date
+    return get_daily_equity(trades_info, investment).rename('Close')
 
-    # Generate a date range between init_date and end_date (inclusive)
-    date_range = pd.date_range(df_trades['close_date'].iloc[0], df_trades['close_date'].iloc[len(df_trades) - 1])
 
-    # Create a DataFrame with the date range as the index and no columns
-    df_result = pd.DataFrame(index=date_range)
-    df_result['Close'] = 0.0
+def set_fx_rates(fx_rates):
+    global _fx_rates
+    _fx_rates = fx_rates
 
-    # Calculate accum returns
-    accum_return = investment # Initial capital
-    i = 0
 
-    while i < len(df_result):
-        day_return = (df_trades[df_trades['close_date'] == df_result.iloc[i].name])['pnl'].sum()
-        accum_return = accum_return + day_return
-        df_result.iloc[i]['Close'] = accum_return
-        i = i + 1
-    return df_result['Close']
+def get_fx_rates():
+    global _fx_rates
+    if _fx_rates is None:
+        # Nothing configured: keep the previous behaviour of online lookups, now cached.
+        _fx_rates = FxRates(allow_online=True)
+    return _fx_rates
 
 
 def get_exchange_rate(base_currency, quote_currency, date_time=None):
-    exchange_rate = 1.0
-    if base_currency != quote_currency:
-        if date_time is None:
-            date_time = datetime.datetime.now()
-        # Initialize CurrencyRates object
-        c = CurrencyRates(force_decimal=True)
-        # Get historic exchange rate
-        exchange_rate = float(c.get_rate(base_currency, quote_currency, date_time))
-    return exchange_rate
+    return get_fx_rates().get_rate(base_currency, quote_currency, date_time)
 
 def normalize_order_size(calculated_size, min_volume):
     decimal_places = len(str(min_volume).split(".")[1])
@@ -0,0 +1,180 @@
+import os
+import re
+import io
+import json
+import hashlib
+import tempfile
+import pandas as pd
+from threading import Lock
+from python.common.logging_config import logger
+from python.common.qdm_cache import parse_qdm_chunk
+
+"""
+Catalog of the QuantDataManager export directory (back_test_directory_path).
+
+The directory is walked once per process: every file is recorded with its size and modification time, so the
+find_file() / get_bar_data_file_name() lookups are in-memory searches instead of an os.walk per lookup. The data
+summary of a file (symbol, timeframe, first/last DateTime as int64 epoch ns, rows and the QdmCache entry of the file)
+is computed the first time it is needed, from the QdmCache columns if there is a cache, or else from the csv header,
+first and last lines and a line count. Coverage checks (get_datetime_range()) then need no file reads.
+
+With catalog_file_name the catalog is persisted as JSON and refresh() is incremental: the summaries of the files
+whose size and modification time have not changed are kept, so the next processes (e.g. sweep workers, or workers
+on a network-mounted data directory) never read the exports again just to know what they contain.
+"""
+
+CATALOG_VERSION = 1
+QDM_FILE_NAME = re.compile(r'([A-Za-z][A-Za-z0-9]*)_TICK_UTCPlus03-([A-Za-z0-9]+)')
+TAIL_BYTES = 65536
+COUNT_BLOCK_BYTES = 16 * 1024 * 1024
+
+
+class DataCatalog:
+    def __init__(self, directory_path, catalog_file_name=None, qdm_cache=None):
+        self.directory_path = os.path.abspath(directory_path)
+        self.catalog_file_name = catalog_file_name
+        self.qdm_cache = qdm_cache
+        self.entries = {}  # {relative path: {'size', 'mtime_ns', 'symbol', 'time_frame', 'first_time', ...}}
+        self._lock = Lock()
+        self._load()
+        self.refresh()
+
+    # Re-lists the directory: new files are added, removed ones dropped, and changed ones (size or modification time)
+    # lose their summary. Files are kept in os.walk order, so find_file() returns what files.find_file() did.
+    def refresh(self):
+        with self._lock:
+            entries = {}
+            changed = False
+            for root, dirs, files in os.walk(self.directory_path):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    relative_path = os.path.relpath(file_path, self.directory_path)
+                    if self.catalog_file_name is not None and \
+                            os.path.abspath(file_path) == os.path.abspath(self.catalog_file_name):
+                        continue
+                    try:
+                        stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    entry = self.entries.get(relative_path)
+                    if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+                        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+                        match = QDM_FILE_NAME.search(file)
+                        if match is not None:
+                            entry['symbol'], entry['time_frame'] = match.groups()
+                        changed = True
+                    entries[relative_path] = entry
+            changed = changed or len(entries) != len(self.entries)
+            self.entries = entries
+            if changed:
+                self._save()
+
+    # Full path of the first file whose name contains search_for, None if there is none (after a refresh).
+    def find_file(self, search_for):
+        file_name = self._find_file(search_for)
+        if file_name is None:
+            self.refresh()
+            file_name = self._find_file(search_for)
+        return file_name
+
+    def _find_file(self, search_for):
+        for relative_path in list(self.entries):
+            if search_for in os.path.basename(relative_path):
+                return os.path.join(self.directory_path, relative_path)
+        return None
+
+    def get_bar_data_file_name(self, symbol, time_frame):
+        return self.find_file(f'{symbol}_TICK_UTCPlus03-{time_frame}')
+
+    # Catalog entry of the file with its data summary: symbol, time_frame, first_time, last_time, rows, cache_path.
+    def get_entry(self, file_name):
+        relative_path = os.path.relpath(os.path.abspath(file_name), self.directory_path)
+        with self._lock:
+            entry = self.entries.get(relative_path)
+            if entry is None:
+                logger.error(f"DataCatalog -> {file_name} is not in the catalog of {self.directory_path}")
+                raise Exception(f"{file_name} is not in the catalog of {self.directory_path}")
+            if 'rows' not in entry:
+                entry.update(self._summarize(file_name))
+                self._save()
+            return entry
+
+    # (first DateTime, last DateTime) of the file as pd.Timestamp, the rows are not read.
+    def get_datetime_range(self, file_name):
+        entry = self.get_entry(file_name)
+        return pd.Timestamp(entry['first_time']), pd.Timestamp(entry['last_time'])
+
+    def _summarize(self, file_name):
+        if self.qdm_cache is not None:
+            columns = self.qdm_cache.load_columns(file_name)
+            times = columns['DateTime']
+            if len(times) == 0:
+                logger.error(f"DataCatalog -> {file_name} is empty!")
+                raise Exception(f"DataCatalog -> {file_name} is empty!")
+            return {'first_time': int(times[0]), 'last_time': int(times[-1]), 'rows': len(times),
+                    'cache_path': self.qdm_cache.get_entry_path(file_name)}
+        header, first_line, last_line, rows = read_csv_outline(file_name)
+        if rows == 0:
+            logger.error(f"DataCatalog -> {file_name} is empty!")
+            raise Exception(f"DataCatalog -> {file_name} is empty!")
+        times = parse_qdm_chunk(pd.read_csv(io.StringIO(f'{header}\n{first_line}\n{last_line}\n')))['DateTime']
+        times = times.values.astype('datetime64[ns]').view('int64')
+        return {'first_time': int(times[0]), 'last_time': int(times[-1]), 'rows': rows, 'cache_path': None}
+
+    def _load(self):
+        if self.catalog_file_name is None or not os.path.exists(self.catalog_file_name):
+            return
+        try:
+            with open(self.catalog_file_name, 'r') as file:
+                catalog = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.error(f"DataCatalog -> {self.catalog_file_name} not loaded, it will be rebuilt: {e}")
+            return
+        if catalog.get('version') == CATALOG_VERSION and catalog.get('directory_path') == self.directory_path:
+            self.entries = catalog['entries']
+
+    # Written to a temporary file and renamed, so concurrent processes never read a partial catalog.
+    def _save(self):
+        if self.catalog_file_name is None:
+            return
+        catalog_directory_path = os.path.dirname(os.path.abspath(self.catalog_file_name))
+        try:
+            os.makedirs(catalog_directory_path, exist_ok=True)
+            file_descriptor, temp_file_name = tempfile.mkstemp(dir=catalog_directory_path, suffix='.tmp')
+            with os.fdopen(file_descriptor, 'w') as file:
+                json.dump({'version': CATALOG_VERSION, 'directory_path': self.directory_path,
+                           'entries': self.entries}, file)
+            os.replace(temp_file_name, self.catalog_file_name)
+        except OSError as e:
+            logger.error(f"DataCatalog -> {self.catalog_file_name} not saved: {e}")
+
+
+# Default catalog file of a data directory, e.g. in the QdmCache directory shared by the runs.
+def get_catalog_file_name(catalog_directory_path, directory_path):
+    key_hash = hashlib.sha1(os.path.abspath(directory_path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(catalog_directory_path, f'data_catalog-{key_hash}.json')
+
+
+# Header, first and last data lines and number of data rows of a csv file. Only the head and the tail are parsed,
+# the rows are counted by newlines in binary blocks.
+def read_csv_outline(file_name):
+    with open(file_name, 'rb') as file:
+        header = file.readline().decode('utf-8').strip()
+        first_line = file.readline().decode('utf-8').strip()
+        newlines = 0
+        last_byte = b''
+        file.seek(0)
+        while True:
+            block = file.read(COUNT_BLOCK_BYTES)
+            if not block:
+                break
+            newlines += block.count(b'\n')
+            last_byte = block[-1:]
+        size = file.tell()
+        file.seek(max(0, size - TAIL_BYTES))
+        tail_lines = [line.strip() for line in file.read().decode('utf-8', errors='ignore').splitlines()]
+    tail_lines = [line for line in tail_lines if line]
+    lines = newlines + (1 if last_byte not in (b'', b'\n') else 0)
+    rows = max(0, lines - 1) if first_line else 0
+    last_line = tail_lines[-1] if tail_lines else first_line
+    return header, first_line, last_line, rows
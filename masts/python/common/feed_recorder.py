@@ -0,0 +1,195 @@
+import os
+import numpy as np
+import pandas as pd
+from time import time_ns, monotonic
+from queue import Queue, Full, Empty
+from threading import Thread
+from python.common.logging_config import logger
+from python.common.historic_window import to_bar_time_ns, NS_PER_DAY
+from python.backtesting.bar_store import to_epoch_ns
+
+"""
+Recorder of the live feed (every tick and bar observed by dwx_client) into compressed columnar chunk files.
+
+record_tick()/record_bar() only stamp the event and put it in a bounded queue, so the dwx_client polling thread is not
+slowed down (events are discarded and counted in dropped_events if the queue is full). A background thread buffers the
+events of every partition and writes a chunk with numpy savez_compressed when the buffer reaches chunk_rows or is older
+than flush_seconds, and on close().
+
+Layout, partitioned by symbol (symbol_tf for bars) and day of broker time:
+    <directory_path>/ticks/EURUSD/20240222/<first_time_ns>_<last_time_ns>.npz    DateTime, Bid, Ask
+    <directory_path>/bars/EURUSD_M1/20240222/<first_time_ns>_<last_time_ns>.npz  DateTime, Open, High, Low, Close, Volume
+DateTime is int64 epoch nanoseconds (naive, broker time): ticks are stamped on receipt with the local clock plus
+time_delta_hours (the Market_Data file has no tick time), bars keep the time of the bar data event. The chunk names
+let the readers skip the chunks outside the requested range without opening them.
+
+load_recorded_ticks() returns the ticks as load_qdm_ticks_from_file() does, so backtesting can replay a recorded
+session (see backtesting recorded_ticks_directory_path).
+"""
+
+TICK_COLUMNS = ['DateTime', 'Bid', 'Ask']
+BAR_COLUMNS = ['DateTime', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+
+class FeedRecorder:
+    def __init__(self, directory_path, time_delta_hours=0, chunk_rows=100000, flush_seconds=60.0,
+                 max_queued_events=1000000):
+        self.directory_path = directory_path
+        self.time_delta_ns = int(time_delta_hours * 3600 * 1000000000)
+        self.chunk_rows = chunk_rows
+        self.flush_seconds = flush_seconds
+        self.queue = Queue(maxsize=max_queued_events)
+        self.dropped_events = 0
+        self.written_rows = 0
+        self._buffers = {}  # {('ticks', 'EURUSD', 19775): {'rows': [(time_ns, bid, ask), ...], 'since': monotonic}}
+        self.ACTIVE = True
+        self.writer_thread = Thread(target=self.write_events, args=())
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def record_tick(self, symbol, bid, ask):
+        self._put(('ticks', symbol, (time_ns() + self.time_delta_ns, bid, ask)))
+
+    def record_bar(self, symbol, time_frame, time, open_price, high, low, close_price, tick_volume):
+        self._put(('bars', f'{symbol}_{time_frame}', (time, open_price, high, low, close_price, tick_volume)))
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except Full:
+            self.dropped_events += 1
+
+    # Writes the buffered events and stops the writer thread.
+    def close(self, timeout=None):
+        self.ACTIVE = False
+        self.queue.put(None)
+        self.writer_thread.join(timeout)
+        if self.dropped_events > 0:
+            logger.error(f"FeedRecorder -> {self.dropped_events} events dropped, queue full")
+
+    def write_events(self):
+        while True:
+            try:
+                event = self.queue.get(timeout=min(1.0, self.flush_seconds))
+            except Empty:
+                event = False
+            if event is None:
+                break
+            if event:
+                self._buffer_event(*event)
+            self._flush(monotonic() - self.flush_seconds)
+        while not self.queue.empty():
+            event = self.queue.get_nowait()
+            if event is not None:
+                self._buffer_event(*event)
+        self._flush()
+
+    def _buffer_event(self, kind, name, row):
+        if kind == 'bars':
+            row = (to_bar_time_ns(row[0]),) + row[1:]
+        key = (kind, name, row[0] // NS_PER_DAY)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = {'rows': [], 'since': monotonic()}
+        buffer['rows'].append(row)
+        if len(buffer['rows']) >= self.chunk_rows:
+            self._write_chunk(key, self._buffers.pop(key)['rows'])
+
+    # Writes the buffers started before since (all of them if None).
+    def _flush(self, since=None):
+        for key in [key for key, buffer in self._buffers.items() if since is None or buffer['since'] <= since]:
+            self._write_chunk(key, self._buffers.pop(key)['rows'])
+
+    def _write_chunk(self, key, rows):
+        kind, name, day = key
+        columns = TICK_COLUMNS if kind == 'ticks' else BAR_COLUMNS
+        values = list(zip(*rows))
+        arrays = {'DateTime': np.asarray(values[0], dtype='int64')}
+        arrays.update({column: np.asarray(column_values, dtype='float64')
+                       for column, column_values in zip(columns[1:], values[1:])})
+        partition_path = os.path.join(self.directory_path, kind, name, get_day_name(day))
+        try:
+            os.makedirs(partition_path, exist_ok=True)
+            file_name = get_free_chunk_file_name(partition_path, int(arrays['DateTime'].min()),
+                                                 int(arrays['DateTime'].max()))
+            temp_file_name = f'{file_name}.tmp'
+            with open(temp_file_name, 'wb') as file:
+                np.savez_compressed(file, **arrays)
+            os.replace(temp_file_name, file_name)
+            self.written_rows += len(rows)
+        except OSError as e:
+            logger.error(f"FeedRecorder -> {len(rows)} {kind} of {name} not written: {e}")
+
+
+def get_day_name(day):
+    return str(np.datetime64(int(day), 'D')).replace('-', '')
+
+
+def get_free_chunk_file_name(partition_path, first_time, last_time):
+    file_name = os.path.join(partition_path, f'{first_time:019d}_{last_time:019d}.npz')
+    copy_no = 1
+    while os.path.exists(file_name):
+        file_name = os.path.join(partition_path, f'{first_time:019d}_{last_time:019d}_{copy_no}.npz')
+        copy_no += 1
+    return file_name
+
+
+# Chunk files of a symbol (symbol_tf for bars) overlapping [start_ns, end_ns], in time order.
+def get_chunk_file_names(directory_path, kind, name, start_ns=None, end_ns=None):
+    name_path = os.path.join(directory_path, kind, name)
+    if not os.path.isdir(name_path):
+        return []
+    chunks = []
+    for day_name in sorted(os.listdir(name_path)):
+        day_path = os.path.join(name_path, day_name)
+        for file_name in os.listdir(day_path):
+            if not file_name.endswith('.npz'):
+                continue
+            first_time, last_time = [int(value) for value in file_name[:-4].split('_')[:2]]
+            if (start_ns is None or last_time >= start_ns) and (end_ns is None or first_time <= end_ns):
+                chunks.append((first_time, last_time, os.path.join(day_path, file_name)))
+    return [file_name for first_time, last_time, file_name in sorted(chunks)]
+
+
+# Columns of the chunks, sorted by DateTime (stable, so equal times keep the recording order) and filtered to
+# start_datetime <= DateTime <= end_datetime.
+def load_recorded_columns(directory_path, kind, name, start_datetime=None, end_datetime=None, dtype='float64'):
+    columns = TICK_COLUMNS if kind == 'ticks' else BAR_COLUMNS
+    start_ns = to_epoch_ns(start_datetime) if start_datetime is not None else None
+    end_ns = to_epoch_ns(end_datetime) if end_datetime is not None else None
+    chunks = {column: [] for column in columns}
+    for file_name in get_chunk_file_names(directory_path, kind, name, start_ns, end_ns):
+        with np.load(file_name) as chunk:
+            for column in columns:
+                chunks[column].append(chunk[column])
+    result = {column: np.concatenate(chunks[column]) if chunks[column] else
+              np.zeros(0, dtype='int64' if column == 'DateTime' else dtype) for column in columns}
+    order = np.argsort(result['DateTime'], kind='stable')
+    times = result['DateTime'][order]
+    start = 0 if start_ns is None else int(np.searchsorted(times, start_ns, side='left'))
+    end = len(times) if end_ns is None else int(np.searchsorted(times, end_ns, side='right'))
+    return {column: (result[column][order][start:end] if column == 'DateTime'
+                     else result[column][order][start:end].astype(dtype, copy=False)) for column in columns}
+
+
+# Recorded ticks of the symbol with start_datetime <= DateTime <= end_datetime.
+# Returns (columns, first_datetime, last_datetime) as load_qdm_ticks_from_file(): columns as TickStore.add_columns()
+# expects them, first_datetime and last_datetime the first and last recorded ticks of the symbol.
+def load_recorded_ticks(directory_path, symbol, start_datetime, end_datetime, price_dtype='float64'):
+    chunk_file_names = get_chunk_file_names(directory_path, 'ticks', symbol)
+    if len(chunk_file_names) == 0:
+        logger.error(f"No recorded ticks of {symbol} in {directory_path}!")
+        raise Exception(f"No recorded ticks of {symbol} in {directory_path}!")
+    first_time = min(int(os.path.basename(file_name).split('_')[0]) for file_name in chunk_file_names)
+    last_time = max(int(os.path.basename(file_name).split('_')[1].split('.')[0]) for file_name in chunk_file_names)
+    columns = load_recorded_columns(directory_path, 'ticks', symbol, start_datetime, end_datetime, price_dtype)
+    return columns, pd.Timestamp(first_time), pd.Timestamp(last_time)
+
+
+# Recorded bars of the symbol_tf as a DataFrame with the QDM bar columns (DateTime, Open, High, Low, Close, Volume).
+# A bar received several times (e.g. after a reconnection) keeps its last values.
+def load_recorded_bars(directory_path, symbol, time_frame, start_datetime=None, end_datetime=None):
+    columns = load_recorded_columns(directory_path, 'bars', f'{symbol}_{time_frame}', start_datetime, end_datetime)
+    df = pd.DataFrame({column: columns[column] for column in BAR_COLUMNS[1:]})
+    df.insert(0, 'DateTime', pd.Series(columns['DateTime'], copy=False).astype('datetime64[ns]'))
+    return df.drop_duplicates('DateTime', keep='last').reset_index(drop=True)
@@ -1,11 +1,17 @@
 import os
-import ast
+import numpy as np
 import pandas as pd
 import json
+from python.common.logging_config import logger
+from python.common.trade_ledger import read_trade_ledger
 
 
-def get_bar_data_file_name(data_path, symbol, time_frame):
+# data_catalog (DataCatalog of data_path) is optional: when given, the file is looked up in the catalog instead of
+# walking data_path.
+def get_bar_data_file_name(data_path, symbol, time_frame, data_catalog=None):
     search_for = f'{symbol}_TICK_UTCPlus03-{time_frame}'
+    if data_catalog is not None:
+        return data_catalog.find_file(search_for)
     file_name = find_file(search_for, data_path)
     return file_name
 
@@ -17,30 +23,60 @@ def find_file(search_for, path):
                 return os.path.join(root, file)
 
 
-def load_qdm_data_from_file(file_name):
-    df = pd.read_csv(file_name)
-    df['DateTime'] = pd.to_datetime(df['Date'].astype(str) + ' ' + df['Time'])
-    df = df.drop(['Date', 'Time'], axis=1)
+# qdm_cache (QdmCache) is optional: when given, the data is loaded from its memory-mapped binary cache.
+def load_qdm_data_from_file(file_name, qdm_cache=None):
+    if qdm_cache is not None:
+        df = qdm_cache.load_dataframe(file_name)
+    else:
+        df = pd.read_csv(file_name)
+        df['DateTime'] = pd.to_datetime(df['Date'].astype(str) + ' ' + df['Time'])
+        df = df.drop(['Date', 'Time'], axis=1)
     df = df.rename(columns={'DateTime': 'time', 'Open': 'open', 'Close': 'close', 'High': 'high', 'Low': 'low',
                             'Volume': 'volume'})
     return df.set_index('time')
 
 
+# Streams a QDM tick export in chunks, keeping only the ticks with start_datetime <= DateTime <= end_datetime.
+# QDM tick datetimes (yyyymmdd HH:MM:SS.fff) sort as strings, so rows are filtered before parsing them and reading
+# stops at the first chunk past end_datetime.
+# Returns (columns, first_datetime, last_datetime): columns as TickStore.add_columns() expects them, first_datetime the
+# first tick of the file and last_datetime the last tick read (the file last one, or one after end_datetime).
+def load_qdm_ticks_from_file(file_name, start_datetime, end_datetime, price_dtype='float64', chunk_rows=1000000):
+    start_key = start_datetime.strftime('%Y%m%d %H:%M:%S.%f')[:-3]
+    end_key = end_datetime.strftime('%Y%m%d %H:%M:%S.%f')[:-3]
+    chunks = {'DateTime': [], 'Bid': [], 'Ask': []}
+    first_key = None
+    last_key = None
+    for df in pd.read_csv(file_name, usecols=['DateTime', 'Bid', 'Ask'], chunksize=chunk_rows,
+                          dtype={'DateTime': str, 'Bid': price_dtype, 'Ask': price_dtype}):
+        if len(df) == 0:
+            continue
+        if first_key is None:
+            first_key = df['DateTime'].iloc[0]
+        last_key = df['DateTime'].iloc[-1]
+        if last_key < start_key:
+            continue
+        df = df[(df['DateTime'] >= start_key) & (df['DateTime'] <= end_key)]
+        if len(df) > 0:
+            date_times = pd.to_datetime(df['DateTime'], format='%Y%m%d %H:%M:%S.%f')
+            chunks['DateTime'].append(date_times.values.astype('datetime64[ns]').view('int64'))
+            chunks['Bid'].append(df['Bid'].to_numpy())
+            chunks['Ask'].append(df['Ask'].to_numpy())
+        if last_key > end_key:
+            break
+    if first_key is None:
+        logger.error(f"Tickdata file {file_name} is empty!")
+        raise Exception(f"Tickdata file {file_name} is empty!")
+    columns = {'DateTime': np.concatenate(chunks['DateTime']) if chunks['DateTime'] else np.zeros(0, dtype='int64'),
+               'Bid': np.concatenate(chunks['Bid']) if chunks['Bid'] else np.zeros(0, dtype=price_dtype),
+               'Ask': np.concatenate(chunks['Ask']) if chunks['Ask'] else np.zeros(0, dtype=price_dtype)}
+    return (columns, pd.to_datetime(first_key, format='%Y%m%d %H:%M:%S.%f'),
+            pd.to_datetime(last_key, format='%Y%m%d %H:%M:%S.%f'))
+
+
+# Trades of a trades file (JSON lines or the legacy str(dict) lines), only the ones of the symbol if given.
 def extract_dictionaries_from_file(filename, symbol=None):
-    dictionaries = []
-    with open(filename, 'r') as file:
-        lines = file.readlines()
-        for line in lines:
-            dict_str = line.strip()
-            try:
-                dictionary = ast.literal_eval(dict_str)
-                # Only take into account orders with same symbol
-                if symbol is None or symbol == dictionary['symbol']:
-                    dictionaries.append(dictionary)
-            except (SyntaxError, ValueError):
-                pass
-    df = pd.DataFrame(dictionaries)
-    return df
+    return read_trade_ledger(filename, symbol)
 
 
 def get_daily_returns_from_file(returns_file_name):
@@ -50,7 +86,7 @@ def get_daily_returns_from_file(returns_file_name):
     # Parse the JSON data
     data_dict = json.loads(json_data)
     # Convert keys (timestamps) to datetime objects
-    datetime_index = pd.to_datetime(list(data_dict.keys()), unit='ms', utc=False)
+    datetime_index = pd.to_datetime([int(key) for key in data_dict.keys()], unit='ms', utc=False)
     # Convert values to float and create a Pandas Series
     data_series = pd.Series(list(data_dict.values()), index=datetime_index, name="Date", dtype='float64')
     return data_series
@@ -0,0 +1,95 @@
+import datetime
+import numpy as np
+import pandas as pd
+from python.common.logging_config import logger
+from python.common.files import get_bar_data_file_name, load_qdm_data_from_file
+
+"""
+Offline exchange rate provider.
+
+Rates come from a local table, either a csv file (columns DateTime, Pair, Rate; e.g. 2024-02-22,EURUSD,1.0823) or
+the open prices of the QDM bar files found in data_path (a bar open is known at the bar time, its close only when the
+bar ends). The rate used for a datetime is the last one of the table at or before that datetime, so there is no
+lookahead and intraday tables are also valid. Resolved rates are cached in memory by (pair, datetime).
+Online lookups with forex_python are only done when allow_online is True.
+"""
+
+
+class FxRates:
+    def __init__(self, rates_file_name=None, data_path=None, timeframe='D1', allow_online=False, qdm_cache=None,
+                 data_catalog=None):
+        self.data_path = data_path
+        self.timeframe = timeframe
+        self.allow_online = allow_online
+        self.qdm_cache = qdm_cache
+        self.data_catalog = data_catalog
+        self._rates = {}  # {'EURUSD': (int64 epoch ns array, float64 rates array)} or None if not available.
+        self._cache = {}  # {('EURUSD', epoch ns): rate}
+        self._currency_rates = None
+        if rates_file_name is not None:
+            self.load_rates_file(rates_file_name)
+
+    def load_rates_file(self, file_name):
+        df = pd.read_csv(file_name)
+        df['DateTime'] = pd.to_datetime(df['DateTime'])
+        for pair, df_pair in df.groupby('Pair'):
+            self.add_rates(pair, df_pair['DateTime'], df_pair['Rate'])
+
+    def add_rates(self, pair, date_times, rates):
+        times = pd.to_datetime(date_times).values.astype('datetime64[ns]').view('int64')
+        rates = np.asarray(rates, dtype='float64')
+        order = np.argsort(times, kind='stable')
+        self._rates[pair] = (times[order], rates[order])
+        # Drop cached values of the pair, they could come from another source.
+        self._cache = {key: value for key, value in self._cache.items() if key[0] != pair}
+
+    def get_rate(self, base_currency, quote_currency, date_time=None):
+        if base_currency == quote_currency:
+            return 1.0
+        if date_time is None:
+            date_time = datetime.datetime.now()
+        time = pd.Timestamp(date_time).value
+        pair = f'{base_currency}{quote_currency}'
+        key = (pair, time)
+        if key not in self._cache:
+            rate = self._get_table_rate(pair, time)
+            if rate is None:
+                inverse_rate = self._get_table_rate(f'{quote_currency}{base_currency}', time)
+                if inverse_rate is not None:
+                    rate = 1.0 / inverse_rate
+            if rate is None and self.allow_online:
+                rate = self._get_online_rate(base_currency, quote_currency, date_time)
+            if rate is None:
+                logger.error(f"FxRates.get_rate() -> no exchange rate for {pair} at {date_time}")
+                raise Exception(f"FxRates.get_rate() -> no exchange rate for {pair} at {date_time}")
+            self._cache[key] = rate
+        return self._cache[key]
+
+    def _get_table_rate(self, pair, time):
+        if pair not in self._rates:
+            self._rates[pair] = self._load_rates_from_bar_data(pair)
+        if self._rates[pair] is None:
+            return None
+        times, rates = self._rates[pair]
+        # Last rate whose time is lower or equal to the requested one (epoch ns).
+        index = int(np.searchsorted(times, time, side='right')) - 1
+        if index < 0:
+            return None
+        return float(rates[index])
+
+    def _load_rates_from_bar_data(self, pair):
+        if self.data_path is None:
+            return None
+        file_name = get_bar_data_file_name(self.data_path, pair, self.timeframe, self.data_catalog)
+        if file_name is None:
+            return None
+        df = load_qdm_data_from_file(file_name, self.qdm_cache)
+        logger.info(f"FxRates -> {pair} rates loaded from {file_name}")
+        return (df.index.values.astype('datetime64[ns]').view('int64'),
+                df['open'].to_numpy(dtype='float64'))
+
+    def _get_online_rate(self, base_currency, quote_currency, date_time):
+        if self._currency_rates is None:
+            from forex_python.converter import CurrencyRates
+            self._currency_rates = CurrencyRates(force_decimal=True)
+        return float(self._currency_rates.get_rate(base_currency, quote_currency, date_time))
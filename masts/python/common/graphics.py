@@ -116,6 +116,46 @@ def graph_trading_results(bars_data_filename, symbol, time_frame, start_date, en
     # fplt.autoviewrestore()
     fplt.show()
 
+
+# Headless version of graph_trading_results(): close price, EMAs and trades of [start_date, end_date] saved as a PNG.
+# Uses the matplotlib Agg canvas directly (no pyplot/GUI state), so it can run in a worker thread.
+def save_trading_results_chart(bars_data_filename, symbol, time_frame, start_date, end_date, trades_filename,
+                               chart_filename, qdm_cache=None):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    df = load_qdm_data_from_file(bars_data_filename, qdm_cache)
+    emas = [(50, 'red'), (100, 'gold'), (240, 'black')]
+    for periods, color in emas:
+        df[f'ema{periods}'] = talib.EMA(df['close'].to_numpy(dtype='float64'), timeperiod=periods)
+    if start_date is not None:
+        df = df[df.index >= pd.Timestamp(start_date)]
+    if end_date is not None:
+        df = df[df.index <= pd.Timestamp(end_date)]
+    figure = Figure(figsize=(16, 8))
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(1, 1, 1)
+    ax.set_title(f'MASTS + {symbol} {time_frame}')
+    ax.grid(True)
+    ax.plot(df.index, df['close'], color='grey', linewidth=0.8, label='close')
+    for periods, color in emas:
+        ax.plot(df.index, df[f'ema{periods}'], color=color, linewidth=1.2, label=f'EMA_{periods}')
+    if Path(trades_filename).exists():
+        df_trades = extract_dictionaries_from_file(trades_filename, symbol)
+        for index, trade_info in df_trades.iterrows():
+            color_line = get_color_code('blue') if trade_info['type'] == 'buy' else get_color_code('red')
+            color_marker = get_color_code('green') if trade_info['pnl'] >= 0.0 else get_color_code('orange')
+            open_datetime = pd.to_datetime(trade_info['open_time'])
+            close_datetime = pd.to_datetime(trade_info['close_time'])
+            ax.plot([open_datetime, close_datetime], [trade_info['open_price'], trade_info['close_price']],
+                    color=color_line, linewidth=1.5)
+            ax.scatter([close_datetime], [trade_info['close_price']], color=color_marker, s=12, zorder=3)
+    ax.legend(loc='upper left')
+    figure.autofmt_xdate()
+    figure.savefig(chart_filename, dpi=100, bbox_inches='tight')
+    logger.info(f"save_trading_results_chart() -> chart saved to {chart_filename}")
+    return chart_filename
+
+
 def graph_trades(trades_filename, symbol):
     if Path(trades_filename).exists():
         df = extract_dictionaries_from_file(trades_filename, symbol)
@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from python.backtesting.bar_store import to_epoch_ns, get_timeframe_delta_ns
+
+"""
+Read-only window over the last bars of a symbol_tf, handed to the strategies as historic data.
+
+The columns are numpy arrays: time as int64 epoch nanoseconds (naive, broker time) and open/high/low/close/volume as
+float64. In backtesting they are views over the BarStore arrays, so building a window does not copy or format
+anything. Live mode data (the legacy dictionary {'2024.02.22 10:00': {'open': .., 'tick_volume': ..}}) is adapted
+with from_dict(), and to_dict() gives the legacy format back.
+
+BarRingBuffer keeps the window of each symbol_tf up to date from the bar data events, so the historic data is only
+requested again on start-up or when bars are missing.
+"""
+
+HISTORIC_DICT_DATETIME_FORMAT = '%Y.%m.%d %H:%M'
+BAR_VALUES = ['open', 'high', 'low', 'close', 'volume']
+
+
+class HistoricWindow:
+    def __init__(self, time, open_prices, high, low, close, volume):
+        self.time = read_only_view(time)
+        self.open = read_only_view(open_prices)
+        self.high = read_only_view(high)
+        self.low = read_only_view(low)
+        self.close = read_only_view(close)
+        self.volume = read_only_view(volume)
+
+    def __len__(self):
+        return len(self.time)
+
+    # Window with the last n bars (views, no copy).
+    def tail(self, n):
+        start = max(0, len(self.time) - n)
+        return HistoricWindow(self.time[start:], self.open[start:], self.high[start:], self.low[start:],
+                              self.close[start:], self.volume[start:])
+
+    def get_datetime(self, index):
+        return pd.Timestamp(self.time[index])
+
+    def last_datetime(self):
+        return self.get_datetime(-1)
+
+    # Same DataFrame as conversions.convert_historic_bars_to_dataframe().
+    def to_dataframe(self):
+        df = pd.DataFrame({'open': self.open, 'high': self.high, 'low': self.low, 'close': self.close,
+                           'volume': self.volume},
+                          index=pd.DatetimeIndex(self.time.view('datetime64[ns]'), name='time'))
+        return df
+
+    # Legacy historic data dictionary, as received from dwx_client in live mode.
+    def to_dict(self):
+        date_times = pd.DatetimeIndex(self.time.view('datetime64[ns]')).strftime(HISTORIC_DICT_DATETIME_FORMAT)
+        return {date_time: {'open': float(self.open[i]), 'high': float(self.high[i]), 'low': float(self.low[i]),
+                            'close': float(self.close[i]), 'tick_volume': float(self.volume[i])}
+                for i, date_time in enumerate(date_times)}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data is None or len(data) == 0:
+            empty_prices = np.zeros(0, dtype='float64')
+            return cls(np.zeros(0, dtype='int64'), empty_prices, empty_prices, empty_prices, empty_prices,
+                       empty_prices)
+        times = pd.to_datetime(list(data.keys()), format=HISTORIC_DICT_DATETIME_FORMAT)
+        bars = list(data.values())
+        return cls(times.values.astype('datetime64[ns]').view('int64'),
+                   np.array([bar['open'] for bar in bars], dtype='float64'),
+                   np.array([bar['high'] for bar in bars], dtype='float64'),
+                   np.array([bar['low'] for bar in bars], dtype='float64'),
+                   np.array([bar['close'] for bar in bars], dtype='float64'),
+                   np.array([bar['tick_volume'] for bar in bars], dtype='float64'))
+
+
+def read_only_view(values):
+    view = np.asarray(values).view()
+    view.flags.writeable = False
+    return view
+
+
+# Normalizes the historic data received from any DMA (HistoricWindow in backtesting, dictionary in live mode).
+def to_historic_window(data):
+    if isinstance(data, HistoricWindow):
+        return data
+    return HistoricWindow.from_dict(data)
+
+
+# Fixed-capacity buffer with the last closed bars of a symbol_tf, seeded once from the historic data and then appended
+# from the bar data events. The bar of an event is appended once it is closed: live events deliver the last closed bar,
+# backtesting ones the bar just opened, which is kept as pending until the current time moves past it.
+# Storage has room for twice the capacity, so the window is always a contiguous view; the last bars are moved to the
+# front when the end is reached. Windows are only valid until the next append.
+class BarRingBuffer:
+    def __init__(self, timeframe, capacity):
+        self.timeframe = timeframe
+        self.capacity = capacity
+        self.delta_ns = get_timeframe_delta_ns(timeframe)
+        self.seeded = False
+        self._time = np.zeros(2 * capacity, dtype='int64')
+        self._values = np.zeros((len(BAR_VALUES), 2 * capacity), dtype='float64')
+        self._start = 0
+        self._end = 0
+        self._pending = None  # (time_ns, open, high, low, close, volume) of the bar not closed yet.
+
+    def __len__(self):
+        return self._end - self._start
+
+    def last_time(self):
+        return int(self._time[self._end - 1]) if self._end > self._start else None
+
+    # Replaces the content with the last capacity bars of the window.
+    def seed(self, window):
+        window = window.tail(self.capacity)
+        count = len(window)
+        self._time[:count] = window.time
+        for row, name in enumerate(BAR_VALUES):
+            self._values[row, :count] = getattr(window, name)
+        self._start = 0
+        self._end = count
+        self.seeded = True
+        if self._pending is not None and count > 0 and self._pending[0] <= self._time[count - 1]:
+            self._pending = None
+
+    def add_bar(self, date_time, open_price, high, low, close_price, volume, current_datetime):
+        bar = (to_bar_time_ns(date_time), float(open_price), float(high), float(low), float(close_price),
+               float(volume))
+        if self._pending is not None and self._pending[0] < bar[0]:
+            self._append(self._pending)
+            self._pending = None
+        if bar[0] < self._get_current_bar_time(current_datetime):
+            self._append(bar)
+        else:
+            self._pending = bar
+
+    # Appends the pending bar if it is closed and returns False when bars are missing up to the current one, so the
+    # buffer has to be seeded again from the data source. Weekend bars are not expected.
+    def update(self, current_datetime):
+        current_bar_time = self._get_current_bar_time(current_datetime)
+        if self._pending is not None and self._pending[0] < current_bar_time:
+            self._append(self._pending)
+            self._pending = None
+        if not self.seeded or self._end == self._start:
+            return False
+        return not has_missing_bars(self.last_time(), current_bar_time, self.delta_ns)
+
+    # Window of the buffered bars, only the ones with time >= start_datetime if given. The buffer holds a number of
+    # bars, so start_datetime trims it to the time span of a historic request.
+    def get_window(self, start_datetime=None):
+        start = self._start
+        end = self._end
+        if start_datetime is not None:
+            start += int(np.searchsorted(self._time[start:end], to_epoch_ns(start_datetime), side='left'))
+        return HistoricWindow(self._time[start:end], self._values[0, start:end], self._values[1, start:end],
+                              self._values[2, start:end], self._values[3, start:end], self._values[4, start:end])
+
+    def _get_current_bar_time(self, current_datetime):
+        current_ns = to_epoch_ns(current_datetime)
+        return current_ns - current_ns % self.delta_ns
+
+    def _append(self, bar):
+        if not self.seeded:
+            return
+        last_time = self.last_time()
+        if last_time is not None:
+            if bar[0] <= last_time:
+                return
+            if has_missing_bars(last_time, bar[0], self.delta_ns):
+                # Gap: the buffer is outdated until it is seeded again.
+                self.seeded = False
+                return
+        if self._end == len(self._time):
+            keep = self.capacity - 1
+            self._time[:keep] = self._time[self._end - keep:self._end]
+            self._values[:, :keep] = self._values[:, self._end - keep:self._end]
+            self._start = 0
+            self._end = keep
+        self._time[self._end] = bar[0]
+        self._values[:, self._end] = bar[1:]
+        self._end += 1
+        if self._end - self._start > self.capacity:
+            self._start += 1
+
+
+NS_PER_DAY = 24 * 60 * 60 * 1000000000
+
+
+# Live bar data times come as strings ('2024.02.22 10:00'), backtesting ones as timestamps.
+def to_bar_time_ns(date_time):
+    if isinstance(date_time, str):
+        return to_epoch_ns(datetime.strptime(date_time, HISTORIC_DICT_DATETIME_FORMAT))
+    return to_epoch_ns(date_time)
+
+
+# True if any bar opened in (last_time, next_time) falls on a weekday (1970-01-01 was a Thursday).
+def has_missing_bars(last_time, next_time, delta_ns):
+    missing_times = np.arange(last_time + delta_ns, next_time, delta_ns, dtype='int64')
+    return bool(np.any(((missing_times // NS_PER_DAY) + 3) % 7 < 5))
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+"""
+Performance metrics computed from the trade ledger (read_trade_ledger() / extract_dictionaries_from_file() frames).
+
+The trades are grouped by run and close date once (group-by + cumsum, no loop over the days): every run gets a daily
+calendar equity curve from its first to its last close date, NaN outside, so many runs (e.g. the sweep runs, told
+apart by run_column) are computed in one vectorized call. Without run_column all the trades are a single run and the
+results are a Series.
+
+Daily returns are relative to the previous day equity (the initial investment on the first day). Sharpe and Sortino
+are annualized with periods_per_year (365 by default, as the curve has a value every calendar day) and a zero
+risk-free rate. max_drawdown_perc is positive, e.g. 12.5 for a 12.5% drawdown from the equity peak.
+"""
+
+METRICS = ['trades', 'winning_trades', 'win_rate_perc', 'gross_profit', 'gross_loss', 'net_profit', 'expectancy',
+           'profit_factor', 'final_equity', 'total_return_perc', 'max_drawdown_perc', 'sharpe', 'sortino']
+
+
+def _get_runs(df_trades, run_column):
+    if run_column is None:
+        return pd.Series(0, index=df_trades.index)
+    return df_trades[run_column]
+
+
+def _get_investment(investment, runs):
+    if np.isscalar(investment):
+        return pd.Series(float(investment), index=runs)
+    return pd.Series(investment, dtype='float64').reindex(runs)
+
+
+def _to_result(df, run_column):
+    if run_column is None:
+        return df.iloc[:, 0] if len(df.columns) > 0 else pd.Series(dtype='float64', index=df.index)
+    return df
+
+
+# Daily pnl of every run (columns) by close date, 0.0 on the days without closes and NaN outside the run dates.
+def get_daily_pnl(df_trades, run_column=None):
+    if len(df_trades) == 0:
+        return pd.DataFrame(dtype='float64')
+    runs = _get_runs(df_trades, run_column)
+    close_dates = pd.to_datetime(df_trades['close_time']).dt.normalize()
+    daily_pnl = df_trades['pnl'].astype('float64').groupby([runs.values, close_dates.values]).sum().unstack(0)
+    dates = pd.date_range(daily_pnl.index.min(), daily_pnl.index.max())
+    daily_pnl = daily_pnl.reindex(dates)
+    first_dates = close_dates.groupby(runs.values).min().reindex(daily_pnl.columns).values
+    last_dates = close_dates.groupby(runs.values).max().reindex(daily_pnl.columns).values
+    day_values = dates.values[:, None]
+    inside = (day_values >= first_dates[None, :]) & (day_values <= last_dates[None, :])
+    return daily_pnl.fillna(0.0).where(inside)
+
+
+def _get_daily_equity(daily_pnl, investment):
+    return daily_pnl.cumsum().add(_get_investment(investment, daily_pnl.columns), axis=1)
+
+
+def _get_daily_returns(equity, investment):
+    previous_equity = equity.shift(1)
+    first_day = previous_equity.isna() & equity.notna()
+    previous_equity = previous_equity.mask(first_day, pd.DataFrame(
+        np.broadcast_to(_get_investment(investment, equity.columns).values, equity.shape), index=equity.index,
+        columns=equity.columns))
+    return equity / previous_equity - 1.0
+
+
+def _get_drawdown(equity, investment):
+    peak = np.maximum(equity.cummax(), _get_investment(investment, equity.columns).values[None, :])
+    return equity / peak - 1.0
+
+
+def get_daily_equity(df_trades, investment=100000.0, run_column=None):
+    return _to_result(_get_daily_equity(get_daily_pnl(df_trades, run_column), investment), run_column)
+
+
+def get_daily_returns(df_trades, investment=100000.0, run_column=None):
+    equity = _get_daily_equity(get_daily_pnl(df_trades, run_column), investment)
+    return _to_result(_get_daily_returns(equity, investment), run_column)
+
+
+# Drawdown curve: equity relative to its peak so far (the initial investment included), 0.0 or negative.
+def get_drawdown(df_trades, investment=100000.0, run_column=None):
+    equity = _get_daily_equity(get_daily_pnl(df_trades, run_column), investment)
+    return _to_result(_get_drawdown(equity, investment), run_column)
+
+
+# Metrics (METRICS) of every run: a DataFrame indexed by run, or a Series without run_column.
+# investment is a number, or a {run: investment} mapping/Series.
+def get_metrics(df_trades, investment=100000.0, run_column=None, periods_per_year=365):
+    runs = _get_runs(df_trades, run_column)
+    pnl = df_trades['pnl'].astype('float64')
+    by_run = pnl.groupby(runs.values)
+    metrics = pd.DataFrame({'trades': by_run.size()})
+    metrics['winning_trades'] = (pnl > 0.0).groupby(runs.values).sum()
+    metrics['win_rate_perc'] = 100.0 * metrics['winning_trades'] / metrics['trades']
+    metrics['gross_profit'] = pnl.clip(lower=0.0).groupby(runs.values).sum()
+    metrics['gross_loss'] = pnl.clip(upper=0.0).groupby(runs.values).sum()
+    metrics['net_profit'] = by_run.sum()
+    metrics['expectancy'] = metrics['net_profit'] / metrics['trades']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        metrics['profit_factor'] = np.where(metrics['gross_loss'] < 0.0,
+                                            metrics['gross_profit'] / -metrics['gross_loss'],
+                                            np.where(metrics['gross_profit'] > 0.0, np.inf, np.nan))
+    run_investment = _get_investment(investment, metrics.index)
+    metrics['final_equity'] = run_investment + metrics['net_profit']
+    metrics['total_return_perc'] = 100.0 * metrics['net_profit'] / run_investment
+
+    daily_pnl = get_daily_pnl(df_trades, run_column).reindex(columns=metrics.index)
+    equity = _get_daily_equity(daily_pnl, investment)
+    returns = _get_daily_returns(equity, investment)
+    metrics['max_drawdown_perc'] = -100.0 * _get_drawdown(equity, investment).min()
+    annualization = np.sqrt(periods_per_year)
+    mean_returns = returns.mean()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        metrics['sharpe'] = mean_returns / returns.std() * annualization
+        downside_deviation = np.sqrt((returns.clip(upper=0.0) ** 2).mean())
+        metrics['sortino'] = mean_returns / downside_deviation * annualization
+    # A flat equity curve (no deviation) has no Sharpe/Sortino.
+    metrics[['sharpe', 'sortino']] = metrics[['sharpe', 'sortino']].replace([np.inf, -np.inf], np.nan)
+    metrics = metrics[METRICS]
+    if run_column is None:
+        return metrics.iloc[0] if len(metrics) > 0 else pd.Series(np.nan, index=METRICS)
+    metrics.index.name = run_column
+    return metrics
+
+
+# Ranks the runs of a metrics table by the metric: 1 is the best, max_drawdown_perc lower is better, the rest higher.
+# Runs without the metric (NaN) are not ranked (<NA>).
+def rank_runs(metrics, rank_by='sharpe'):
+    ascending = rank_by == 'max_drawdown_perc'
+    return metrics[rank_by].rank(ascending=ascending, method='min', na_option='keep').astype('Int64')
+
+
+# Metrics of a daily equity curve (e.g. a daily returns file), without the trade level ones.
+def get_equity_metrics(equity, investment=None, periods_per_year=365):
+    equity = equity.astype('float64')
+    if investment is None:
+        investment = equity.iloc[0]
+    frame = equity.to_frame()
+    returns = _get_daily_returns(frame, investment).iloc[:, 0]
+    drawdown = _get_drawdown(frame, investment).iloc[:, 0]
+    annualization = np.sqrt(periods_per_year)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = returns.mean() / returns.std() * annualization
+        sortino = returns.mean() / np.sqrt((returns.clip(upper=0.0) ** 2).mean()) * annualization
+    sharpe, sortino = [value if np.isfinite(value) else np.nan for value in (sharpe, sortino)]
+    return pd.Series({'final_equity': equity.iloc[-1],
+                      'total_return_perc': 100.0 * (equity.iloc[-1] / investment - 1.0),
+                      'max_drawdown_perc': -100.0 * drawdown.min(),
+                      'sharpe': sharpe,
+                      'sortino': sortino})
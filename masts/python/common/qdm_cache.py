@@ -0,0 +1,138 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+from python.common.logging_config import logger
+
+"""
+Binary on-disk cache of the QuantDataManager csv exports.
+
+Every export is parsed once (in chunks) into one raw binary file per column plus a meta.json, inside a cache entry
+keyed by the source absolute path, size and modification time. Later loads memory-map the column files read-only,
+so they are zero-copy and several processes (e.g. sweep workers) share the same OS pages.
+
+Column layout: DateTime as int64 epoch nanoseconds (naive, broker time), integer columns (Volume) as int64 and the
+rest as float64. A changed export gets a new key; the stale entries of the same export (same resolved source path) are
+removed when the new one is built.
+"""
+
+CACHE_VERSION = 1
+CHUNK_ROWS = 1000000
+
+
+class QdmCache:
+    def __init__(self, cache_directory_path, chunk_rows=CHUNK_ROWS):
+        self.cache_directory_path = cache_directory_path
+        self.chunk_rows = chunk_rows
+        os.makedirs(cache_directory_path, exist_ok=True)
+
+    # Returns {'DateTime': int64 memmap, 'Open': float64 memmap, ...} with the csv columns.
+    def load_columns(self, file_name):
+        entry_path = self.get_entry_path(file_name)
+        if not os.path.exists(os.path.join(entry_path, 'meta.json')):
+            self._build_entry(file_name, entry_path)
+        with open(os.path.join(entry_path, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+        columns = {}
+        for column, dtype in meta['columns'].items():
+            column_file_name = os.path.join(entry_path, f'{column}.bin')
+            if meta['rows'] == 0:
+                columns[column] = np.zeros(0, dtype=dtype)
+            else:
+                columns[column] = np.memmap(column_file_name, dtype=dtype, mode='r', shape=(meta['rows'],))
+        return columns
+
+    # Same columns as load_columns() as a DataFrame (DateTime as datetime64[ns]).
+    def load_dataframe(self, file_name):
+        columns = self.load_columns(file_name)
+        df = pd.DataFrame({column: values for column, values in columns.items() if column != 'DateTime'})
+        df.insert(0, 'DateTime', columns['DateTime'].view('datetime64[ns]'))
+        return df
+
+    def _get_entry_name(self, file_name):
+        return os.path.splitext(os.path.basename(file_name))[0].replace(' ', '_')
+
+    def get_entry_path(self, file_name):
+        file_path = os.path.abspath(file_name)
+        stat = os.stat(file_path)
+        key = f'{CACHE_VERSION}|{file_path}|{stat.st_size}|{stat.st_mtime_ns}'
+        key_hash = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_directory_path, f'{self._get_entry_name(file_name)}-{key_hash}')
+
+    def _build_entry(self, file_name, entry_path):
+        logger.info(f"QdmCache -> building cache of {file_name}")
+        temp_path = tempfile.mkdtemp(dir=self.cache_directory_path, prefix='.building-')
+        try:
+            column_dtypes = None
+            column_files = {}
+            rows = 0
+            for df in pd.read_csv(file_name, chunksize=self.chunk_rows):
+                df = parse_qdm_chunk(df)
+                if column_dtypes is None:
+                    column_dtypes = {column: get_column_dtype(df, column) for column in df.columns}
+                    column_files = {column: open(os.path.join(temp_path, f'{column}.bin'), 'wb')
+                                    for column in column_dtypes}
+                for column, dtype in column_dtypes.items():
+                    values = df[column].values
+                    if column == 'DateTime':
+                        values = values.astype('datetime64[ns]').view('int64')
+                    column_files[column].write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+                rows += len(df)
+            for column_file in column_files.values():
+                column_file.close()
+            if column_dtypes is None:
+                logger.error(f"QdmCache -> {file_name} is empty!")
+                raise Exception(f"QdmCache -> {file_name} is empty!")
+            with open(os.path.join(temp_path, 'meta.json'), 'w') as file:
+                json.dump({'version': CACHE_VERSION, 'source': os.path.abspath(file_name), 'rows': rows,
+                           'columns': column_dtypes}, file)
+            try:
+                os.replace(temp_path, entry_path)
+            except OSError:
+                # Another process built the same entry meanwhile.
+                if not os.path.exists(os.path.join(entry_path, 'meta.json')):
+                    raise
+                shutil.rmtree(temp_path, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+        self._remove_stale_entries(file_name, entry_path)
+        logger.info(f"QdmCache -> {rows} rows of {file_name} cached in {entry_path}")
+
+    # Entries of the same source file (resolved path in meta.json), exports with the same name in other directories
+    # keep theirs.
+    def _remove_stale_entries(self, file_name, entry_path):
+        entry_name = self._get_entry_name(file_name)
+        source_path = os.path.realpath(file_name)
+        for name in os.listdir(self.cache_directory_path):
+            path = os.path.join(self.cache_directory_path, name)
+            if name.rsplit('-', 1)[0] != entry_name or path == entry_path:
+                continue
+            try:
+                with open(os.path.join(path, 'meta.json'), 'r') as file:
+                    entry_source_path = os.path.realpath(json.load(file)['source'])
+            except (OSError, ValueError, KeyError):
+                continue
+            if entry_source_path == source_path:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+# Parses a chunk of a QDM export into a DateTime column plus the remaining columns.
+# Bar exports have Date (yyyymmdd) and Time (HH:MM:SS) columns, tick exports a DateTime (yyyymmdd HH:MM:SS.fff) one.
+def parse_qdm_chunk(df):
+    if 'Date' in df.columns:
+        date_times = pd.to_datetime(df['Date'].astype(str) + ' ' + df['Time'], format='%Y%m%d %H:%M:%S')
+        df = df.drop(['Date', 'Time'], axis=1)
+        df.insert(0, 'DateTime', date_times)
+    else:
+        df['DateTime'] = pd.to_datetime(df['DateTime'], format='%Y%m%d %H:%M:%S.%f')
+    return df
+
+
+def get_column_dtype(df, column):
+    if column == 'DateTime' or pd.api.types.is_integer_dtype(df[column]):
+        return 'int64'
+    return 'float64'
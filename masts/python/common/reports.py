@@ -2,30 +2,45 @@ from python.common.logging_config import logger
 from python.common.files import extract_dictionaries_from_file, load_qdm_data_from_file
 from pathlib import Path
 from python.common.files import get_daily_returns_from_file
-import quantstats as qs
+from python.common.metrics import get_equity_metrics
 import pandas as pd
 import json
 
-def generate_report_metrics(symbol, returns_filename):
+
+# Writes the native metrics of a daily returns file (daily equity, see generate_daily_returns_file()) next to it, e.g.
+# trades_..._EURUSD_report_metrics.json for trades_..._EURUSD_returns.json. html=True also generates the quantstats
+# html report (quantstats is only imported then).
+def generate_report_metrics(symbol, returns_filename, html=False):
     if Path(returns_filename).exists():
-        qs.extend_pandas()
         # Load returns from file.
-        df_returns = get_daily_returns_from_file(returns_filename)
-
-        # generate full metric report
-        #report_file_name = returns_filename[:-4] + f'_report_metrics_full.json'
-        #df_metrics = qs.reports.metrics(df_returns, "SPY", mode='full', display=False)
-        #df_metrics.to_json(report_file_name)
-
-        # Generate html report to file.
-        returns_file_name = returns_filename[:-4] + f'_{symbol}_report_full.html'
-        result = qs.reports.html(df_returns, "SPY", output=returns_file_name)
-        dummy = 1
-        # # Example: load existent report and access to a metric
-        # df_new = pd.read_json(report_file_name)
-        # strategy_sharpe = df_new['Strategy']['Sharpe']
-        # benchmark_sharpe = df_new['Benchmark (SPY)']['Sharpe']
-        # # End example
+        df_equity = get_daily_returns_from_file(returns_filename)
+        if len(df_equity) == 0:
+            return None
+        metrics = get_equity_metrics(df_equity)
+        report_file_stem = get_report_file_stem(symbol, returns_filename)
+        report_file_name = f'{report_file_stem}_report_metrics.json'
+        with open(report_file_name, 'w') as file:
+            json.dump({key: (None if pd.isna(value) else float(value)) for key, value in metrics.items()}, file,
+                      indent=4)
+
+        if html:
+            import quantstats as qs
+            # Generate html report to file.
+            returns_file_name = f'{report_file_stem}_report_full.html'
+            qs.reports.html(df_equity.pct_change().dropna(), "SPY", output=returns_file_name)
+        return report_file_name
+    return None
+
+
+# Returns file name without the extension and the _returns suffix, ending with the symbol (generate_daily_returns_file()
+# names already do).
+def get_report_file_stem(symbol, returns_filename):
+    stem = str(Path(returns_filename).with_suffix(''))
+    if stem.endswith('_returns'):
+        stem = stem[:-len('_returns')]
+    if not stem.endswith(f'_{symbol}'):
+        stem = f'{stem}_{symbol}'
+    return stem
 
 def get_trade_returns_old(bars_data, trade_info):
     start_date = trade_info['open_time']
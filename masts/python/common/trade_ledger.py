@@ -0,0 +1,132 @@
+import re
+import ast
+import json
+import numpy as np
+import pandas as pd
+from threading import Lock
+from python.api.json_decoder import get_json_decoder
+
+"""
+Trades file (ledger) of a tick_processor run.
+
+Every closed trade is one JSON line with the fixed schema TRADE_LEDGER_SCHEMA, always with the same keys, order and
+separators. TradeLedgerWriter buffers the lines and appends them every flush_rows trades and on flush()/close().
+
+read_trade_ledger() returns the trades as a DataFrame with the schema dtypes (open_time/close_time as datetime64).
+The symbol and magic filters are checked on the raw line text before decoding it, so the trades of other symbols
+are never parsed. Files of the legacy format (one str(dict) per line, read with ast.literal_eval, possibly with
+numpy scalar reprs such as np.float64(1.1)) are still read, line by line, so a file can even mix both formats.
+"""
+
+TRADE_LEDGER_SCHEMA = {'ticket_no': 'int64', 'symbol': 'str', 'type': 'str', 'lots': 'float64', 'price': 'float64',
+                       'SL': 'float64', 'TP': 'float64', 'magic': 'int64', 'comment': 'str', 'expiration': 'int64',
+                       'open_time': 'datetime', 'close_time': 'datetime', 'commission': 'float64',
+                       'taxes': 'float64', 'swap': 'float64', 'pnl': 'float64', 'status': 'str',
+                       'open_price': 'float64', 'close_price': 'float64'}
+TRADE_LEDGER_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+NUMPY_SCALAR_REPR = re.compile(r'np\.(?:float|int|uint)\d*\(([^()]*)\)')
+NUMPY_BOOL_REPR = re.compile(r'np\.(True|False)_')
+
+
+# Trade data (backtesting or tick_processor live trade) as a record of the schema. Missing or invalid values get the
+# default of their type (0, 0.0, '' or None for the times).
+def to_trade_record(trade_data):
+    record = {}
+    for column, dtype in TRADE_LEDGER_SCHEMA.items():
+        value = trade_data.get(column)
+        try:
+            if dtype == 'datetime':
+                value = value if value is None or isinstance(value, str) else \
+                    value.strftime(TRADE_LEDGER_DATETIME_FORMAT)
+            elif dtype == 'int64':
+                value = int(value) if value is not None else 0
+            elif dtype == 'float64':
+                value = float(value) if value is not None else 0.0
+            elif column == 'status':
+                value = getattr(value, 'name', value) or ''
+            else:
+                value = str(value) if value is not None else ''
+        except (TypeError, ValueError):
+            value = None if dtype == 'datetime' else 0 if dtype == 'int64' else 0.0 if dtype == 'float64' else ''
+        record[column] = value
+    return record
+
+
+def to_trade_line(trade_data):
+    return json.dumps(to_trade_record(trade_data)) + '\n'
+
+
+class TradeLedgerWriter:
+    def __init__(self, filename, flush_rows=1000):
+        self.filename = filename
+        self.flush_rows = flush_rows
+        self._lines = []
+        self._lock = Lock()
+
+    def add(self, trade_data):
+        line = to_trade_line(trade_data)
+        with self._lock:
+            self._lines.append(line)
+            if len(self._lines) >= self.flush_rows:
+                self._write()
+
+    def flush(self):
+        with self._lock:
+            self._write()
+
+    def close(self):
+        self.flush()
+
+    def _write(self):
+        if len(self._lines) > 0:
+            with open(self.filename, 'a') as file:
+                file.writelines(self._lines)
+            self._lines = []
+
+
+# Trades of the file with the schema columns, only the ones of symbol and magic if given.
+def read_trade_ledger(filename, symbol=None, magic=None):
+    json_loads = get_json_decoder()
+    # Text of the filtered values in a JSON line (magic is never the last key).
+    json_tokens = []
+    if symbol is not None:
+        json_tokens.append(f'"symbol": {json.dumps(symbol)}')
+    if magic is not None:
+        json_tokens.append(f'"magic": {int(magic)},')
+    columns = {column: [] for column in TRADE_LEDGER_SCHEMA}
+    with open(filename, 'r') as file:
+        for line in file:
+            if line.startswith('{"'):
+                if not all(token in line for token in json_tokens):
+                    continue
+                record = json_loads(line)
+            else:
+                record = parse_legacy_trade_line(line)
+                if record is None or (symbol is not None and record.get('symbol') != symbol) or \
+                        (magic is not None and record.get('magic') != magic):
+                    continue
+                record = to_trade_record(record)
+            for column, values in columns.items():
+                values.append(record[column])
+    return pd.DataFrame({column: get_column_values(values, TRADE_LEDGER_SCHEMA[column])
+                         for column, values in columns.items()})
+
+
+def parse_legacy_trade_line(line):
+    line = line.strip()
+    if len(line) == 0:
+        return None
+    if 'np.' in line:
+        line = NUMPY_BOOL_REPR.sub(r'\1', NUMPY_SCALAR_REPR.sub(r'\1', line))
+    try:
+        return ast.literal_eval(line)
+    except (SyntaxError, ValueError):
+        return None
+
+
+def get_column_values(values, dtype):
+    if dtype == 'datetime':
+        return pd.to_datetime(pd.Series(values, dtype='object'), format=TRADE_LEDGER_DATETIME_FORMAT)
+    if dtype == 'str':
+        return pd.Series(values, dtype='object')
+    return np.asarray(values, dtype=dtype)
@@ -0,0 +1,204 @@
+import os
+import sys
+import copy
+import json
+import shutil
+import tempfile
+from collections import deque
+import numpy as np
+import pandas as pd
+from time import sleep, perf_counter
+from datetime import datetime
+from threading import Thread
+from python.common.logging_config import setup_logging, logger
+from python.api.dwx_client import dwx_client
+from python.api.dwx_server_emulator import DwxServerEmulator, synthetic_tick_source, qdm_tick_source, \
+    recorded_tick_source
+
+"""
+Throughput/latency harness of the live path, run against DwxServerEmulator instead of a MetaTrader terminal.
+
+Every step of the config plays ticks at ticks_per_second for duration_seconds while commands are sent at
+commands_per_second, with either a plain dwx_client counting the events ('client') or a live tick_processor built from
+tick_processor_params ('tick_processor'). Per step it reports:
+    - ticks written by the emulator and received through on_tick(); the difference are quotes overwritten before being
+      read (the market data file only holds the last one), i.e. dropped updates.
+    - tick latency (file written -> on_tick() called) percentiles.
+    - commands sent and executed by the emulator, and command latency (send_command() -> executed) percentiles.
+    - late_ticks: ticks the emulator itself could not write on time (the machine, not the client, is saturated).
+The results table is saved as csv into output_directory_path.
+"""
+
+
+class TickCounter:
+    def __init__(self):
+        self.tick_times = {}  # {(symbol, bid, ask): deque of perf_counter times of on_tick()}
+
+    def record_tick(self, symbol, bid, ask):
+        self.tick_times.setdefault((symbol, bid, ask), deque()).append(perf_counter())
+
+    # Latencies of the written ticks (tick_log entries, in order) received. A quote can be repeated, so every write is
+    # matched with the first later on_tick() of the same quote not matched yet.
+    def get_tick_latencies(self, ticks_written):
+        latencies = []
+        for write_time, symbol, bid, ask in ticks_written:
+            receive_times = self.tick_times.get((symbol, bid, ask))
+            while receive_times and receive_times[0] < write_time:
+                receive_times.popleft()
+            if receive_times:
+                latencies.append(receive_times.popleft() - write_time)
+        return latencies
+
+    def on_tick(self, symbol, bid, ask):
+        self.record_tick(symbol, bid, ask)
+
+    def on_bar_data(self, symbol, time_frame, time, open_price, high, low, close_price, tick_volume):
+        pass
+
+    def on_historic_data(self, symbol, time_frame, data):
+        pass
+
+    def on_historic_trades(self):
+        pass
+
+    def on_trade_closed(self, ticket_no, trade_data):
+        pass
+
+    def on_message(self, message):
+        pass
+
+    def on_order_event(self):
+        pass
+
+
+def get_percentiles_ms(values):
+    if len(values) == 0:
+        return None, None, None
+    values_ms = np.asarray(values) * 1000.0
+    return tuple(round(float(value), 3) for value in np.percentile(values_ms, [50, 99, 100]))
+
+
+def create_tick_source(step_config, symbols):
+    tick_source = step_config.get('tick_source', 'synthetic')
+    if tick_source == 'synthetic':
+        return synthetic_tick_source(symbols, seed=step_config.get('seed', 0))
+    elif tick_source == 'qdm':
+        return qdm_tick_source(step_config['qdm_directory_path'], symbols[0],
+                               datetime.strptime(step_config['qdm_start'], '%Y-%m-%d %H:%M:%S'),
+                               datetime.strptime(step_config['qdm_end'], '%Y-%m-%d %H:%M:%S'))
+    elif tick_source == 'recorded':
+        return recorded_tick_source(step_config['recorded_directory_path'], symbols,
+                                    datetime.strptime(step_config['recorded_start'], '%Y-%m-%d %H:%M:%S'),
+                                    datetime.strptime(step_config['recorded_end'], '%Y-%m-%d %H:%M:%S'))
+    logger.error(f"create_tick_source() -> unknown tick_source: {tick_source}")
+    raise Exception(f"Unknown tick_source: {tick_source}")
+
+
+def send_commands(client, commands_per_second, duration_seconds, send_times):
+    if commands_per_second <= 0:
+        return
+    interval = 1.0 / commands_per_second
+    end_time = perf_counter() + duration_seconds
+    next_time = perf_counter()
+    while next_time < end_time:
+        # Modifying a ticket that does not exist only produces an error message on the mql side.
+        send_time = perf_counter()
+        future = client.modify_order(999999999, 0.01, 0, 0, 0)
+        send_times[future.command_id] = send_time
+        next_time += interval
+        sleep(max(0.0, next_time - perf_counter()))
+
+
+def run_load_step(step_config, symbols, handler='client', tick_processor_params=None):
+    directory_path = tempfile.mkdtemp(prefix='dwx_load_test_')
+    ticks_per_second = step_config['ticks_per_second']
+    duration_seconds = step_config.get('duration_seconds', 10)
+    commands_per_second = step_config.get('commands_per_second', 0)
+    emulator = DwxServerEmulator(directory_path, create_tick_source(step_config, symbols), ticks_per_second,
+                                 time_delta_hours=(tick_processor_params or {}).get('time_delta_hours', 0))
+    emulator.start()
+    counter = TickCounter()
+    client = None
+    try:
+        if handler == 'tick_processor':
+            from smart_trader import tick_processor
+            parameters = copy.deepcopy(tick_processor_params)
+            parameters.update(mode='live', MT4_directory_path=directory_path, verbose=False,
+                              output_directory_path=directory_path)
+            processor = tick_processor(**parameters)
+            client = processor.dma
+            processor_on_tick = processor.on_tick
+
+            def on_tick(symbol, bid, ask):
+                processor_on_tick(symbol, bid, ask)
+                counter.record_tick(symbol, bid, ask)
+            processor.on_tick = on_tick
+        else:
+            client = dwx_client(counter, directory_path, verbose=False)
+            client.subscribe_symbols(symbols)
+            client.subscribe_symbols_bar_data([[symbol, 'M1'] for symbol in symbols])
+            client.start()
+        # Ticks are counted once the subscriptions are active.
+        while len(emulator.tick_log) == 0:
+            sleep(0.01)
+        first_tick_index = len(emulator.tick_log)
+        send_times = {}
+        commands_thread = Thread(target=send_commands, args=(client, commands_per_second, duration_seconds,
+                                                             send_times))
+        commands_thread.start()
+        sleep(duration_seconds)
+        commands_thread.join()
+        last_tick_index = len(emulator.tick_log)
+        sleep(0.5)  # let the last events arrive.
+    finally:
+        emulator.stop()
+        if client is not None:
+            client.ACTIVE = False
+            client.command_writer.close()
+
+    ticks_written = list(emulator.tick_log)[first_tick_index:last_tick_index]
+    tick_latencies = counter.get_tick_latencies(ticks_written)
+    command_latencies = [emulator.command_times[command_id] - send_time
+                         for command_id, send_time in send_times.items() if command_id in emulator.command_times]
+    tick_p50, tick_p99, tick_max = get_percentiles_ms(tick_latencies)
+    command_p50, command_p99, command_max = get_percentiles_ms(command_latencies)
+    shutil.rmtree(directory_path, ignore_errors=True)
+    result = {'handler': handler, 'ticks_per_second': ticks_per_second, 'commands_per_second': commands_per_second,
+              'duration_seconds': duration_seconds, 'ticks_written': len(ticks_written),
+              'ticks_received': len(tick_latencies),
+              'ticks_dropped_perc': round(100.0 * (1 - len(tick_latencies) / max(1, len(ticks_written))), 2),
+              'tick_latency_p50_ms': tick_p50, 'tick_latency_p99_ms': tick_p99, 'tick_latency_max_ms': tick_max,
+              'commands_sent': len(send_times), 'commands_executed': len(command_latencies),
+              'command_latency_p50_ms': command_p50, 'command_latency_p99_ms': command_p99,
+              'command_latency_max_ms': command_max, 'late_ticks': emulator.stats['late_ticks']}
+    logger.info(f"run_load_step() -> {result}")
+    return result
+
+
+def run_load_test(load_test_config, tick_processor_params=None):
+    symbols = load_test_config.get('symbols', ['EURUSD'])
+    handler = load_test_config.get('handler', 'client')
+    results = [run_load_step(step_config, symbols, handler, tick_processor_params)
+               for step_config in load_test_config['steps']]
+    df_results = pd.DataFrame(results)
+    output_directory_path = load_test_config.get('output_directory_path', '../output')
+    os.makedirs(output_directory_path, exist_ok=True)
+    results_file_name = f'{output_directory_path}/dwx_load_test_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    df_results.to_csv(results_file_name, index=False)
+    logger.info(f"run_load_test() -> results saved to {results_file_name}")
+    return df_results
+
+
+if __name__ == '__main__':
+    setup_logging()
+    load_test_config_file_path = sys.argv[1] if len(sys.argv) > 1 else "dwx_load_test.config"
+    with open(load_test_config_file_path, "r") as file:
+        load_test_config = json.load(file)
+    tick_processor_params = None
+    if load_test_config.get('handler') == 'tick_processor':
+        with open(load_test_config['base_config_file_path'], "r") as file:
+            tick_processor_params = json.load(file)['tick_processor_params']
+    df = run_load_test(load_test_config, tick_processor_params)
+    pd.set_option('display.width', 250)
+    pd.set_option('display.max_columns', 30)
+    print(df)
@@ -0,0 +1,233 @@
+import math
+import numpy as np
+from collections import deque
+
+"""
+Streaming indicators: state objects updated once per closed bar at O(1) cost, usable in live and backtesting mode.
+
+Every update() returns the current value (NaN while the indicator is warming up) and matches the batch
+implementation fed with the same bars: talib.EMA (SMA seed, leading NaNs skipped), talib.ATR (Wilder smoothing,
+period 1 is the true range), pandas rolling max/min/sum, choppiness_index.calculate() and the zero-lag EMAs of
+macd_platinum_v2.
+
+WindowEma gives talib.EMA computed over a sliding window (seeded again at the window start on every call, as the
+strategies computing it over their historic window do) without recomputing the window.
+"""
+
+
+class Ema:
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.value = math.nan
+        self._seed_sum = 0.0
+        self._seed_count = 0
+
+    def update(self, x):
+        if math.isnan(x):
+            # Only leading NaNs are expected (input from another indicator still warming up).
+            return self.value
+        if self._seed_count < self.period:
+            self._seed_sum += x
+            self._seed_count += 1
+            if self._seed_count == self.period:
+                self.value = self._seed_sum / self.period
+        else:
+            self.value = self.value + self.alpha * (x - self.value)
+        return self.value
+
+
+# talib.EMA over a window of the bars fed with update(), whatever the window start. For t >= s + period - 1 (s the
+# window start) the window EMA is G_t + decay^(t - s - period + 1) * (SMA of the first period closes - G_(s+period-1)),
+# G being the EMA filter started from 0 at the first bar fed: G is kept per bar, so get_window_values() costs O(count).
+class WindowEma:
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.decay = 1.0 - self.alpha
+        self._times = deque()
+        self._filter_values = deque()
+        self._filter_value = 0.0
+
+    def update(self, time, x):
+        self._filter_value = self.decay * self._filter_value + self.alpha * x
+        self._times.append(time)
+        self._filter_values.append(self._filter_value)
+
+    # True if the bars fed end with the window ones (the oldest bars not in the window any more are dropped).
+    def covers(self, window_times):
+        while len(self._times) > len(window_times):
+            self._times.popleft()
+            self._filter_values.popleft()
+        return len(self._times) == len(window_times) and \
+            (len(window_times) == 0 or (self._times[0] == window_times[0] and self._times[-1] == window_times[-1]))
+
+    # Last count values of talib.EMA(window_closes, period), NaN where the EMA is still warming up. The window must be
+    # covered (see covers()).
+    def get_window_values(self, window_closes, count):
+        seed_index = self.period - 1
+        size = len(window_closes)
+        if size <= seed_index:
+            return [math.nan] * count
+        seed_error = float(np.mean(window_closes[:self.period])) - self._filter_values[seed_index]
+        values = []
+        for t in range(size - count, size):
+            if t < seed_index:
+                values.append(math.nan)
+            else:
+                values.append(self._filter_values[t] + self.decay ** (t - seed_index) * seed_error)
+        return values
+
+
+class ZeroLagEma:
+    def __init__(self, period):
+        self.ema1 = Ema(period)
+        self.ema2 = Ema(period)
+        self.value = math.nan
+
+    def update(self, x):
+        ema1 = self.ema1.update(x)
+        ema2 = self.ema2.update(ema1)
+        self.value = 2 * ema1 - ema2
+        return self.value
+
+
+class TrueRange:
+    def __init__(self):
+        self.value = math.nan
+        self._previous_close = None
+
+    def update(self, high, low, close):
+        if self._previous_close is not None:
+            self.value = max(high, self._previous_close) - min(low, self._previous_close)
+        self._previous_close = close
+        return self.value
+
+
+class Atr:
+    def __init__(self, period):
+        self.period = period
+        self.true_range = TrueRange()
+        self.value = math.nan
+        self._seed_sum = 0.0
+        self._seed_count = 0
+
+    def update(self, high, low, close):
+        true_range = self.true_range.update(high, low, close)
+        if math.isnan(true_range):
+            return self.value
+        if self._seed_count < self.period:
+            self._seed_sum += true_range
+            self._seed_count += 1
+            if self._seed_count == self.period:
+                self.value = self._seed_sum / self.period
+        else:
+            self.value = (self.value * (self.period - 1) + true_range) / self.period
+        return self.value
+
+
+# Rolling maximum over the last period values with a monotonic deque of (index, value).
+class RollingMax:
+    def __init__(self, period):
+        self.period = period
+        self.value = math.nan
+        self._window = deque()
+        self._count = 0
+
+    def _dominates(self, old_value, x):
+        return old_value <= x
+
+    def update(self, x):
+        while self._window and self._dominates(self._window[-1][1], x):
+            self._window.pop()
+        self._window.append((self._count, x))
+        if self._window[0][0] <= self._count - self.period:
+            self._window.popleft()
+        self._count += 1
+        self.value = self._window[0][1] if self._count >= self.period else math.nan
+        return self.value
+
+
+class RollingMin(RollingMax):
+    def _dominates(self, old_value, x):
+        return old_value >= x
+
+
+# Rolling sum over the last period values; NaN while any of them is NaN (pandas rolling().sum()).
+class RollingSum:
+    def __init__(self, period):
+        self.period = period
+        self.value = math.nan
+        self._window = deque()
+        self._sum = 0.0
+        self._nan_count = 0
+
+    def update(self, x):
+        self._window.append(x)
+        if math.isnan(x):
+            self._nan_count += 1
+        else:
+            self._sum += x
+        if len(self._window) > self.period:
+            old = self._window.popleft()
+            if math.isnan(old):
+                self._nan_count -= 1
+            else:
+                self._sum -= old
+        if len(self._window) == self.period and self._nan_count == 0:
+            self.value = self._sum
+        else:
+            self.value = math.nan
+        return self.value
+
+
+# Same defaults as choppiness_index.calculate(): ATR of 1 period (true range) and scalar 100.
+class Choppiness:
+    def __init__(self, length=14, atr_length=1, scalar=100.0):
+        self.length = length
+        self.scalar = scalar
+        self.atr = Atr(atr_length)
+        self.highest = RollingMax(length)
+        self.lowest = RollingMin(length)
+        self.atr_sum = RollingSum(length)
+        self.value = math.nan
+
+    def update(self, high, low, close):
+        diff = self.highest.update(high) - self.lowest.update(low)
+        atr_sum = self.atr_sum.update(self.atr.update(high, low, close))
+        if math.isnan(diff) or math.isnan(atr_sum):
+            self.value = math.nan
+        elif diff == 0.0 or atr_sum == 0.0:
+            # Division and log10 of numpy as the pandas version: inf for a flat range, NaN for 0/0, -inf for log10(0).
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.value = float(self.scalar * np.log10(np.float64(atr_sum) / np.float64(diff)) /
+                                   math.log10(self.length))
+        else:
+            self.value = self.scalar * math.log10(atr_sum / diff) / math.log10(self.length)
+        return self.value
+
+
+# MACD lines of macd_platinum_v2.calculate_macd(): (blueMACD, orgMACD, hist).
+class MacdPlatinum:
+    def __init__(self, fast_length=12, slow_length=26, signal_length=9):
+        self.fast = ZeroLagEma(fast_length)
+        self.slow = ZeroLagEma(slow_length)
+        self.signal = ZeroLagEma(signal_length)
+        self.value = (math.nan, math.nan, math.nan)
+
+    def update(self, close):
+        blue_macd = (self.fast.update(close) - self.slow.update(close)) * 10.0
+        org_macd = self.signal.update(blue_macd)
+        self.value = (blue_macd, org_macd, blue_macd - org_macd)
+        return self.value
+
+
+# Index of the first bar of the window not fed yet to indicators that already received the bar opened at last_time,
+# or None when the window does not contain last_time (first window, gap or re-seed) and the indicators must restart.
+def get_new_bars_start(window_times, last_time):
+    if last_time is None:
+        return None
+    position = int(np.searchsorted(window_times, last_time, side='left'))
+    if position < len(window_times) and window_times[position] == last_time:
+        return position + 1
+    return None
@@ -2,6 +2,7 @@ from time import sleep
 from random import random
 from datetime import datetime, timedelta
 from api.dwx_client import dwx_client
+from python.api.historic_requests import when_all_done
 from indicators.macd_platinum_v2 import macd_platinum_v2
 from python.common.conversions import convert_periods_to_datetime_range, \
     get_lasts_from_dictionary
@@ -10,9 +11,14 @@ from backtesting.backtesting import backtesting
 import json
 from python.strategies.divergent_t1 import DivergentT1
 from python.strategies.istrategy import IStrategy, SignalType, MarketTrend
-from python.common.output import add_trade_to_file
-from python.common.graphics import graph_trading_results
-from python.common.calculus import calculate_trailing_stop, get_pip_value
+from python.common.trade_ledger import TradeLedgerWriter
+from python.common.calculus import calculate_trailing_stop, get_pip_value, set_fx_rates
+from python.common.fx_rates import FxRates
+from python.common.qdm_cache import QdmCache
+from python.common.data_catalog import DataCatalog, get_catalog_file_name
+from python.common.feed_recorder import FeedRecorder
+from python.backtesting.order_book import OrderStatus
+from python.common.historic_window import to_historic_window, BarRingBuffer
 from python.common.risk_management import RiskManagement
 
 """
@@ -37,6 +43,15 @@ Please only run this on a demo account!
 """
 
 
+# Headroom of the bar buffers over max_bars: the margin of periods convert_periods_to_datetime_range() adds to the
+# historic requests (EMA warm-up).
+HISTORIC_BARS_MARGIN = 100
+# Days of historic trades requested on every close in live mode: the whole history, as before, so a trade whose close
+# was not seen in time is still delivered. dwx_client only informs the tickets not delivered yet.
+HISTORIC_TRADES_LOOKBACK_DAYS = 100000
+DWX_TRADE_DATETIME_FORMAT = '%Y.%m.%d %H:%M:%S'
+
+
 class tick_processor():
 
     def __init__(self, mode,
@@ -48,26 +63,40 @@ class tick_processor():
                  back_test_leverage=None,
                  back_test_execution_commission_rate=0.005,
                  back_test_spread_pips=1.0,
+                 back_test_fx_rates_file_name=None,
+                 back_test_cache_directory_path='../cache',  # None to parse the QDM csv files on every run.
+                 back_test_catalog_file_name=None,  # DataCatalog file, by default in the cache directory (if any).
+                 back_test_tick_margin_hours=24,  # ticks loaded before/after the backtest window.
+                 back_test_tick_price_dtype='float64',  # 'float32' halves the tick data memory.
+                 back_test_recorded_ticks_directory_path=None,  # FeedRecorder directory to replay instead of the QDM ticks.
+                 back_test_headless=False,  # True to save charts as files instead of interactive windows.
+                 back_test_post_processing_tasks=None,  # ['returns', 'chart'] by default.
+                 back_test_async_post_processing=False,
                  MT4_directory_path=None,
                  time_delta_hours=5,
                  sleep_delay=0.005,  # 5 ms for time.sleep()
                  max_retry_command_seconds=10,  # retry to send the command for 10 seconds if not successful.
                  verbose=True,
+                 live_feed_recorder_directory_path=None,  # directory to record every tick and bar received, None to not record.
                  balance_initial_amount=0.0,
                  balance_currency="EUR",
                  max_risk_perc=5.0,
                  max_drawdown_perc=20.0,
-                 strategies=None
+                 strategies=None,
+                 output_filename=None,
+                 output_directory_path='../output'
                  ):
         self.validate_parameters(mode, back_test_start, back_test_end, back_test_directory_path, MT4_directory_path)
 
         # store params
         self.mode = mode
-        self.back_test_start = datetime.strptime(back_test_start, '%Y-%m-%d %H:%M:%S')
-        self.back_test_end = datetime.strptime(back_test_end, '%Y-%m-%d %H:%M:%S')
+        self.back_test_start = datetime.strptime(back_test_start, '%Y-%m-%d %H:%M:%S') if back_test_start else None
+        self.back_test_end = datetime.strptime(back_test_end, '%Y-%m-%d %H:%M:%S') if back_test_end else None
         self.back_test_directory_path = back_test_directory_path
         self.back_test_execution_commission_rate = back_test_execution_commission_rate
         self.back_test_spread_pips = back_test_spread_pips
+        self.back_test_fx_rates_file_name = back_test_fx_rates_file_name
+        self.back_test_cache_directory_path = back_test_cache_directory_path
         self.MT4_directory_path = MT4_directory_path
         self.sleep_delay = sleep_delay
         self.max_retry_command_seconds = max_retry_command_seconds
@@ -87,18 +116,53 @@ class tick_processor():
         self.stop_trading = False
         self.minute_counter = 0
         self.historic_request_last_timestamp = {}  # Used to control when all historic requests for a symbol were completed to inform the strategies related.
-        self.historic_data = {}  # {'EURUSD_H4': {'timestamp': 97779788, 'data': data}, 'GBPUSD': {'timestamp': 97779788, 'data': data}}
+        self.historic_data = {}  # {'EURUSD_H4': {'timestamp': 97779788, 'data': HistoricWindow}, 'GBPUSD': {'timestamp': 97779788, 'data': HistoricWindow}}
+        self.bar_buffers = {}  # {'EURUSD_H4': BarRingBuffer} last bars of every required symbol_tf, updated from the bar data events.
+        self.historic_data_futures = {}  # {'EURUSD_H4': HistoricDataFuture} last live mode historic request of each symbol_tf.
         self.required_suscriptions = {}  # {'EURUSD_H4': ['strategy_id1', 'strategy_id2',..., 'strategy_idn'], 'GBPUSD_M5': ['strategy_idx1', 'strategy_idx2',..., 'strategy_idn']}
         self.required_historic_bars = {}  # {'EURUSD_H4': {'max_bars': 240, 'strategies': {'strategy_id1': bars. 'strategy_id2': bars2}}}
         self.strategies_instances = {}  # {strategy.id: {'instance': instance, 'params': params}}
+        # Routing tables built once in init_strategies(), so the event dispatch is a dictionary lookup.
+        self.strategies_by_symbol = {}  # {'EURUSD': [instance1, instance2]} strategies informed of the ticks of the symbol.
+        self.historic_symbol_tfs_by_symbol = {}  # {'EURUSD': ['EURUSD_H4', 'EURUSD_H1', 'EURUSD_M15', 'EURUSD_M1']} required historic data of the symbol.
+        self.strategies_by_signal_symbol_tf = {}  # {'EURUSD_M1': [instance1]} strategies checking signals on the bars of the symbol_tf.
+        self.strategies_by_trend_symbol_tf = {}  # {'EURUSD_M15': [instance1, instance2]} strategies calculating the trend on the bars of the symbol_tf.
         self.orders = {}
-        self.output_filename = f'../output/trades_{datetime.now().strftime("%Y%m%d_%H%M%S")}_{self.mode}.txt'
-        self.output_next_trade_index = 0
+        self.output_directory_path = output_directory_path
+        if output_filename is None:
+            output_filename = f'{output_directory_path}/trades_{datetime.now().strftime("%Y%m%d_%H%M%S")}_{self.mode}.txt'
+        self.output_filename = output_filename
+        # Live trades are written one by one, backtesting ones in blocks (and on the backtest end).
+        self.trade_ledger_writer = TradeLedgerWriter(output_filename, flush_rows=1 if mode == 'live' else 1000)
+
+        # binary cache of the QDM csv files, shared by all the backtests using the same cache directory.
+        self.qdm_cache = None
+        if self.mode == "backtest" and back_test_cache_directory_path is not None:
+            self.qdm_cache = QdmCache(back_test_cache_directory_path)
+
+        # catalog of the QDM export directory: file lookups and coverage checks without walking or reading the files.
+        self.data_catalog = None
+        if self.mode == "backtest":
+            if back_test_catalog_file_name is None and back_test_cache_directory_path is not None:
+                back_test_catalog_file_name = get_catalog_file_name(back_test_cache_directory_path,
+                                                                    back_test_directory_path)
+            self.data_catalog = DataCatalog(back_test_directory_path, back_test_catalog_file_name, self.qdm_cache)
+
+        # set exchange rates provider: offline tables for backtesting, cached online lookups for live.
+        if self.mode == "backtest":
+            self.fx_rates = FxRates(back_test_fx_rates_file_name, back_test_directory_path, qdm_cache=self.qdm_cache,
+                                   data_catalog=self.data_catalog)
+        else:
+            self.fx_rates = FxRates(allow_online=True)
+        set_fx_rates(self.fx_rates)
 
         # set DMA depending the mode.
         if self.mode == "live":
+            feed_recorder = None
+            if live_feed_recorder_directory_path is not None:
+                feed_recorder = FeedRecorder(live_feed_recorder_directory_path, time_delta_hours)
             self.dma = dwx_client(self, MT4_directory_path, sleep_delay,
-                                  max_retry_command_seconds, verbose=verbose)
+                                  max_retry_command_seconds, verbose=verbose, feed_recorder=feed_recorder)
             sleep(1)
         elif self.mode == "backtest":
             self.dma = backtesting(self.back_test_start,
@@ -107,18 +171,32 @@ class tick_processor():
                                    back_test_directory_path,
                                    back_test_balance,
                                    back_test_currency,
-                                   back_test_leverage)
+                                   back_test_leverage,
+                                   back_test_execution_commission_rate,
+                                   back_test_spread_pips,
+                                   fx_rates=self.fx_rates,
+                                   qdm_cache=self.qdm_cache,
+                                   data_catalog=self.data_catalog,
+                                   tick_margin_hours=back_test_tick_margin_hours,
+                                   tick_price_dtype=back_test_tick_price_dtype,
+                                   recorded_ticks_directory_path=back_test_recorded_ticks_directory_path,
+                                   headless=back_test_headless,
+                                   output_directory_path=output_directory_path,
+                                   post_processing_tasks=back_test_post_processing_tasks,
+                                   async_post_processing=back_test_async_post_processing)
 
         # set Risk Management Module.
         self.risk_management = RiskManagement(self.dma, self.balance_initial_amount, self.balance_currency, self.max_risk_perc, self.max_drawdown_perc)
 
         logger.info(f"Account info: {self.dma.account_info}")
         self.init_strategies()
+        self.init_bar_buffers()
         self.request_suscriptions()
         # For backtesting - Load historic data
         if self.mode == 'backtest':
             self.dma.load_historic_bars(self.required_historic_bars)
             self.dma.output_filename = self.output_filename
+            self.dma.trade_ledger_writer = self.trade_ledger_writer
         self.dma.start()
         logger.info("Smart Trader has finished!")
 
@@ -128,47 +206,86 @@ class tick_processor():
             result = DivergentT1(self, **strategy_params)
         return result
 
+    # Each strategy entry of the configuration holds the parameters of one instance, or a list of them to run several
+    # instances of the same strategy (e.g. one per symbol).
     def init_strategies(self):
         main_strategy_symbol_tfs = []
         symbol_specs = {}
-        for strategy_name, strategy_params in self.strategies_info.items():
-            # Add pip_value to the symbol_spec
-            strategy_params['symbol_spec']['pip_value'] = get_pip_value(strategy_params['symbol_spec']['digits'])
-
-            # Create strategy instance
-            instance = self.get_strategy_instance(strategy_name, strategy_params)
-            self.strategies_instances[instance.id] = {'instance': instance, 'params': strategy_params}
-
-            # Add to subscriptions
-            symbol_tf_tick = f"{strategy_params['symbol']}_TICK"
-            self.add_strategy_required_suscription(symbol_tf_tick, instance.id)
-            symbol_tf = f"{strategy_params['symbol']}_{strategy_params['timeframe']}"
-            self.add_strategy_required_suscription(symbol_tf, instance.id)
-            signal_symbol_tf = f"{strategy_params['symbol']}_{strategy_params['signal_timeframe']}"
-            if signal_symbol_tf != symbol_tf_tick:
-                self.add_strategy_required_suscription(signal_symbol_tf, instance.id)
-            main_strategy_symbol_tfs.append(symbol_tf)
-
-            # Add to required historic data
-            strategy_required_hist_data = instance.required_data
-            for hist_symbol_tf, hist_bars in strategy_required_hist_data.items():
-                if hist_symbol_tf in self.required_historic_bars:
-                    self.required_historic_bars[hist_symbol_tf] = self.required_historic_bars[hist_symbol_tf][
-                        'strategies'].append(instance.id)
-                    if self.required_historic_bars[hist_symbol_tf]['max_bars'] < hist_bars:
-                        self.required_historic_bars[hist_symbol_tf]['max_bars'] = hist_bars
-                else:
-                    self.required_historic_bars[hist_symbol_tf] = {'max_bars': hist_bars,
-                                                                   'strategies': {instance.id: hist_bars}}
-            symbol_specs[strategy_params['symbol']] = strategy_params['symbol_spec']
-
+        for strategy_name, strategies_params in self.strategies_info.items():
+            if isinstance(strategies_params, dict):
+                strategies_params = [strategies_params]
+            for strategy_params in strategies_params:
+                # Add pip_value to the symbol_spec
+                strategy_params['symbol_spec']['pip_value'] = get_pip_value(strategy_params['symbol_spec']['digits'])
+
+                # Create strategy instance
+                instance = self.get_strategy_instance(strategy_name, strategy_params)
+                if instance.id in self.strategies_instances:
+                    logger.error(f"init_strategies() -> duplicated strategy instance: {instance.id}")
+                    raise Exception(f"Duplicated strategy instance: {instance.id}")
+                self.strategies_instances[instance.id] = {'instance': instance, 'params': strategy_params}
+                self.strategies_by_symbol.setdefault(strategy_params['symbol'], []).append(instance)
+
+                # Add to subscriptions
+                symbol_tf_tick = f"{strategy_params['symbol']}_TICK"
+                self.add_strategy_required_suscription(symbol_tf_tick, instance.id)
+                symbol_tf = f"{strategy_params['symbol']}_{strategy_params['timeframe']}"
+                self.add_strategy_required_suscription(symbol_tf, instance.id)
+                signal_symbol_tf = f"{strategy_params['symbol']}_{strategy_params['signal_timeframe']}"
+                if signal_symbol_tf != symbol_tf_tick:
+                    self.add_strategy_required_suscription(signal_symbol_tf, instance.id)
+                if symbol_tf not in main_strategy_symbol_tfs:
+                    if self.mode == "backtest" and any(main_symbol_tf.split('_')[0] == strategy_params['symbol']
+                                                       for main_symbol_tf in main_strategy_symbol_tfs):
+                        # The backtesting main loop replays a single main timeframe per symbol.
+                        logger.error(f"init_strategies() -> {instance.id}: backtesting supports only one main timeframe per symbol")
+                        raise Exception(f"Backtesting supports only one main timeframe per symbol: {symbol_tf}")
+                    main_strategy_symbol_tfs.append(symbol_tf)
+
+                # Add to required historic data
+                strategy_required_hist_data = instance.required_data
+                for hist_symbol_tf, hist_bars in strategy_required_hist_data.items():
+                    if hist_symbol_tf in self.required_historic_bars:
+                        self.required_historic_bars[hist_symbol_tf]['strategies'][instance.id] = hist_bars
+                        if self.required_historic_bars[hist_symbol_tf]['max_bars'] < hist_bars:
+                            self.required_historic_bars[hist_symbol_tf]['max_bars'] = hist_bars
+                    else:
+                        self.required_historic_bars[hist_symbol_tf] = {'max_bars': hist_bars,
+                                                                       'strategies': {instance.id: hist_bars}}
+                        self.historic_symbol_tfs_by_symbol.setdefault(strategy_params['symbol'], []).append(
+                            hist_symbol_tf)
+                symbol_specs[strategy_params['symbol']] = strategy_params['symbol_spec']
+
+        self.init_bar_routing()
         self.dma.symbol_specs = symbol_specs
         if self.mode == "backtest":
             self.dma.main_symbol_tfs = main_strategy_symbol_tfs
 
+    # The strategies of the symbol informed with a symbol_tf (subscribed or required historic one) check their signal
+    # when it is their signal timeframe, and calculate their trend otherwise.
+    def init_bar_routing(self):
+        symbol_tfs = dict.fromkeys(list(self.required_suscriptions.keys()) + list(self.required_historic_bars.keys()))
+        for symbol_tf in symbol_tfs:
+            symbol, timeframe = symbol_tf.split('_')
+            if timeframe == 'TICK':
+                continue
+            for instance in self.strategies_by_symbol.get(symbol, []):
+                if instance.signal_timeframe == timeframe:
+                    self.strategies_by_signal_symbol_tf.setdefault(symbol_tf, []).append(instance)
+                else:
+                    self.strategies_by_trend_symbol_tf.setdefault(symbol_tf, []).append(instance)
+
+    def init_bar_buffers(self):
+        # The seed requests ask for max_bars, convert_periods_to_datetime_range() adds its own margin of periods: the
+        # capacity is the bars of that span (both ends included), the margin being headroom of the buffer only.
+        for symbol_tf, required_bars in self.required_historic_bars.items():
+            symbol, timeframe = symbol_tf.split('_')
+            self.bar_buffers[symbol_tf] = BarRingBuffer(timeframe, required_bars['max_bars'] + HISTORIC_BARS_MARGIN + 1)
+
     def add_strategy_required_suscription(self, symbol_tf, strategy_id):
         if symbol_tf in self.required_suscriptions:
-            self.required_suscriptions[symbol_tf] = self.required_suscriptions[symbol_tf].append(strategy_id)
+            if strategy_id not in self.required_suscriptions[symbol_tf]:
+                self.required_suscriptions[symbol_tf].append(strategy_id)
         else:
             self.required_suscriptions[symbol_tf] = [strategy_id]
 
@@ -181,6 +298,11 @@ class tick_processor():
                 symbols_tick.append(symbol)
             else:
                 symbols_bar.append([symbol, timeframe])
+        # Bar data of every required historic timeframe keeps the bar buffers updated.
+        for symbol_tf in self.required_historic_bars.keys():
+            symbol, timeframe = symbol_tf.split('_')
+            if symbol_tf not in self.required_suscriptions:
+                symbols_bar.append([symbol, timeframe])
         # subscribe to tick data:
         self.dma.subscribe_symbols(symbols_tick)
         # subscribe to bar data:
@@ -196,8 +318,7 @@ class tick_processor():
         end_datetime = end_datetime + timedelta(hours=delta_fix)
         # logger.debug(f'get_historic_bars() -> {symbol} {timeframe} {periods}')
         # logger.debug(f"call -> get_historic_data({symbol}, {timeframe}, {start_datetime}, {end_datetime})")
-        symbol_tf = f"{symbol}_{timeframe}"
-        self.dma.get_historic_data(symbol, timeframe, start_datetime.timestamp(), end_datetime.timestamp())
+        return self.dma.get_historic_data(symbol, timeframe, start_datetime.timestamp(), end_datetime.timestamp())
 
     def get_current_datetime(self):
         result = None
@@ -230,11 +351,9 @@ class tick_processor():
 
     def on_tick(self, symbol, bid, ask):
         now = datetime.utcnow()
-        keys = [key for key, value in self.strategies_instances.items() if
-                value['params']['symbol'] == symbol]
-        for strategy_key in keys:
-            self.strategies_instances[strategy_key]['instance'].manage_orders()
-            self.strategies_instances[strategy_key]['instance'].check_signal()
+        for instance in self.strategies_by_symbol.get(symbol, []):
+            instance.manage_orders()
+            instance.check_signal()
 
         # to test trading. 
         # this will randomly try to open and close orders every few seconds. 
@@ -271,9 +390,15 @@ class tick_processor():
         # logger.debug(f'bar_data: {self.dma.bar_data}')
         # logger.debug(f'market_data: {self.dma.market_data}')
 
-        # Manage trailing stop loss orders
-        self.process_trailing_stop_loss()
-        self.request_historic_data(symbol, time_frame)
+        symbol_tf = f'{symbol}_{time_frame}'
+        if symbol_tf in self.bar_buffers:
+            self.bar_buffers[symbol_tf].add_bar(time, open_price, high, low, close_price, tick_volume,
+                                                self.get_current_datetime())
+        # Bar data subscribed only to update the bar buffers does not trigger the strategies.
+        if symbol_tf in self.required_suscriptions:
+            # Manage trailing stop loss orders
+            self.process_trailing_stop_loss()
+            self.request_historic_data(symbol, time_frame)
 
         # if self.minute_counter == 1:
         #     self.dma.open_order(symbol='EURUSD', order_type='buylimit', lots=0.2, price=1.11270)
@@ -294,46 +419,101 @@ class tick_processor():
         #                         price=1.108933, lots=0.4)
         #     self.stop_trading = True
 
+    # Historic data comes from the bar buffers; only the ones not seeded yet or with missing bars are requested to the
+    # DMA, and the strategies are informed once all of them are received.
     def request_historic_data(self, symbol, time_frame):
-        self.historic_request_last_timestamp[symbol] = self.get_current_datetime().timestamp()
-        keys_symbol_tf = [key for key, value in self.required_historic_bars.items() if key.startswith(symbol)]
-        for key_symbol_tf in keys_symbol_tf:
-            key_symbol, key_tf = key_symbol_tf.split('_')
-            bars = self.required_historic_bars[key_symbol_tf]['max_bars']
-            self.get_historic_bars(key_symbol, key_tf, bars)
+        current_datetime = self.get_current_datetime()
+        self.historic_request_last_timestamp[symbol] = current_datetime.timestamp()
+        outdated_symbol_tfs = []
+        for key_symbol_tf in self.historic_symbol_tfs_by_symbol.get(symbol, []):
+            bar_buffer = self.bar_buffers[key_symbol_tf]
+            if bar_buffer.update(current_datetime):
+                # Same time span get_historic_bars() requests, around weekends and gaps it holds fewer bars than the
+                # buffer.
+                start_datetime, end_datetime = convert_periods_to_datetime_range(
+                    self.required_historic_bars[key_symbol_tf]['max_bars'], bar_buffer.timeframe, current_datetime)
+                self.historic_data[key_symbol_tf] = {'timestamp': self.historic_request_last_timestamp[symbol],
+                                                     'data': bar_buffer.get_window(start_datetime)}
+            else:
+                outdated_symbol_tfs.append(key_symbol_tf)
+        if len(outdated_symbol_tfs) == 0:
+            self.send_historic_data_to_strategies(symbol, self.get_historic_dispatch_tf(symbol))
+        elif self.mode == 'live':
+            # Requests are sent concurrently (a pending one is reused) and the strategies are informed once all the
+            # futures are resolved.
+            futures = []
+            for key_symbol_tf in outdated_symbol_tfs:
+                future = self.historic_data_futures.get(key_symbol_tf)
+                if future is None or future.done():
+                    key_symbol, key_tf = key_symbol_tf.split('_')
+                    future = self.get_historic_bars(key_symbol, key_tf,
+                                                    self.required_historic_bars[key_symbol_tf]['max_bars'])
+                    self.historic_data_futures[key_symbol_tf] = future
+                futures.append(future)
+            request_timestamp = self.historic_request_last_timestamp[symbol]
+            when_all_done(futures, lambda done_futures: self.on_historic_requests_done(symbol, time_frame,
+                                                                                       request_timestamp,
+                                                                                       done_futures))
+        else:
+            # Backtesting answers synchronously through on_historic_data().
+            for key_symbol_tf in outdated_symbol_tfs:
+                key_symbol, key_tf = key_symbol_tf.split('_')
+                self.get_historic_bars(key_symbol, key_tf, self.required_historic_bars[key_symbol_tf]['max_bars'])
+
+    # Live mode: all the historic requests of a bar data event were answered (or failed).
+    def on_historic_requests_done(self, symbol, time_frame, request_timestamp, futures):
+        failed = False
+        for future in futures:
+            if future.exception() is not None:
+                failed = True
+                logger.error(f'Historic data request failed for {future.symbol}_{future.time_frame}: {future.exception()}')
+            else:
+                logger.debug(f'Historic data {future.symbol}_{future.time_frame} received in {future.latency:.3f}s')
+        # A newer request of the symbol informs the strategies itself.
+        if not failed and request_timestamp == self.historic_request_last_timestamp.get(symbol):
+            self.send_historic_data_to_strategies(symbol, self.get_historic_dispatch_tf(symbol))
+
+    # Timeframe the strategies are informed with. The historic requests were answered in order and the last reply
+    # informed the strategies with its timeframe, so it is the last required historic timeframe of the symbol.
+    # TODO: for DivergentT1 that is the signal timeframe, so every bar data event checks the signal and calculate_trend
+    #  never runs. Informing with the timeframe of the bar that triggered the request fixes it, but changes the
+    #  backtest results (0 to 18 trades on EURUSD 2024-01-15 to 2024-02-15) and has to go in its own change.
+    def get_historic_dispatch_tf(self, symbol):
+        return self.historic_symbol_tfs_by_symbol[symbol][-1].split('_')[1]
 
     def send_historic_data_to_strategies(self, symbol, time_frame):
         call_origin_tf = f'{symbol}_{time_frame}'
-        updated_symbol_tfs = [key for key, value in self.historic_data.items() if
-                              key.startswith(symbol) and value['timestamp'] == self.historic_request_last_timestamp[
-                                  symbol]]
-        #all_symbol_tfs = [key for key, value in self.historic_data.items() if key.startswith(symbol)]
-        all_symbol_tfs = [key for key, value in self.required_historic_bars.items() if key.startswith(symbol)]
-        if len(updated_symbol_tfs) == len(all_symbol_tfs):  # all historic requests for the symbol were completed.
-            historic_data_to_send = dict(filter(lambda item: item[0] in all_symbol_tfs, self.historic_data.items()))
-            keys = [key for key, value in self.strategies_instances.items() if
-                    value['params']['symbol'] == symbol]
-            for strategy_key in keys:
-                signal_tf = f'{symbol}_{self.strategies_instances[strategy_key]["params"]["signal_timeframe"]}'
-                if signal_tf == call_origin_tf:
-                    self.strategies_instances[strategy_key]['instance'].check_signal_from_historic_bar(historic_data_to_send)
-                else:
-                    self.strategies_instances[strategy_key]['instance'].calculate_trend(historic_data_to_send)
+        request_timestamp = self.historic_request_last_timestamp[symbol]
+        all_symbol_tfs = self.historic_symbol_tfs_by_symbol.get(symbol, [])
+        # all historic requests for the symbol were completed.
+        if all(self.historic_data.get(key, {}).get('timestamp') == request_timestamp for key in all_symbol_tfs):
+            historic_data_to_send = {key: self.historic_data[key] for key in all_symbol_tfs}
+            for instance in self.strategies_by_signal_symbol_tf.get(call_origin_tf, []):
+                instance.check_signal_from_historic_bar(historic_data_to_send)
+            for instance in self.strategies_by_trend_symbol_tf.get(call_origin_tf, []):
+                instance.calculate_trend(historic_data_to_send)
 
     def on_historic_data(self, symbol, time_frame, data):
         symbol_tf = f"{symbol}_{time_frame}"
         # Cut bars to only required ones. DISABLED BECAUSE EMA_240 ISSUE!!!
         # data = get_lasts_from_dictionary(data, self.required_historic_bars[symbol_tf]['max_bars'])
+        # Strategies always receive a HistoricWindow (live mode delivers the legacy dictionary).
+        if data is not None:
+            data = to_historic_window(data)
+            # Seed the bar buffer, later bars come from the bar data events.
+            if symbol_tf in self.bar_buffers:
+                self.bar_buffers[symbol_tf].seed(data)
+                data = self.bar_buffers[symbol_tf].get_window()
         # Store data.
         self.historic_data[f'{symbol}_{time_frame}'] = {'timestamp': self.historic_request_last_timestamp[symbol],
                                                         'data': data}
 
         if data is None or len(data) == 0:
             logger.error(f'No historic data received for symbol: {symbol}, time_frame: {time_frame}')
-        else:
+        elif self.mode != 'live':  # live mode informs the strategies from on_historic_requests_done().
             #logger.debug(
             #    f'on_historic_data() => {symbol}, {time_frame}, {len(data)} bars, last bar datetime -> {list(data.keys())[-1]}, current datetime -> {self.get_current_datetime()}')
-            self.send_historic_data_to_strategies(symbol, time_frame)
+            self.send_historic_data_to_strategies(symbol, self.get_historic_dispatch_tf(symbol))
 
         # # Example about how to call an indicator.
         # close_prices = convert_historic_bars_element_to_array('close', data)
@@ -346,23 +526,23 @@ class tick_processor():
 
     def on_historic_trades(self):
         logger.debug(f'historic_trades: {len(self.dma.historic_trades)}')
-        logger.debug(self.dma.historic_trades)
-        self.inform_historic_trades()
 
-    def inform_historic_trades(self):
-        max_len = len(self.dma.historic_trades)
-        while self.output_next_trade_index < max_len:
-            add_trade_to_file(self.output_filename, self.dma.historic_trades[self.output_next_trade_index][1])
-            self.output_next_trade_index = self.output_next_trade_index + 1
+    # Called once per closed or canceled trade. Live trades come in the DWX format, with the times as strings.
+    def on_trade_closed(self, ticket_no, trade_data):
+        if self.mode == 'live':
+            trade_data = dict(trade_data, ticket_no=ticket_no, status=OrderStatus.CLOSED,
+                              open_time=datetime.strptime(trade_data['open_time'], DWX_TRADE_DATETIME_FORMAT),
+                              close_time=datetime.strptime(trade_data['close_time'], DWX_TRADE_DATETIME_FORMAT))
+        self.trade_ledger_writer.add(trade_data)
 
     def on_message(self, message):
         if message['type'] == 'ERROR':
             logger.debug(f"{message['type']}|{message['error_type']}|{message['description']}")
         elif message['type'] == 'INFO':
             logger.debug(f"{message['type']}|{message['message']}")
-            # Log closed or canceled order.
-            if 'closed' in message['message']:
-                self.dma.get_historic_trades(100000)
+            # Closed trades are delivered by on_trade_closed(): in live mode once received with the historic trades.
+            if 'closed' in message['message'] and self.mode == 'live':
+                self.dma.get_historic_trades(HISTORIC_TRADES_LOOKBACK_DAYS)
 
     # triggers when an order is added or removed, not when only modified.
     def on_order_event(self):
@@ -433,22 +613,23 @@ class smart_trader():
     SMART TRADER - MAIN
     =====================================================================================================
 """
-setup_logging()
-logger.info('STARTED')
-
-# # FXOpen Demo Account
-# config_file_path = "smart_trader_fxopen_demo.config"
-# sleep_seconds = 1
-
-# Backtesting
-config_file_path = "smart_trader_backtesting.config"
-sleep_seconds = 0
-
-# Read the configuration file and parse its contents into a dictionary
-with open(config_file_path, "r") as file:
-    config_data = json.load(file)
-parameters = config_data['tick_processor_params']
-processor = tick_processor(**parameters)
-
-while processor.dma.ACTIVE:
-    sleep(sleep_seconds)
+if __name__ == '__main__':
+    setup_logging()
+    logger.info('STARTED')
+
+    # # FXOpen Demo Account
+    # config_file_path = "smart_trader_fxopen_demo.config"
+    # sleep_seconds = 1
+
+    # Backtesting
+    config_file_path = "smart_trader_backtesting.config"
+    sleep_seconds = 0
+
+    # Read the configuration file and parse its contents into a dictionary
+    with open(config_file_path, "r") as file:
+        config_data = json.load(file)
+    parameters = config_data['tick_processor_params']
+    processor = tick_processor(**parameters)
+
+    while processor.dma.ACTIVE:
+        sleep(sleep_seconds)
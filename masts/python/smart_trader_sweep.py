@@ -0,0 +1,145 @@
+import sys
+import copy
+import json
+import itertools
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from python.common.logging_config import setup_logging, logger
+from python.common.metrics import METRICS, get_metrics, rank_runs
+from backtesting.backtesting import OrderStatus
+
+"""
+Parameter sweep runner for backtests.
+
+Takes the tick_processor_params of a base config and a parameter grid, and runs every combination as an independent
+tick_processor/backtesting instance in a process pool. The metrics of every run are collected into a single results
+table (csv): the closed trades of all the runs are evaluated together by python.common.metrics (one vectorized call,
+see get_metrics()) and the runs are ranked by rank_by (rank 1 is the best). Failed runs and runs without closed trades
+are not ranked (empty rank) and are listed in the log.
+
+Grid keys are dotted paths into tick_processor_params (e.g. "strategies.DivergentT1.max_risk_perc_trade"); numeric keys index lists, as the instances of a strategy configured
+as a list (e.g. "strategies.DivergentT1.0.max_risk_perc_trade").
+Several keys separated by commas are swept together, each value being the list of their values
+(e.g. "back_test_start,back_test_end": [["2024-01-01 00:00:00", "2024-02-01 00:00:00"], ...]).
+"""
+
+
+def set_parameter(parameters, path, value):
+    keys = [int(key) if key.isdigit() else key for key in path.split('.')]
+    target = parameters
+    for key in keys[:-1]:
+        target = target[key]
+    target[keys[-1]] = value
+
+
+def expand_parameter_grid(base_parameters, parameter_grid):
+    grid_keys = list(parameter_grid.keys())
+    runs = []
+    for values in itertools.product(*[parameter_grid[key] for key in grid_keys]):
+        parameters = copy.deepcopy(base_parameters)
+        overrides = {}
+        for grid_key, value in zip(grid_keys, values):
+            paths = grid_key.split(',')
+            path_values = [value] if len(paths) == 1 else value
+            for path, path_value in zip(paths, path_values):
+                set_parameter(parameters, path.strip(), path_value)
+                overrides[path.strip()] = path_value
+        runs.append((parameters, overrides))
+    return runs
+
+
+# Balances of the run and its closed trades ({'close_time': [...], 'pnl': [...]}), evaluated by run_sweep().
+def get_run_metrics(processor):
+    dma = processor.dma
+    closed_trades = [trade_data for trade_data in dma.dict_trades.values() if
+                     trade_data.get('status') == OrderStatus.CLOSED]
+    # The account balance the backtest started with (balance_initial_amount is a risk management parameter).
+    initial_balance = dma.initial_balance
+    final_balance = dma.account_info['balance']
+    return {'initial_balance': initial_balance,
+            'final_balance': final_balance}, \
+        {'close_time': [trade_data['close_time'] for trade_data in closed_trades],
+         'pnl': [trade_data['pnl'] for trade_data in closed_trades]}
+
+
+def run_backtest(run_id, parameters, output_directory_path):
+    from smart_trader import tick_processor
+    setup_logging()
+    parameters = copy.deepcopy(parameters)
+    parameters['output_filename'] = f'{output_directory_path}/trades_{run_id}_backtest.txt'
+    parameters['output_directory_path'] = output_directory_path
+    # Sweep runs are unattended: charts are saved as files and never opened.
+    parameters['back_test_headless'] = True
+    logger.info(f"run_backtest({run_id}) -> {parameters}")
+    processor = tick_processor(**parameters)
+    processor.dma.wait_post_processing()
+    return get_run_metrics(processor)
+
+
+# Metrics (python.common.metrics METRICS) of every run and its rank by rank_by, added to df_results.
+def add_run_metrics(df_results, run_trades, rank_by='sharpe'):
+    df_trades = pd.concat([pd.DataFrame({'run_id': run_id, **trades}) for run_id, trades in run_trades.items()],
+                          ignore_index=True) if run_trades else pd.DataFrame(columns=['run_id', 'close_time', 'pnl'])
+    investments = df_results.set_index('run_id')['initial_balance'] if 'initial_balance' in df_results \
+        else pd.Series(dtype='float64')
+    metrics = get_metrics(df_trades, investments, run_column='run_id').reindex(df_results['run_id'])
+    # Runs without closed trades: no metrics, only the trade counts.
+    metrics[['trades', 'winning_trades']] = metrics[['trades', 'winning_trades']].fillna(0).astype('int64')
+    # Failed runs and runs without trades are not ranked, they are reported apart.
+    failed = df_results['error'].notna().to_numpy() if 'error' in df_results else False
+    ranked = ~failed & (metrics['trades'] > 0).to_numpy()
+    metrics['rank'] = rank_runs(metrics[ranked], rank_by).reindex(metrics.index)
+    if not ranked.all():
+        unranked = [f"{run_id} ({'failed' if run_failed else 'no trades'})" for run_id, run_failed, run_ranked in
+                    zip(df_results['run_id'], np.broadcast_to(failed, len(ranked)), ranked) if not run_ranked]
+        logger.info(f"add_run_metrics() -> runs not ranked: {', '.join(unranked)}")
+    return pd.concat([df_results.reset_index(drop=True), metrics.reset_index(drop=True)], axis=1)
+
+
+def run_sweep(base_parameters, parameter_grid, max_workers=None, output_directory_path='../output', rank_by='sharpe'):
+    if rank_by not in METRICS:
+        logger.error(f"run_sweep() -> unknown rank_by metric: {rank_by}")
+        raise Exception(f"Unknown rank_by metric: {rank_by}, valid ones: {METRICS}")
+    sweep_name = f'sweep_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+    runs = expand_parameter_grid(base_parameters, parameter_grid)
+    logger.info(f"run_sweep() -> {len(runs)} runs, max_workers = {max_workers}")
+    results = []
+    run_trades = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for run_no, (parameters, overrides) in enumerate(runs):
+            run_id = f'{sweep_name}_{run_no}'
+            futures[executor.submit(run_backtest, run_id, parameters, output_directory_path)] = (run_id, overrides)
+        for future in as_completed(futures):
+            run_id, overrides = futures[future]
+            result = {'run_id': run_id, **overrides}
+            try:
+                run_result, trades = future.result()
+                result.update(run_result)
+                run_trades[run_id] = trades
+                result['error'] = None
+            except Exception as e:
+                logger.error(f"run_sweep() -> run {run_id} failed: {e}")
+                result['error'] = str(e)
+            results.append(result)
+    df_results = pd.DataFrame(results).sort_values('run_id').reset_index(drop=True)
+    df_results = add_run_metrics(df_results, run_trades, rank_by)
+    results_file_name = f'{output_directory_path}/{sweep_name}_results.csv'
+    df_results.to_csv(results_file_name, index=False)
+    logger.info(f"run_sweep() -> results saved to {results_file_name}")
+    return df_results
+
+
+if __name__ == '__main__':
+    setup_logging()
+    sweep_config_file_path = sys.argv[1] if len(sys.argv) > 1 else "smart_trader_sweep.config"
+    with open(sweep_config_file_path, "r") as file:
+        sweep_config = json.load(file)
+    with open(sweep_config['base_config_file_path'], "r") as file:
+        base_config = json.load(file)
+    df = run_sweep(base_config['tick_processor_params'], sweep_config['parameter_grid'],
+                   sweep_config.get('max_workers'), sweep_config.get('output_directory_path', '../output'),
+                   sweep_config.get('rank_by', 'sharpe'))
+    logger.info(f"Sweep results:\n{df.to_string()}")
@@ -1,8 +1,6 @@
-import talib
 from python.common.logging_config import logger
 from python.strategies.istrategy import IStrategy, SignalType, MarketTrend, MarketEnergy
-from python.indicators.choppiness_index import choppiness_index
-from python.common.conversions import convert_historic_bars_to_dataframe
+from python.indicators.streaming import WindowEma, Choppiness, get_new_bars_start
 from python.api.dwx_client import dwx_client
 from python.backtesting.backtesting import backtesting
 from python.common.graphics import graph_trend_from_backtesting
@@ -10,17 +8,20 @@ from datetime import datetime
 from python.common.calculus import get_pip_value
 from python.common.risk_management import RiskManagement
 import math
-import numpy as np
 
 class DivergentT1(IStrategy):
     _market_trend = MarketTrend.UNDEFINED
     _box_high_limit = 0.0
     _box_low_limit = 0.0
+    _trend_ema_period = 50
+    _trend_ema_slope_periods = 10
+    _choppiness_period = 14
 
     def __init__(self, smart_trader, magic_no, symbol, timeframe, high_timeframe1, high_timeframe2, signal_timeframe, max_risk_perc_trade, max_consecutive_losses, symbol_spec=None):
         super().__init__(smart_trader, magic_no, symbol, timeframe, high_timeframe1, high_timeframe2, signal_timeframe, max_risk_perc_trade, max_consecutive_losses, symbol_spec)  # Call the constructor of the base class
         self._set_required_bars()
         self.historic_data = {}
+        self._trend_indicators = {}  # {symbol_tf: streaming indicators of the trend timeframes}
         logger.info(f"DivergentT1({symbol}, {timeframe}, {max_risk_perc_trade}, {max_consecutive_losses})")
 
     def _set_required_bars(self):
@@ -47,12 +48,9 @@ class DivergentT1(IStrategy):
 
     def _get_box_higher_lower(self, time_frame, periods):
         symbol_tf = f"{self.symbol}_{time_frame}"
-        data = self.historic_data[symbol_tf]['data'].copy()
-        keys = list(data.keys())[-periods:]
-        data = {key: data[key] for key in keys}
-        df = convert_historic_bars_to_dataframe(data)
-        highest_price = df['high'].max()
-        lowest_price = df['low'].min()
+        window = self.historic_data[symbol_tf]['data'].tail(periods)
+        highest_price = window.high.max()
+        lowest_price = window.low.min()
         return highest_price, lowest_price
 
     def _get_trend_from_timeframe(self, time_frame, energy_minim=None):
@@ -65,23 +63,43 @@ class DivergentT1(IStrategy):
                 result = trend_ema
         return result
 
+    # Streaming EMA and choppiness of a trend timeframe. Windows overlap from one call to the next, so only the bars
+    # after the last one already fed are processed; indicators restart from the whole window when it does not
+    # continue the previous one (first call or historic data seeded again after a gap). The values are the ones of
+    # talib.EMA and choppiness_index.calculate() over the window.
+    def _update_trend_indicators(self, time_frame):
+        symbol_tf = f"{self.symbol}_{time_frame}"
+        window = self.historic_data[symbol_tf]['data']
+        indicators = self._trend_indicators.get(symbol_tf)
+        start = get_new_bars_start(window.time, indicators['last_time']) if indicators is not None else None
+        if start is None:
+            indicators = {'last_time': None, 'ema': WindowEma(self._trend_ema_period),
+                          'choppiness': Choppiness(self._choppiness_period)}
+            self._trend_indicators[symbol_tf] = indicators
+            start = 0
+        for i in range(start, len(window)):
+            indicators['ema'].update(int(window.time[i]), window.close[i])
+            indicators['choppiness'].update(window.high[i], window.low[i], window.close[i])
+        if len(window) > 0:
+            indicators['last_time'] = int(window.time[-1])
+        if not indicators['ema'].covers(window.time):
+            # The window holds bars older than the ones fed: start again from the whole window.
+            indicators['last_time'] = None
+            self._trend_indicators.pop(symbol_tf)
+            return self._update_trend_indicators(time_frame)
+        indicators['ema_values'] = indicators['ema'].get_window_values(window.close, self._trend_ema_slope_periods)
+        return indicators
+
     def _get_trend_ema(self, time_frame):
-        periods = 10
-        timeperiod = 50
+        periods = self._trend_ema_slope_periods
         min_slope = 2.0
         result = MarketTrend.UNDEFINED
-        symbol_tf = f"{self.symbol}_{time_frame}"
-        data = self.historic_data[symbol_tf]['data'].copy()
-        df = convert_historic_bars_to_dataframe(data)
-        close_prices = df['close']
-        ema_values = talib.EMA(close_prices, timeperiod=timeperiod)
+        ema_values = self._update_trend_indicators(time_frame)['ema_values']
 
-        # Get the last 3 values of each EMA series
-        ema_values = ema_values[-periods:]
         last_candle = periods-1
         oldest_candle = 0
         # Check if EMA_values has a positive slope.
-        logger.debug(f'time_frame = {time_frame}, ema_50_last_value = {ema_values[last_candle]}, ema_50_oldest_value = {ema_values[oldest_candle]}, periods = {periods}')
+        logger.debug(f'time_frame = {time_frame}, ema_{self._trend_ema_period}_last_value = {ema_values[last_candle]}, ema_{self._trend_ema_period}_oldest_value = {ema_values[oldest_candle]}, periods = {periods}')
         delta_y = (ema_values[last_candle] - ema_values[oldest_candle]) / self.symbol_spec['pip_value']
         delta_x = periods
         slope = delta_y / delta_x
@@ -96,17 +114,8 @@ class DivergentT1(IStrategy):
         return result
 
     def _get_energy_choppiness_index(self, time_frame):
-        timeperiod = 14
-        periods = 5
         result = MarketEnergy.NOT_SIGNIFICANT
-        symbol_tf = f"{self.symbol}_{time_frame}"
-        data = self.historic_data[symbol_tf]['data'].copy()
-        df = convert_historic_bars_to_dataframe(data)
-        close_prices = df['close']
-        chopp_values = choppiness_index.calculate(df['high'], df['low'], df['close'], timeperiod)
-        chopp_values = chopp_values[-periods:]
-        last_candle = periods-1
-        last_value = chopp_values[last_candle]
+        last_value = self._update_trend_indicators(time_frame)['choppiness'].value
         logger.debug(f'time_frame = {time_frame}, choppiness index last value = {last_value}')
 
         # Determine energy.
@@ -203,10 +212,9 @@ class DivergentT1(IStrategy):
             self._box_high_limit, self._box_low_limit = self._get_box_higher_lower("M15", box_periods)
 
     def check_signal_from_historic_bar(self, historic_data):
-        data = historic_data[f'{self.symbol}_{self.signal_timeframe}']['data'].copy()
-        df = convert_historic_bars_to_dataframe(data)
-        ask = df['high'][-1]
-        bid = df['low'][-1]
+        window = historic_data[f'{self.symbol}_{self.signal_timeframe}']['data']
+        ask = window.high[-1]
+        bid = window.low[-1]
         self.check_signal(ask,bid)
 
     def check_signal(self, ask = None, bid = None):